@@ -0,0 +1,472 @@
+"""
+Offline handler benchmarks
+Микробенчмарки горячих путей бота без токена и сети
+
+Обработчики bot.py вызываются напрямую с настоящими объектами Update,
+разобранными из JSON, но вместо Bot API используется FakeBot, который
+только считает вызовы. Для каждого размера синтетического каталога
+воспроизводится детерминированный поток кликов нескольких пользователей
+(start -> категория -> подкатегория -> отметки -> готово) и измеряются:
+
+    * задержка каждого обработчика (p50/p90/p99/max, мкс);
+    * выделения памяти на действие (tracemalloc, отдельный прогон);
+    * количество обращений к Telegram API на действие пользователя.
+
+Использование:
+
+    python bench.py                               # 120, 1k, 10k, 50k
+    python bench.py --sizes 120 2000 --actions 500
+    python bench.py --save bench_baseline.json
+    python bench.py --compare bench_baseline.json --tolerance 0.25
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+# bot.py требует токен при импорте; сеть при этом не используется
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "0:offline-benchmark")
+
+from telegram import Update  # noqa: E402
+
+import bot  # noqa: E402
+from broadcast import Broadcaster, RateLimiter  # noqa: E402
+from callbacks import (  # noqa: E402
+    OP_BACK,
+    OP_CATEGORY,
+    OP_DONE,
+    OP_PAGE,
+    OP_SCREEN,
+    OP_TOGGLE,
+    encode
+)
+from catalog import CatalogSource, CompiledCatalog, compile_catalog  # noqa: E402
+from coalescer import EditCoalescer  # noqa: E402
+from households import Household, HouseholdRegistry  # noqa: E402
+from storage import SQLiteSelectionStore, open_store  # noqa: E402
+
+DEFAULT_SIZES = [120, 1_000, 10_000, 50_000]
+DEFAULT_ACTIONS = 300
+DEFAULT_USERS = 4
+DEFAULT_SEED = 2601
+
+# Первый синтетический пользователь (все они - одно домохозяйство)
+BASE_USER_ID = 900_000_000
+
+
+# ============================================================================
+# FAKE TELEGRAM OBJECTS / ПОДДЕЛЬНЫЕ ОБЪЕКТЫ TELEGRAM
+# ============================================================================
+
+class FakeMessage:
+    """Ответ FakeBot на send_message"""
+
+    __slots__ = ("message_id", "chat_id")
+
+    def __init__(self, message_id: int, chat_id: int) -> None:
+        self.message_id = message_id
+        self.chat_id = chat_id
+
+
+class FakeBot:
+    """Заменяет Bot: ничего не отправляет, только считает вызовы API"""
+
+    defaults = None
+
+    def __init__(self) -> None:
+        self.calls: Counter = Counter()
+        self._message_id = 1000
+
+    def _message(self, chat_id: int) -> FakeMessage:
+        self._message_id += 1
+        return FakeMessage(self._message_id, chat_id)
+
+    async def answer_callback_query(self, *args, **kwargs) -> bool:
+        self.calls["answerCallbackQuery"] += 1
+        return True
+
+    async def edit_message_text(self, *args, **kwargs) -> bool:
+        self.calls["editMessageText"] += 1
+        return True
+
+    async def send_message(self, chat_id: int, *args, **kwargs) -> FakeMessage:
+        self.calls["sendMessage"] += 1
+        return self._message(chat_id)
+
+    async def delete_message(self, *args, **kwargs) -> bool:
+        self.calls["deleteMessage"] += 1
+        return True
+
+
+class FakeContext:
+    """Минимальный CallbackContext: context.bot и аргументы команды"""
+
+    __slots__ = ("bot", "args")
+
+    def __init__(self, fake_bot: FakeBot) -> None:
+        self.bot = fake_bot
+        self.args: List[str] = []
+
+
+def _user(user_id: int) -> Dict[str, Any]:
+    return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+
+
+def _chat(user_id: int) -> Dict[str, Any]:
+    return {"id": user_id, "type": "private"}
+
+
+def command_update(
+    fake_bot: FakeBot,
+    update_id: int,
+    user_id: int,
+    command: str
+) -> Update:
+    """Строит Update с командой, как его прислал бы Telegram"""
+    return Update.de_json({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": _chat(user_id),
+            "from": _user(user_id),
+            "text": command,
+            "entities": [
+                {"type": "bot_command", "offset": 0,
+                 "length": len(command.split()[0])}
+            ],
+        },
+    }, fake_bot)
+
+
+def callback_update(
+    fake_bot: FakeBot,
+    update_id: int,
+    user_id: int,
+    message_id: int,
+    data: str
+) -> Update:
+    """Строит Update с нажатием inline-кнопки"""
+    return Update.de_json({
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": _user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": message_id,
+                "date": 0,
+                "chat": _chat(user_id),
+                "from": {"id": 1, "is_bot": True, "first_name": "bot"},
+                "text": "🛍 Оберіть категорію:",
+            },
+        },
+    }, fake_bot)
+
+
+# ============================================================================
+# SYNTHETIC WORKLOAD / СИНТЕТИЧЕСКАЯ НАГРУЗКА
+# ============================================================================
+
+def synthetic_catalog(size: int, seed: int = DEFAULT_SEED) -> CatalogSource:
+    """Каталог из size продуктов той же формы, что и настоящий"""
+    rng = random.Random(seed)
+    shape: List[Tuple[str, Optional[str]]] = [
+        (screen.category, screen.subcategory) for screen in bot.CATALOG.screens
+    ]
+
+    # Продукты распределяются по экранам неравномерно, как в жизни
+    weights = [rng.uniform(0.5, 2.0) for _ in shape]
+    total = sum(weights)
+    counts = [max(1, int(size * weight / total)) for weight in weights]
+    counts[0] += size - sum(counts)
+
+    source: CatalogSource = {}
+    product_no = 0
+    for (category, subcategory), count in zip(shape, counts):
+        names = []
+        for _ in range(count):
+            product_no += 1
+            names.append(f"Продукт {product_no} ({rng.randint(1, 999)} г)")
+        if subcategory is None:
+            source[category] = names
+        else:
+            source.setdefault(category, {})[subcategory] = names
+    return source
+
+
+Action = Tuple[str, int, str]
+
+
+def click_stream(
+    catalog: CompiledCatalog,
+    users: int,
+    actions: int,
+    seed: int = DEFAULT_SEED
+) -> List[Action]:
+    """Поток действий (обработчик, пользователь, данные) для воспроизведения"""
+    rng = random.Random(seed)
+    stream: List[Action] = []
+    for user_no in range(users):
+        stream.append(("start", BASE_USER_ID + user_no, "/start"))
+
+    while len(stream) < actions:
+        user_id = BASE_USER_ID + rng.randrange(users)
+        category = rng.choice(catalog.categories)
+        stream.append((
+            "category", user_id, encode(catalog, OP_CATEGORY, category.id)
+        ))
+        screen = catalog.screen(rng.choice(category.screen_ids))
+        if category.has_subcategories:
+            stream.append((
+                "subcategory", user_id, encode(catalog, OP_SCREEN, screen.id)
+            ))
+        # На больших экранах пользователь листает до нужной страницы
+        products = range(screen.start, screen.stop)
+        pages = bot.KEYBOARDS.pages(screen)
+        if pages > 1:
+            page = rng.randrange(pages)
+            products = bot.KEYBOARDS.page_products(screen, page)
+            stream.append((
+                "page", user_id, encode(catalog, OP_PAGE, products.start)
+            ))
+        for _ in range(rng.randint(1, 6)):
+            product_id = rng.choice(products)
+            stream.append((
+                "toggle", user_id, encode(catalog, OP_TOGGLE, product_id)
+            ))
+        if category.has_subcategories:
+            stream.append((
+                "back", user_id, encode(catalog, OP_BACK, category.id)
+            ))
+        if rng.random() < 0.15:
+            stream.append(("done", user_id, encode(catalog, OP_DONE)))
+        if rng.random() < 0.2:
+            # Поиск по началу слова из случайного названия
+            name = catalog.product(rng.randrange(len(catalog))).name
+            word = rng.choice(name.split())
+            stream.append(("find", user_id, f"/find {word[:4]}"))
+    return stream[:actions]
+
+
+# ============================================================================
+# SCENARIO RUNNER / ЗАПУСК СЦЕНАРИЯ
+# ============================================================================
+
+def install_catalog(catalog: CompiledCatalog, users: int) -> None:
+    """Подменяет глобальное состояние bot.py для прогона"""
+    bot.CATALOG = catalog
+    bot.KEYBOARDS = bot.make_keyboards(catalog)
+    # Каждый прогон начинается с пустых списков: без снимков в очереди
+    # записи и без доставленных сообщений, которые "Готово" правило бы
+    spill = isinstance(bot.STORE, SQLiteSelectionStore)
+    asyncio.run(bot.STORE.close())
+    bot.STORE = open_store(None, spill=spill)
+    bot.selected_products.clear()
+    bot.delivered_lists.clear()
+    bot.published_lists.clear()
+    # Правки без задержки и рассылка без ограничений скорости: измеряем CPU
+    bot.EDITS = EditCoalescer(quiet_window=0)
+    bot.BROADCASTER = Broadcaster(RateLimiter(1e9, 1e9, 10 ** 9))
+    bot.HOUSEHOLDS = HouseholdRegistry([Household("bench", frozenset(
+        BASE_USER_ID + user_no for user_no in range(users)
+    ))])
+
+
+async def replay(
+    stream: List[Action],
+    fake_bot: FakeBot,
+    timings: Optional[Dict[str, List[int]]] = None
+) -> None:
+    """Воспроизводит поток действий; при timings - замеряет каждый вызов"""
+    context = FakeContext(fake_bot)
+    for update_id, (kind, user_id, data) in enumerate(stream, start=1):
+        if kind == "start":
+            update = command_update(fake_bot, update_id, user_id, data)
+            handler = bot.start
+        elif kind == "find":
+            update = command_update(fake_bot, update_id, user_id, data)
+            context.args = data.split()[1:]
+            handler = bot.find_products
+        else:
+            update = callback_update(fake_bot, update_id, user_id, 1, data)
+            handler = bot.button_handler
+
+        started = time.perf_counter_ns()
+        await handler(update, context)
+        await bot.EDITS.drain()
+        elapsed = time.perf_counter_ns() - started
+        if timings is not None:
+            timings[kind].append(elapsed)
+
+
+def percentile(sorted_values: List[int], fraction: float) -> float:
+    """Перцентиль по отсортированному списку (ближайший ранг)"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return float(sorted_values[index])
+
+
+def run_scenario(
+    size: int,
+    actions: int,
+    users: int,
+    seed: int
+) -> Dict[str, Any]:
+    """Один прогон: задержки, память и вызовы API для каталога size"""
+    catalog = compile_catalog(synthetic_catalog(size, seed))
+    stream = click_stream(catalog, users, actions, seed)
+
+    # Прогрев: заполняет кеши так же, как в долго работающем процессе
+    install_catalog(catalog, users)
+    asyncio.run(replay(stream, FakeBot()))
+
+    # Замер задержек
+    install_catalog(catalog, users)
+    fake_bot = FakeBot()
+    timings: Dict[str, List[int]] = defaultdict(list)
+    asyncio.run(replay(stream, fake_bot, timings))
+
+    # Замер памяти отдельным прогоном (tracemalloc замедляет выполнение)
+    install_catalog(catalog, users)
+    tracemalloc.start()
+    asyncio.run(replay(stream, FakeBot()))
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    handlers = {}
+    for kind, values in sorted(timings.items()):
+        values.sort()
+        handlers[kind] = {
+            "count": len(values),
+            "p50_us": round(percentile(values, 0.50) / 1000, 1),
+            "p90_us": round(percentile(values, 0.90) / 1000, 1),
+            "p99_us": round(percentile(values, 0.99) / 1000, 1),
+            "max_us": round(values[-1] / 1000, 1),
+        }
+    api_calls = sum(fake_bot.calls.values())
+    return {
+        "catalog_size": len(catalog),
+        "actions": len(stream),
+        "handlers": handlers,
+        "api_calls": dict(fake_bot.calls),
+        "api_calls_per_action": round(api_calls / len(stream), 3),
+        "alloc_peak_kb": round(peak / 1024, 1),
+        "alloc_retained_kb": round(retained / 1024, 1),
+        "alloc_peak_per_action_b": round(peak / len(stream)),
+    }
+
+
+# ============================================================================
+# REPORTING / ОТЧЕТ
+# ============================================================================
+
+def print_report(results: List[Dict[str, Any]]) -> None:
+    """Печатает таблицу результатов"""
+    for result in results:
+        print(
+            f"\n=== catalog {result['catalog_size']} items, "
+            f"{result['actions']} actions ==="
+        )
+        print(f"{'handler':<12}{'n':>6}{'p50 us':>11}{'p90 us':>11}"
+              f"{'p99 us':>11}{'max us':>11}")
+        for kind, stats in result["handlers"].items():
+            print(
+                f"{kind:<12}{stats['count']:>6}{stats['p50_us']:>11}"
+                f"{stats['p90_us']:>11}{stats['p99_us']:>11}"
+                f"{stats['max_us']:>11}"
+            )
+        print(
+            f"API calls/action: {result['api_calls_per_action']} "
+            f"{result['api_calls']}"
+        )
+        print(
+            f"memory: peak {result['alloc_peak_kb']} KiB, "
+            f"retained {result['alloc_retained_kb']} KiB, "
+            f"{result['alloc_peak_per_action_b']} B/action"
+        )
+
+
+def compare(
+    results: List[Dict[str, Any]],
+    baseline: List[Dict[str, Any]],
+    tolerance: float
+) -> List[str]:
+    """Сравнивает p50/p99 и вызовы API с базовой линией"""
+    previous = {result["catalog_size"]: result for result in baseline}
+    regressions = []
+    for result in results:
+        old = previous.get(result["catalog_size"])
+        if old is None:
+            continue
+        size = result["catalog_size"]
+        for kind, stats in result["handlers"].items():
+            old_stats = old["handlers"].get(kind)
+            if old_stats is None:
+                continue
+            for metric in ("p50_us", "p99_us"):
+                limit = old_stats[metric] * (1 + tolerance)
+                if stats[metric] > limit:
+                    regressions.append(
+                        f"{size}/{kind} {metric}: "
+                        f"{old_stats[metric]} -> {stats[metric]}"
+                    )
+        if result["api_calls_per_action"] > old["api_calls_per_action"]:
+            regressions.append(
+                f"{size} api_calls_per_action: "
+                f"{old['api_calls_per_action']} -> "
+                f"{result['api_calls_per_action']}"
+            )
+    return regressions
+
+
+def main() -> int:
+    """Точка входа командной строки"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--actions", type=int, default=DEFAULT_ACTIONS)
+    parser.add_argument("--users", type=int, default=DEFAULT_USERS)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--save", help="записать результаты в JSON")
+    parser.add_argument("--compare", help="сравнить с JSON базовой линией")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    # Логи каждого клика исказили бы замеры
+    bot.logger.disabled = True
+
+    results = [
+        run_scenario(size, args.actions, args.users, args.seed)
+        for size in args.sizes
+    ]
+    print_report(results)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\nSaved baseline to {args.save}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("\nNo regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,541 +1,1054 @@
-"""
-Telegram Shopping List Bot
-Бот для составления списка покупок с категориями и подкатегориями
-"""
-
-import os
-import logging
-from typing import Set, Dict, Union, Optional
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import (
-    Application,
-    CommandHandler,
-    CallbackQueryHandler,
-    CallbackContext
-)
-
-# ============================================================================
-# CONFIGURATION / КОНФИГУРАЦИЯ
-# ============================================================================
-
-# Telegram Bot Token из переменной окружения
-TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN")
-if not TOKEN:
-    raise ValueError("TELEGRAM_BOT_TOKEN environment variable not set!")
-
-# ID разрешенных пользователей (члены семьи)
-ALLOWED_USERS = {501851181}
-
-# Категории продуктов
-PRODUCT_CATEGORIES: Dict[str, Union[list, dict]] = {
-    "Хлібні вироби": [
-        "Хліб", "Лаваш", "Багет", "Чіабата", "Круасани", "Слойки"
-    ],
-    "Соління": [
-        "Капуста кв.", "Морквичка", "Огірок", "Помідор"
-    ],
-    "М'ясо": {
-        "Свинина": ["Вирізка", "Ребра", "Фарш"],
-        "Курятина": ["Філе", "Крила", "Гомілка", "Шлунки"],
-        "Яловичина": ["Стейк", "Фарш.", "Ребра."],
-        "Індичатина": ["Філе.", "Гуляш", "Гомілка."],
-        "Сало": ["Солоне", "Копчене"]
-    },
-    "Риба": [
-        "Свіжа риба", "Сьомга", "Форель", "Оселедець", "Ікра"
-    ],
-    "Овочі": [
-        "Огірки", "Помідори", "Картопля", "Цибуля", "Морква",
-        "Капуста", "Перець", "Буряк", "Часник", "Баклажани",
-        "Кабачки", "Гриби"
-    ],
-    "Зелень": [
-        "Цибулька", "Петрушка", "Кріп", "Салат", "Щавель", "Редиска"
-    ],
-    "Фрукти": [
-        "Лимон", "Яблука", "Груші", "Виноград", "Слива"
-    ],
-    "Молочні та яйця": [
-        "Яйця", "Сир", "Творог", "Молоко", "Сметана",
-        "Масло", "Гералакт", "Вершки"
-    ],
-    "Бакалія": [
-        "Макарони", "Крупа гречана", "Борошно", "Цукор", "Сіль"
-    ],
-    "Чай, кава": ["Чай", "Кава"],
-    "Ковбасні та Сир": [
-        "Варена", "Копчена", "Сосиски", "Сир твердий",
-        "Мацарелла", "Сулугуні", "Сыр м'який"
-    ],
-    "Соуси, приправи": [
-        "Олія рослинна", "Олія домашня", "Оцет", "Оливки",
-        "Маслини", "Майонез", "Соев. соус", "Соуси інші",
-        "Приправи та спеції"
-    ],
-    "Консервація": [
-        "Варення та джеми", "Фрукти", "Гриби", "Риба",
-        "М'ясо", "Овочі", "Паштет"
-    ],
-    "Заморожені продукти": [
-        "Тісто", "Морозиво", "Пельмені", "Вареники", "Млинці"
-    ],
-    "Туалет та Ванна": [
-        "Папір", "Каченя", "Міло", "Шампунь", "Палички",
-        "резерв", "резерв2", "резерв3"
-    ],
-    "Кухня": [
-        "Серветки", "Бум. рушник", "Ганчірки",
-        "резерв4", "резерв5"
-    ],
-}
-
-# ============================================================================
-# LOGGING SETUP / НАСТРОЙКА ЛОГИРОВАНИЯ
-# ============================================================================
-
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    level=logging.INFO
-)
-logger = logging.getLogger(__name__)
-
-# ============================================================================
-# STATE MANAGEMENT / УПРАВЛЕНИЕ СОСТОЯНИЕМ
-# ============================================================================
-
-# Словарь для хранения выбранных продуктов для каждого пользователя
-selected_products: Dict[int, Set[str]] = {}
-
-
-# ============================================================================
-# UTILITY FUNCTIONS / ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ
-# ============================================================================
-
-def is_authorized(user_id: int) -> bool:
-    """Проверяет, авторизован ли пользователь"""
-    return user_id in ALLOWED_USERS
-
-
-def get_user_selected_products(user_id: int) -> Set[str]:
-    """Возвращает набор выбранных продуктов для пользователя"""
-    if user_id not in selected_products:
-        selected_products[user_id] = set()
-    return selected_products[user_id]
-
-
-# ============================================================================
-# CATEGORY DISPLAY / ОТОБРАЖЕНИЕ КАТЕГОРИЙ
-# ============================================================================
-
-async def show_categories(update: Update, context: CallbackContext) -> None:
-    """Отображает главное меню с категориями продуктов"""
-    categories = list(PRODUCT_CATEGORIES.keys())
-    
-    # Создаем клавиатуру с двумя кнопками в ряд
-    keyboard = []
-    for i in range(0, len(categories) - 1, 2):
-        keyboard.append([
-            InlineKeyboardButton(
-                categories[i],
-                callback_data=f"category_{categories[i]}"
-            ),
-            InlineKeyboardButton(
-                categories[i + 1],
-                callback_data=f"category_{categories[i + 1]}"
-            )
-        ])
-    
-    # Добавляем последнюю категорию, если их нечетное количество
-    if len(categories) % 2 == 1:
-        keyboard.append([
-            InlineKeyboardButton(
-                categories[-1],
-                callback_data=f"category_{categories[-1]}"
-            )
-        ])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    # Отправляем или редактируем сообщение
-    if update.callback_query:
-        await update.callback_query.edit_message_text(
-            "🛍 Оберіть категорію:",
-            reply_markup=reply_markup
-        )
-    else:
-        await update.message.reply_text(
-            "🛍 Оберіть категорію:",
-            reply_markup=reply_markup
-        )
-
-
-async def show_subcategories(
-    update: Update,
-    user_id: int,
-    category: str,
-    query: Optional[Update] = None
-) -> None:
-    """Отображает подкатегории для выбранной категории"""
-    subcategories = list(PRODUCT_CATEGORIES[category].keys())
-    
-    # Создаем клавиатуру с подкатегориями
-    keyboard = []
-    for i in range(0, len(subcategories) - 1, 2):
-        keyboard.append([
-            InlineKeyboardButton(
-                subcategories[i],
-                callback_data=f"subcategory_{subcategories[i]}"
-            ),
-            InlineKeyboardButton(
-                subcategories[i + 1],
-                callback_data=f"subcategory_{subcategories[i + 1]}"
-            )
-        ])
-    
-    if len(subcategories) % 2 == 1:
-        keyboard.append([
-            InlineKeyboardButton(
-                subcategories[-1],
-                callback_data=f"subcategory_{subcategories[-1]}"
-            )
-        ])
-    
-    # Кнопка "Назад"
-    keyboard.append([
-        InlineKeyboardButton("🔙 Назад", callback_data="back_to_categories")
-    ])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    text = f"📌 Ви обрали категорію: *{category}*\nВиберіть підкатегорію:"
-    
-    if query:
-        await query.edit_message_text(
-            text=text,
-            parse_mode="Markdown",
-            reply_markup=reply_markup
-        )
-    else:
-        await update.message.reply_text(
-            text=text,
-            parse_mode="Markdown",
-            reply_markup=reply_markup
-        )
-
-
-async def show_products(
-    update: Update,
-    user_id: int,
-    category: str,
-    query: Optional[Update] = None,
-    subcategory: Optional[str] = None
-) -> None:
-    """Отображает список продуктов для выбора"""
-    # Определяем список продуктов и текст заголовка
-    if subcategory:
-        products = PRODUCT_CATEGORIES[category].get(subcategory, [])
-        back_callback_data = f"back_to_{category}"
-        text = (
-            f"📌 Ви обрали підкатегорію: *{subcategory}* "
-            f"з категорії *{category}*\nВиберіть продукти:"
-        )
-    else:
-        products = PRODUCT_CATEGORIES.get(category, [])
-        back_callback_data = "back_to_categories"
-        text = f"📌 Ви обрали категорію: *{category}*\nВиберіть продукти:"
-    
-    user_products = get_user_selected_products(user_id)
-    
-    # Создаем кнопки для каждого продукта
-    keyboard = []
-    for product in products:
-        # Добавляем галочку, если продукт уже выбран
-        button_text = f"{'✅ ' if product in user_products else ''}{product}"
-        keyboard.append([
-            InlineKeyboardButton(
-                button_text,
-                callback_data=f"select_{product}"
-            )
-        ])
-    
-    # Кнопки навигации
-    keyboard.append([
-        InlineKeyboardButton("🔙 Назад", callback_data=back_callback_data)
-    ])
-    keyboard.append([
-        InlineKeyboardButton("✅ Готово", callback_data="done")
-    ])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    if query:
-        await query.edit_message_text(
-            text=text,
-            parse_mode="Markdown",
-            reply_markup=reply_markup
-        )
-    else:
-        await update.message.reply_text(
-            text=text,
-            parse_mode="Markdown",
-            reply_markup=reply_markup
-        )
-
-
-# ============================================================================
-# COMMAND HANDLERS / ОБРАБОТЧИКИ КОМАНД
-# ============================================================================
-
-async def start(update: Update, context: CallbackContext) -> None:
-    """Обработчик команды /start"""
-    user_id = update.effective_user.id
-    
-    if not is_authorized(user_id):
-        await update.message.reply_text("❌ У вас нет доступа к этому боту.")
-        return
-    
-    # Инициализируем пустой список для пользователя
-    selected_products[user_id] = set()
-    
-    logger.info(f"User {user_id} started the bot")
-    await show_categories(update, context)
-
-
-async def clear_list(update: Update, context: CallbackContext) -> None:
-    """Обработчик команды /clear - очищает список покупок"""
-    user_id = update.effective_user.id
-    
-    if not is_authorized(user_id):
-        await update.message.reply_text("❌ У вас нет доступа к этому боту.")
-        return
-    
-    selected_products[user_id] = set()
-    logger.info(f"User {user_id} cleared shopping list")
-    await update.message.reply_text("🗑 Список покупок очищений!")
-
-
-# ============================================================================
-# CALLBACK HANDLERS / ОБРАБОТЧИКИ CALLBACK-ЗАПРОСОВ
-# ============================================================================
-
-async def button_handler(update: Update, context: CallbackContext) -> None:
-    """Главный обработчик всех нажатий на inline-кнопки"""
-    query = update.callback_query
-    user_id = update.effective_user.id
-    
-    await query.answer()
-    
-    if not is_authorized(user_id):
-        await query.message.reply_text("❌ У вас нет доступа к этому боту.")
-        return
-    
-    data = query.data
-    
-    # Обработка выбора категории
-    if data.startswith("category_"):
-        category = data.split("_", 1)[1]
-        
-        if isinstance(PRODUCT_CATEGORIES[category], dict):
-            # Категория с подкатегориями
-            await show_subcategories(update, user_id, category, query)
-        else:
-            # Категория без подкатегорий
-            await show_products(update, user_id, category, query)
-    
-    # Обработка выбора подкатегории
-    elif data.startswith("subcategory_"):
-        subcategory = data.split("_", 1)[1]
-        
-        # Находим родительскую категорию
-        category = next(
-            (cat for cat, subcats in PRODUCT_CATEGORIES.items()
-             if isinstance(subcats, dict) and subcategory in subcats),
-            None
-        )
-        
-        if category:
-            await show_products(update, user_id, category, query, subcategory)
-    
-    # Обработка выбора/снятия продукта
-    elif data.startswith("select_"):
-        product = data.split("_", 1)[1]
-        user_products = get_user_selected_products(user_id)
-        
-        # Переключаем состояние продукта (выбран/не выбран)
-        if product in user_products:
-            user_products.remove(product)
-            logger.info(f"User {user_id} deselected: {product}")
-        else:
-            user_products.add(product)
-            logger.info(f"User {user_id} selected: {product}")
-        
-        # Находим категорию продукта для обновления экрана
-        category = None
-        subcategory = None
-        
-        # Ищем в простых категориях
-        for cat, items in PRODUCT_CATEGORIES.items():
-            if isinstance(items, list) and product in items:
-                category = cat
-                break
-        
-        # Ищем в категориях с подкатегориями
-        if not category:
-            for cat, subcats in PRODUCT_CATEGORIES.items():
-                if isinstance(subcats, dict):
-                    for subcat, items in subcats.items():
-                        if product in items:
-                            category = cat
-                            subcategory = subcat
-                            break
-                    if category:
-                        break
-        
-        # Обновляем экран с продуктами
-        if category:
-            await show_products(update, user_id, category, query, subcategory)
-    
-    # Возврат к главному меню категорий
-    elif data == "back_to_categories":
-        await show_categories(update, context)
-    
-    # Возврат к подкатегориям
-    elif data.startswith("back_to_"):
-        category = data.split("_", 2)[2]
-        await show_subcategories(update, user_id, category, query)
-    
-    # Завершение выбора и отправка списка
-    elif data == "done":
-        await send_shopping_list(update, context, user_id)
-
-
-# ============================================================================
-# SHOPPING LIST GENERATION / ФОРМИРОВАНИЕ СПИСКА ПОКУПОК
-# ============================================================================
-
-async def send_shopping_list(
-    update: Update,
-    context: CallbackContext,
-    user_id: int
-) -> None:
-    """Формирует и отправляет список покупок всем членам семьи"""
-    user_products = get_user_selected_products(user_id)
-    
-    if not user_products:
-        await update.callback_query.edit_message_text(
-            "❌ Ви не обрали жодного продукту."
-        )
-        return
-    
-    # Сортируем продукты по категориям
-    sorted_list = {}
-    
-    # Обрабатываем простые категории (списки)
-    for category, items in PRODUCT_CATEGORIES.items():
-        if isinstance(items, list):
-            selected_in_category = [p for p in items if p in user_products]
-            if selected_in_category:
-                sorted_list[category] = selected_in_category
-    
-    # Обрабатываем категории с подкатегориями (словари)
-    for category, subcats in PRODUCT_CATEGORIES.items():
-        if isinstance(subcats, dict):
-            sorted_sublist = {}
-            
-            for subcat, items in subcats.items():
-                selected_in_subcat = [p for p in items if p in user_products]
-                if selected_in_subcat:
-                    sorted_sublist[subcat] = selected_in_subcat
-            
-            if sorted_sublist:
-                sorted_list[category] = sorted_sublist
-    
-    # Формируем текст сообщения
-    message_text = "🛒 *Список покупок:*\n\n"
-    
-    for category, items in sorted_list.items():
-        if isinstance(items, dict):
-            # Категория с подкатегориями
-            message_text += f"*{category}:*\n"
-            for subcat, subitems in items.items():
-                message_text += f"  *{subcat}:*\n"
-                message_text += "\n".join(f"    • {product}" for product in subitems)
-                message_text += "\n\n"
-        else:
-            # Простая категория
-            message_text += f"*{category}:*\n"
-            message_text += "\n".join(f"  • {product}" for product in items)
-            message_text += "\n\n"
-    
-    # Отправляем список всем членам семьи
-    success_count = 0
-    for family_member in ALLOWED_USERS:
-        try:
-            await context.bot.send_message(
-                chat_id=family_member,
-                text=message_text,
-                parse_mode="Markdown"
-            )
-            success_count += 1
-            logger.info(f"Shopping list sent to user {family_member}")
-        except Exception as e:
-            logger.error(
-                f"Failed to send shopping list to user {family_member}: {e}"
-            )
-    
-    # Подтверждаем отправку
-    await update.callback_query.edit_message_text(
-        f"✅ Список покупок оновлений та надісланий "
-        f"{success_count} членам сім'ї!"
-    )
-    
-    # Очищаем список после отправки
-    selected_products[user_id] = set()
-    logger.info(f"User {user_id} completed shopping list with {len(user_products)} items")
-
-
-# ============================================================================
-# MAIN APPLICATION / ОСНОВНАЯ ФУНКЦИЯ
-# ============================================================================
-
-def main() -> None:
-    """Основная функция запуска бота в режиме webhook на Render"""
-    try:
-        app = Application.builder().token(TOKEN).build()
-        app.add_handler(CommandHandler("start", start))
-        app.add_handler(CommandHandler("clear", clear_list))
-        app.add_handler(CallbackQueryHandler(button_handler))
-
-        logger.info("=" * 50)
-        logger.info("Бот для составления списков покупок успешно запущен (в режиме веб-перехватчика)!")
-        logger.info(f"Авторизованные пользователи: {ALLOWED_USERS}")
-        logger.info(f"Загружено категорий: {len(PRODUCT_CATEGORIES)}")
-        logger.info("=" * 50)
-
-        # --- Render webhook config ---
-        render_url = os.getenv("RENDER_EXTERNAL_URL")
-        if not render_url:
-            raise RuntimeError("RENDER_EXTERNAL_URL is not set")
-
-        port = int(os.getenv("PORT", "10000"))
-        webhook_path = "/webhook"
-        webhook_url = f"{render_url}{webhook_path}"
-
-        logger.info(f"Используется URL веб-перехватчика: {webhook_url} на порту {port}")
-
-        # ВАЖНО: вызываем run_webhook напрямую, БЕЗ asyncio.run(...)
-        app.run_webhook(
-            listen="0.0.0.0",
-            port=port,
-            url_path=webhook_path,
-            webhook_url=webhook_url,
-            allowed_updates=Update.ALL_TYPES,
-            drop_pending_updates=True,
-        )
-
-    except Exception as e:
-        logger.error(f"Не удалось запустить бота: {e}")
-        raise
-
-
-if __name__ == "__main__":
-    main()
+"""
+Telegram Shopping List Bot
+Бот для составления списка покупок с категориями и подкатегориями
+"""
+
+import os
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional
+from telegram import (
+    Bot,
+    CallbackQuery,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    InlineQueryResultArticle,
+    InputTextMessageContent,
+    Update
+)
+from telegram.ext import (
+    Application,
+    CommandHandler,
+    CallbackQueryHandler,
+    CallbackContext,
+    InlineQueryHandler,
+    TypeHandler
+)
+from telegram.helpers import escape_markdown
+
+from callbacks import (
+    OP_BACK,
+    OP_CATEGORY,
+    OP_DONE,
+    OP_HOME,
+    OP_PAGE,
+    OP_SCREEN,
+    OP_TOGGLE,
+    Callback,
+    assign_unique_tag,
+    catalog_tag,
+    decode,
+    encode,
+    payload_tag,
+    translate
+)
+from broadcast import Broadcaster, Delivered
+from catalog import Category, CompiledCatalog, Screen
+from coalescer import EditCoalescer
+from households import Household, load_households
+from ingress import Ingress
+from keyboards import CHECKMARK, KeyboardCache, build_search_markup
+from metrics import REGISTRY, instrument_handler
+from reloader import CatalogBuild, CatalogReloader, build_catalog
+from render import render_shopping_list
+from scheduler import KeyedUpdateProcessor
+from search import search_index
+from selection import Selection
+from sessions import SessionCache
+from startup import StartupTimer
+from storage import open_store
+from transport import (
+    BROADCAST_POOL,
+    INTERACTIVE_POOL,
+    make_request,
+    pool_config
+)
+from webserver import serve_webhook
+
+# ============================================================================
+# CONFIGURATION / КОНФИГУРАЦИЯ
+# ============================================================================
+
+# Telegram Bot Token из переменной окружения
+TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN")
+if not TOKEN:
+    raise ValueError("TELEGRAM_BOT_TOKEN environment variable not set!")
+
+# Секрет, который Telegram присылает в заголовке каждого запроса webhook;
+# по умолчанию выводится из токена, чтобы не меняться между перезапусками
+WEBHOOK_SECRET = (
+    os.environ.get("WEBHOOK_SECRET")
+    or hashlib.sha256(f"webhook:{TOKEN}".encode()).hexdigest()[:32]
+)
+
+# ID разрешенных пользователей (члены семьи)
+ALLOWED_USERS = {501851181}
+
+# ID администраторов через запятую (им доступна /reload); по умолчанию -
+# ALLOWED_USERS
+ADMIN_USERS = frozenset(
+    int(user_id)
+    for user_id in os.environ.get("ADMIN_USER_IDS", "").split(",")
+    if user_id.strip()
+) or frozenset(ALLOWED_USERS)
+
+# Файл домохозяйств (JSON: ID домохозяйства -> ID участников); у каждого
+# домохозяйства свой общий список. Если не задан, ALLOWED_USERS - одно
+# домохозяйство
+HOUSEHOLDS_FILE = os.environ.get("HOUSEHOLDS_FILE")
+
+# Файл SQLite для сохранения списков между перезапусками
+# (если не задан, списки не переживают перезапуск)
+SELECTION_DB = os.environ.get("SELECTION_DB")
+
+# Как часто (в секундах) изменения списков сбрасываются на диск
+SELECTION_FLUSH_INTERVAL = float(
+    os.environ.get("SELECTION_FLUSH_INTERVAL", "2.0")
+)
+
+# Бюджет памяти на списки покупок (в байтах) и через сколько секунд без
+# обращений список вытесняется из памяти на диск (0 - без ограничения);
+# вытесненный список восстанавливается при следующем клике
+SESSION_MEMORY_BUDGET = int(
+    os.environ.get("SESSION_MEMORY_BUDGET", str(32 * 1024 * 1024))
+)
+SESSION_IDLE_TTL = float(os.environ.get("SESSION_IDLE_TTL", "3600"))
+
+# Окно тишины (в секундах), после которого отправляется правка клавиатуры
+EDIT_DEBOUNCE_SECONDS = float(os.environ.get("EDIT_DEBOUNCE_SECONDS", "0.3"))
+
+# Как доставляется список по кнопке "Готово":
+#   send - каждый раз новые сообщения, после отправки список очищается;
+#   edit - сообщения, доставленные в прошлый раз, обновляются на месте
+#          (неизмененные пропускаются), список остается до /clear;
+#   diff - как edit, но с пометками добавленных и удаленных продуктов
+LIST_DELIVERY_MODE = os.environ.get("LIST_DELIVERY_MODE", "edit")
+if LIST_DELIVERY_MODE not in ("send", "edit", "diff"):
+    raise ValueError(f"Unknown LIST_DELIVERY_MODE: {LIST_DELIVERY_MODE}")
+
+# Сколько обновлений разных пользователей обрабатывается одновременно
+MAX_CONCURRENT_UPDATES = int(os.environ.get("MAX_CONCURRENT_UPDATES", "32"))
+
+# Сколько обновлений может ждать обработки; сверх этого новые отбрасываются
+MAX_UPDATE_BACKLOG = int(os.environ.get("MAX_UPDATE_BACKLOG", "512"))
+
+# Файл каталога продуктов (JSON или YAML); правки подхватываются без
+# перезапуска бота
+CATALOG_FILE = os.environ.get(
+    "CATALOG_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalog.json")
+)
+
+# Как часто (в секундах) проверяется файл каталога (0 - только /reload)
+CATALOG_WATCH_INTERVAL = float(os.environ.get("CATALOG_WATCH_INTERVAL", "5"))
+
+# Сколько результатов показывают /find и inline-режим
+SEARCH_RESULTS_LIMIT = 10
+INLINE_RESULTS_LIMIT = 20
+
+# Сколько предыдущих версий каталога помнить для старых кнопок
+RECENT_CATALOG_VERSIONS = 3
+
+# Экраны продуктов листаются по страницам: продуктов на странице и
+# столбцов кнопок (не больше 96 продуктов - лимит кнопок Telegram)
+PRODUCT_PAGE_SIZE = int(os.environ.get("PRODUCT_PAGE_SIZE", "20"))
+PRODUCT_COLUMNS = int(os.environ.get("PRODUCT_COLUMNS", "2"))
+
+# Адрес Bot API (для нагрузочных тестов - локальный fakeapi.py)
+BOT_API_URL = os.environ.get("BOT_API_URL", "https://api.telegram.org/bot")
+
+# Пулы соединений с Bot API: ответы на нажатия и рассылка списков не
+# делят соединения (переменные API_* и BROADCAST_API_*, см. transport.py)
+INTERACTIVE_API_POOL = pool_config("API", INTERACTIVE_POOL)
+BROADCAST_API_POOL = pool_config("BROADCAST_API", BROADCAST_POOL)
+
+# Цель (в секундах) для времени от старта процесса до первого ответа:
+# сервис на Render засыпает, и первый клик после паузы ждет запуска
+FIRST_RESPONSE_TARGET = float(os.environ.get("FIRST_RESPONSE_TARGET", "5"))
+
+# Фазы холодного старта: импорт заканчивается здесь, дальше - каталог,
+# состояние, настройка приложения и фазы serve_webhook
+STARTUP = StartupTimer(target=FIRST_RESPONSE_TARGET)
+STARTUP.mark("imports")
+
+
+def make_keyboards(catalog: CompiledCatalog) -> KeyboardCache:
+    """Кеш клавиатур каталога с настройками страниц из конфигурации"""
+    return KeyboardCache(
+        catalog, page_size=PRODUCT_PAGE_SIZE, columns=PRODUCT_COLUMNS
+    )
+
+
+# Каталог компилируется при старте и при каждом изменении файла:
+# стабильные ID, индексы и готовые клавиатуры (страницы продуктов - LRU)
+_build = build_catalog(CATALOG_FILE, make_keyboards=make_keyboards)
+CATALOG = _build.catalog
+KEYBOARDS = _build.keyboards
+STARTUP.mark("catalog")
+
+
+# ============================================================================
+# LOGGING SETUP / НАСТРОЙКА ЛОГИРОВАНИЯ
+# ============================================================================
+
+logging.basicConfig(
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# STATE MANAGEMENT / УПРАВЛЕНИЕ СОСТОЯНИЕМ
+# ============================================================================
+
+# Домохозяйства: индекс пользователь -> домохозяйство и блокировки списков
+HOUSEHOLDS = load_households(HOUSEHOLDS_FILE, ALLOWED_USERS)
+
+# Хранилище списков: обработчики только помечают изменения,
+# запись на диск идет пакетами в фоновом потоке (без SELECTION_DB -
+# временная база, если списки вытесняются из памяти)
+STORE = open_store(
+    SELECTION_DB, SELECTION_FLUSH_INTERVAL,
+    spill=bool(SESSION_MEMORY_BUDGET or SESSION_IDLE_TTL)
+)
+
+# Общие списки домохозяйств: ID домохозяйства -> битовое множество
+# выбранных продуктов (бит = ID продукта в каталоге); простаивающие
+# списки вытесняются в STORE и поднимаются из него при обращении
+selected_products = SessionCache(
+    load=lambda list_id: STORE.load_list(list_id, CATALOG),
+    spill=lambda list_id, selection: STORE.mark_dirty(
+        list_id, selection, CATALOG
+    ),
+    memory_budget=SESSION_MEMORY_BUDGET,
+    idle_ttl=SESSION_IDLE_TTL,
+    busy=HOUSEHOLDS.busy
+)
+
+# Рассылка списков: параллельно, с лимитами Telegram и повторами;
+# одновременно - не больше, чем соединений в пуле рассылки
+BROADCASTER = Broadcaster(max_concurrency=BROADCAST_API_POOL.pool_size)
+
+# Бот для рассылки со своим пулом соединений (создается в main; без него,
+# например в bench.py, рассылка идет через context.bot)
+BROADCAST_BOT: Optional[Bot] = None
+
+# Последние доставленные сообщения со списком: домохозяйство -> чат -> ID
+# сообщений и хеши их текста (режимы edit/diff). В отличие от самих
+# списков не вытесняются: это несколько ID на домохозяйство из конфигурации,
+# а без них следующее "Готово" оставило бы в чатах старые списки
+delivered_lists: Dict[str, Dict[int, Delivered]] = {}
+
+# Последний отправленный список домохозяйства (режим diff)
+published_lists: Dict[str, Selection] = {}
+
+# Правки сообщений с клавиатурами: серии кликов объединяются в одну
+EDITS = EditCoalescer(EDIT_DEBOUNCE_SECONDS)
+
+# Обновления одного пользователя - по порядку, разных - параллельно
+SCHEDULER = KeyedUpdateProcessor(max_concurrent=MAX_CONCURRENT_UPDATES)
+
+# Отсев на входе webhook: чужие отправители, повторы и перегрузка
+# отбрасываются до построения Update и без обращений к Bot API
+INGRESS = Ingress(
+    lambda user_id: HOUSEHOLDS.household_of(user_id) is not None,
+    lambda: SCHEDULER.pending,
+    MAX_UPDATE_BACKLOG
+)
+
+# Предыдущие версии каталога (тег -> каталог) для кнопок в старых сообщениях
+RECENT_CATALOGS: "OrderedDict[str, CompiledCatalog]" = OrderedDict()
+
+REGISTRY.callback_gauge(
+    "bot_updates_queued",
+    "Updates waiting behind an earlier update of the same user",
+    lambda: SCHEDULER.stats()["queued"]
+)
+REGISTRY.callback_gauge(
+    "bot_updates_in_flight",
+    "Updates currently being processed",
+    lambda: SCHEDULER.in_flight
+)
+REGISTRY.callback_gauge(
+    "bot_sessions_in_memory",
+    "Household shopping lists held in memory",
+    lambda: len(selected_products)
+)
+REGISTRY.callback_gauge(
+    "bot_session_memory_bytes",
+    "Estimated memory used by in-memory shopping lists",
+    lambda: selected_products.nbytes
+)
+REGISTRY.callback_gauge(
+    "bot_pending_message_edits",
+    "Debounced keyboard edits not yet sent",
+    lambda: EDITS.pending
+)
+STARTUP.mark("state")
+
+
+# ============================================================================
+# UTILITY FUNCTIONS / ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ
+# ============================================================================
+
+def get_household(user_id: int) -> Optional[Household]:
+    """Домохозяйство пользователя; None - у пользователя нет доступа"""
+    return HOUSEHOLDS.household_of(user_id)
+
+
+def get_user_selected_products(user_id: int) -> Selection:
+    """Возвращает общий список домохозяйства пользователя"""
+    household_id = HOUSEHOLDS.household_of(user_id).id
+    selection = selected_products.get(household_id)
+    if selection is None:
+        selection = selected_products[household_id] = Selection(len(CATALOG))
+    return selection
+
+
+def save_user_selected_products(user_id: int) -> None:
+    """Помечает общий список для фоновой записи в хранилище"""
+    STORE.mark_dirty(
+        HOUSEHOLDS.household_of(user_id).id,
+        get_user_selected_products(user_id),
+        CATALOG
+    )
+
+
+def reset_user_selected_products(user_id: int) -> None:
+    """Очищает общий список домохозяйства пользователя"""
+    selected_products[HOUSEHOLDS.household_of(user_id).id] = (
+        Selection(len(CATALOG))
+    )
+    save_user_selected_products(user_id)
+
+
+def install_catalog(build: CatalogBuild) -> None:
+    """Подменяет каталог одним синхронным шагом на event loop"""
+    global CATALOG, KEYBOARDS
+
+    RECENT_CATALOGS[catalog_tag(CATALOG)] = CATALOG
+    while len(RECENT_CATALOGS) > RECENT_CATALOG_VERSIONS:
+        RECENT_CATALOGS.popitem(last=False)
+
+    # Тег новой версии не должен совпасть с тегом текущей или недавней:
+    # старые кнопки декодировались бы по новому каталогу. Клавиатуры,
+    # собранные со старым тегом, строятся заново (лениво)
+    keyboards = build.keyboards
+    if assign_unique_tag(build.catalog, RECENT_CATALOGS.values()):
+        logger.warning(
+            f"Catalog tag collision, version {build.catalog.version} "
+            f"uses tag {catalog_tag(build.catalog)}"
+        )
+        keyboards = make_keyboards(build.catalog)
+
+    # Списки переносятся по названиям продуктов: удаленные выпадают
+    size = len(build.catalog)
+    # Вытесненные списки переносятся по ключам при восстановлении
+    for list_id, selection in selected_products.resident():
+        selection = selection.remap(build.id_map, size)
+        selected_products.replace(list_id, selection)
+        STORE.mark_dirty(list_id, selection, build.catalog)
+    for list_id, selection in list(published_lists.items()):
+        published_lists[list_id] = selection.remap(build.id_map, size)
+
+    CATALOG = build.catalog
+    KEYBOARDS = keyboards
+
+
+# Следит за файлом каталога и вызывает install_catalog при изменениях
+RELOADER = CatalogReloader(
+    CATALOG_FILE, lambda: CATALOG, install_catalog, CATALOG_WATCH_INTERVAL,
+    make_keyboards
+)
+
+
+async def edit_query_message(
+    query: CallbackQuery,
+    text: str,
+    reply_markup: Optional[InlineKeyboardMarkup] = None,
+    parse_mode: Optional[str] = None,
+    debounce: bool = False
+) -> None:
+    """Редактирует сообщение, к которому привязана кнопка"""
+    await EDITS.edit(
+        query.get_bot(),
+        query.message.chat_id,
+        query.message.message_id,
+        text,
+        reply_markup=reply_markup,
+        parse_mode=parse_mode,
+        debounce=debounce
+    )
+
+
+# ============================================================================
+# CATEGORY DISPLAY / ОТОБРАЖЕНИЕ КАТЕГОРИЙ
+# ============================================================================
+
+async def show_categories(update: Update, context: CallbackContext) -> None:
+    """Отображает главное меню с категориями продуктов"""
+    reply_markup = KEYBOARDS.categories(CATALOG)
+    
+    # Отправляем или редактируем сообщение
+    if update.callback_query:
+        await edit_query_message(
+            update.callback_query,
+            "🛍 Оберіть категорію:",
+            reply_markup=reply_markup
+        )
+    else:
+        await update.message.reply_text(
+            "🛍 Оберіть категорію:",
+            reply_markup=reply_markup
+        )
+
+
+async def show_subcategories(
+    update: Update,
+    user_id: int,
+    category: Category,
+    query: Optional[Update] = None
+) -> None:
+    """Отображает подкатегории для выбранной категории"""
+    reply_markup = KEYBOARDS.subcategories(CATALOG, category.id)
+    text = (
+        f"📌 Ви обрали категорію: *{escape_markdown(category.name)}*\n"
+        f"Виберіть підкатегорію:"
+    )
+    
+    if query:
+        await edit_query_message(
+            query,
+            text,
+            parse_mode="Markdown",
+            reply_markup=reply_markup
+        )
+    else:
+        await update.message.reply_text(
+            text=text,
+            parse_mode="Markdown",
+            reply_markup=reply_markup
+        )
+
+
+async def show_products(
+    update: Update,
+    user_id: int,
+    screen: Screen,
+    query: Optional[Update] = None,
+    debounce: bool = False,
+    page: int = 0
+) -> None:
+    """Отображает страницу списка продуктов для выбора"""
+    # Определяем текст заголовка
+    if screen.subcategory:
+        text = (
+            f"📌 Ви обрали підкатегорію: "
+            f"*{escape_markdown(screen.subcategory)}* "
+            f"з категорії *{escape_markdown(screen.category)}*\n"
+            f"Виберіть продукти:"
+        )
+    else:
+        text = (
+            f"📌 Ви обрали категорію: *{escape_markdown(screen.category)}*\n"
+            f"Виберіть продукти:"
+        )
+    
+    pages = KEYBOARDS.pages(screen)
+    if pages > 1:
+        text += f"\n📄 Сторінка {page + 1} з {pages}"
+    
+    # Клавиатура зависит только от выбора на этой странице
+    mask = get_user_selected_products(user_id).range_mask(
+        KEYBOARDS.page_products(screen, page)
+    )
+    reply_markup = KEYBOARDS.products(CATALOG, screen, mask, page)
+    
+    if query:
+        await edit_query_message(
+            query,
+            text,
+            parse_mode="Markdown",
+            reply_markup=reply_markup,
+            debounce=debounce
+        )
+    else:
+        await update.message.reply_text(
+            text=text,
+            parse_mode="Markdown",
+            reply_markup=reply_markup
+        )
+
+
+# ============================================================================
+# COMMAND HANDLERS / ОБРАБОТЧИКИ КОМАНД
+# ============================================================================
+
+async def start(update: Update, context: CallbackContext) -> None:
+    """Обработчик команды /start"""
+    user_id = update.effective_user.id
+    
+    if get_household(user_id) is None:
+        await update.message.reply_text("❌ У вас нет доступа к этому боту.")
+        return
+    
+    # Список общий для домохозяйства: /start его не очищает (для этого /clear)
+    logger.info(f"User {user_id} started the bot")
+    await show_categories(update, context)
+
+
+async def clear_list(update: Update, context: CallbackContext) -> None:
+    """Обработчик команды /clear - очищает список покупок"""
+    user_id = update.effective_user.id
+    
+    household = get_household(user_id)
+    if household is None:
+        await update.message.reply_text("❌ У вас нет доступа к этому боту.")
+        return
+    
+    async with HOUSEHOLDS.lock(household):
+        reset_user_selected_products(user_id)
+    logger.info(f"User {user_id} cleared shopping list of {household.id}")
+    await update.message.reply_text("🗑 Список покупок очищений!")
+
+
+async def show_stats(update: Update, context: CallbackContext) -> None:
+    """Обработчик команды /stats - состояние очередей обработки"""
+    user_id = update.effective_user.id
+    
+    if get_household(user_id) is None:
+        await update.message.reply_text("❌ У вас нет доступа к этому боту.")
+        return
+    
+    lines = [f"{name}: {value}" for name, value in SCHEDULER.stats().items()]
+    sessions = [
+        f"{name}: {value}"
+        for name, value in selected_products.stats().items()
+    ]
+    await update.message.reply_text(
+        "📊 Черги обробки:\n" + "\n".join(lines)
+        + "\n\n🧺 Списки в пам'яті:\n" + "\n".join(sessions)
+    )
+
+
+async def reload_catalog(update: Update, context: CallbackContext) -> None:
+    """Обработчик команды /reload - перечитывает файл каталога"""
+    user_id = update.effective_user.id
+    
+    if user_id not in ADMIN_USERS:
+        logger.warning(f"User {user_id} is not allowed to reload the catalog")
+        await update.message.reply_text(
+            "❌ Команда доступна лише адміністратору."
+        )
+        return
+    
+    try:
+        changed = await RELOADER.reload(force=True)
+    except Exception as e:
+        logger.error(f"Catalog reload requested by user {user_id} failed: {e}")
+        await update.message.reply_text(f"❌ Каталог не оновлено: {e}")
+        return
+    
+    if changed:
+        await update.message.reply_text(
+            f"✅ Каталог оновлено: {len(CATALOG)} продуктів"
+        )
+    else:
+        await update.message.reply_text("ℹ️ Каталог без змін")
+
+
+async def find_products(update: Update, context: CallbackContext) -> None:
+    """Обработчик команды /find - поиск продуктов по названию"""
+    user_id = update.effective_user.id
+    
+    if get_household(user_id) is None:
+        await update.message.reply_text("❌ У вас нет доступа к этому боту.")
+        return
+    
+    query = " ".join(context.args or ())
+    if not query:
+        await update.message.reply_text(
+            "🔎 Напишіть, що шукати: /find хліб"
+        )
+        return
+    
+    products = search_index(CATALOG).search(query, SEARCH_RESULTS_LIMIT)
+    if not products:
+        await update.message.reply_text(f"🔎 Нічого не знайдено: {query}")
+        return
+    
+    # Нажатие на продукт отмечает его и открывает его экран
+    await update.message.reply_text(
+        "🔎 Знайдено, оберіть продукти:",
+        reply_markup=build_search_markup(
+            CATALOG, products, get_user_selected_products(user_id)
+        )
+    )
+
+
+# ============================================================================
+# INLINE MODE / INLINE-РЕЖИМ
+# ============================================================================
+
+async def inline_search(update: Update, context: CallbackContext) -> None:
+    """Поиск продуктов в inline-режиме (@бот запрос)"""
+    inline_query = update.inline_query
+    user_id = update.effective_user.id
+    
+    if get_household(user_id) is None or not inline_query.query.strip():
+        await inline_query.answer([], cache_time=5, is_personal=True)
+        return
+    
+    selection = get_user_selected_products(user_id)
+    results = []
+    for product in search_index(CATALOG).search(
+        inline_query.query, INLINE_RESULTS_LIMIT
+    ):
+        screen = CATALOG.screen(product.screen_id)
+        mark = CHECKMARK if product.id in selection else ""
+        results.append(InlineQueryResultArticle(
+            id=str(product.id),
+            title=f"{mark}{product.name}",
+            description=(
+                f"{screen.category} / {screen.subcategory}"
+                if screen.subcategory else screen.category
+            ),
+            input_message_content=InputTextMessageContent(
+                f"🛒 {product.name}"
+            ),
+            reply_markup=InlineKeyboardMarkup([[
+                InlineKeyboardButton(
+                    "➕ До списку / ➖ прибрати",
+                    callback_data=encode(CATALOG, OP_TOGGLE, product.id)
+                )
+            ]])
+        ))
+    
+    # Отметки в результатах у каждого свои, поэтому is_personal
+    await inline_query.answer(results, cache_time=5, is_personal=True)
+
+
+async def inline_button(
+    query: CallbackQuery,
+    user_id: int,
+    callback: Callback,
+    catalog: CompiledCatalog
+) -> None:
+    """Кнопка под сообщением, отправленным через inline-режим"""
+    # Сообщение может быть в любом чате: не редактируем его,
+    # а отвечаем всплывающим уведомлением
+    household = get_household(user_id)
+    if household is None:
+        await query.answer("❌ У вас нет доступа к этому боту.")
+        return
+    if callback.op != OP_TOGGLE:
+        await query.answer()
+        return
+    
+    async with HOUSEHOLDS.lock(household):
+        # Пока ждали блокировку, каталог мог смениться
+        callback = translate(callback, catalog, CATALOG)
+        if callback is None:
+            await query.answer("⚠️ Кнопка застаріла, натисніть /start")
+            return
+        product = CATALOG.product(callback.arg)
+        selected = get_user_selected_products(user_id).toggle(product.id)
+        save_user_selected_products(user_id)
+    if selected:
+        await query.answer(f"✅ {product.name} додано до списку")
+    else:
+        await query.answer(f"➖ {product.name} прибрано зі списку")
+
+
+# ============================================================================
+# CALLBACK HANDLERS / ОБРАБОТЧИКИ CALLBACK-ЗАПРОСОВ
+# ============================================================================
+
+async def _on_category(
+    update: Update,
+    context: CallbackContext,
+    user_id: int,
+    category_id: int
+) -> None:
+    """Обработка выбора категории"""
+    category = CATALOG.category(category_id)
+    
+    if category.has_subcategories:
+        # Категория с подкатегориями
+        await show_subcategories(
+            update, user_id, category, update.callback_query
+        )
+    else:
+        # Категория без подкатегорий
+        screen = CATALOG.screen(category.screen_ids[0])
+        await show_products(update, user_id, screen, update.callback_query)
+
+
+async def _on_screen(
+    update: Update,
+    context: CallbackContext,
+    user_id: int,
+    screen_id: int
+) -> None:
+    """Обработка выбора подкатегории"""
+    await show_products(
+        update, user_id, CATALOG.screen(screen_id), update.callback_query
+    )
+
+
+async def _on_toggle(
+    update: Update,
+    context: CallbackContext,
+    user_id: int,
+    product_id: int
+) -> None:
+    """Обработка выбора/снятия продукта"""
+    user_products = get_user_selected_products(user_id)
+    
+    # Переключаем состояние продукта (выбран/не выбран);
+    # лог на каждый клик - только на уровне DEBUG и без f-строки
+    selected = user_products.toggle(product_id)
+    logger.debug("User %s toggled product %s: %s", user_id, product_id, selected)
+    save_user_selected_products(user_id)
+    
+    # Обновляем страницу с продуктом (экран находится по индексу);
+    # серия быстрых кликов превращается в одну правку сообщения
+    screen = CATALOG.locate(product_id)
+    await show_products(
+        update, user_id, screen, update.callback_query,
+        debounce=True, page=KEYBOARDS.page_of(screen, product_id)
+    )
+
+
+async def _on_page(
+    update: Update,
+    context: CallbackContext,
+    user_id: int,
+    product_id: int
+) -> None:
+    """Переход на страницу экрана, на которой находится продукт"""
+    screen = CATALOG.locate(product_id)
+    await show_products(
+        update, user_id, screen, update.callback_query,
+        page=KEYBOARDS.page_of(screen, product_id)
+    )
+
+
+async def _on_back(
+    update: Update,
+    context: CallbackContext,
+    user_id: int,
+    category_id: int
+) -> None:
+    """Возврат к подкатегориям"""
+    await show_subcategories(
+        update, user_id, CATALOG.category(category_id), update.callback_query
+    )
+
+
+async def _on_home(
+    update: Update,
+    context: CallbackContext,
+    user_id: int,
+    _: None
+) -> None:
+    """Возврат к главному меню категорий"""
+    await show_categories(update, context)
+
+
+# Таблица маршрутизации: опкод callback_data -> обработчик
+# ("Готово" обрабатывается отдельно: рассылка идет без блокировки списка)
+CALLBACK_ROUTES = {
+    OP_CATEGORY: _on_category,
+    OP_SCREEN: _on_screen,
+    OP_TOGGLE: _on_toggle,
+    OP_PAGE: _on_page,
+    OP_BACK: _on_back,
+    OP_HOME: _on_home,
+}
+
+
+async def button_handler(update: Update, context: CallbackContext) -> None:
+    """Главный обработчик всех нажатий на inline-кнопки"""
+    query = update.callback_query
+    user_id = update.effective_user.id
+    
+    # Кнопки из сообщений, отправленных до перезагрузки каталога,
+    # декодируются по своей версии и переводятся в текущую по названиям
+    catalog = CATALOG
+    callback = decode(query.data, catalog)
+    if callback is None:
+        source = RECENT_CATALOGS.get(payload_tag(query.data))
+        if source is not None:
+            callback = decode(query.data, source)
+        if callback is not None:
+            callback = translate(callback, source, catalog)
+    
+    # Устаревшие или чужие кнопки отбрасываем
+    if callback is None:
+        await query.answer("⚠️ Кнопка застаріла, натисніть /start")
+        return
+    
+    if query.message is None:
+        await inline_button(query, user_id, callback, catalog)
+        return
+    
+    # Без доступа - одно уведомление вместо ответа и отдельного сообщения
+    household = get_household(user_id)
+    if household is None:
+        await query.answer("❌ У вас нет доступа к этому боту.")
+        return
+    
+    await query.answer()
+    
+    # Рассылка списка берет блокировку только на время снимка
+    if callback.op == OP_DONE:
+        await send_shopping_list(update, context, user_id)
+        return
+    
+    # Участники одного домохозяйства меняют общий список по очереди,
+    # разные домохозяйства друг друга не ждут
+    async with HOUSEHOLDS.lock(household):
+        # Пока ждали ответ и блокировку, каталог мог смениться: ID из
+        # callback_data переводятся в текущий каталог уже под блокировкой
+        callback = translate(callback, catalog, CATALOG)
+        if callback is None:
+            await edit_query_message(
+                query, "⚠️ Кнопка застаріла, натисніть /start"
+            )
+            return
+        await CALLBACK_ROUTES[callback.op](
+            update, context, user_id, callback.arg
+        )
+
+
+# ============================================================================
+# SHOPPING LIST GENERATION / ФОРМИРОВАНИЕ СПИСКА ПОКУПОК
+# ============================================================================
+
+async def send_shopping_list(
+    update: Update,
+    context: CallbackContext,
+    user_id: int
+) -> None:
+    """Формирует и отправляет общий список всем членам домохозяйства"""
+    household = get_household(user_id)
+    
+    # Под блокировкой списка - только снимок и текст сообщений: рассылка
+    # идет по сети с повторами, и клики участников ее не ждут
+    async with HOUSEHOLDS.lock(household):
+        user_products = get_user_selected_products(user_id)
+        count = len(user_products)
+        # В режимах edit/diff опустевший список тоже публикуется: иначе
+        # в чатах так и остались бы сообщения со старым списком
+        publish = count > 0 or (
+            LIST_DELIVERY_MODE != "send"
+            and bool(delivered_lists.get(household.id))
+        )
+        if publish:
+            previous = None
+            if LIST_DELIVERY_MODE == "diff":
+                previous = published_lists.get(household.id)
+            messages = render_shopping_list(
+                CATALOG, user_products, previous=previous
+            )
+            if LIST_DELIVERY_MODE == "send":
+                # Список очищается после отправки (в режимах edit/diff
+                # он остается и дальше обновляется в тех же сообщениях)
+                reset_user_selected_products(user_id)
+            else:
+                published_lists[household.id] = Selection(
+                    len(CATALOG), user_products.to_bytes()
+                )
+    
+    if not publish:
+        await edit_query_message(
+            update.callback_query,
+            "❌ Ви не обрали жодного продукту."
+        )
+        return
+    
+    broadcast_bot = BROADCAST_BOT or context.bot
+    if LIST_DELIVERY_MODE == "send":
+        # Отправляем список всем членам домохозяйства параллельно
+        # (с учетом лимитов)
+        results = await BROADCASTER.send(
+            broadcast_bot, household.members, messages, parse_mode="Markdown"
+        )
+    else:
+        # Прошлые сообщения со списком редактируются на месте. Рассылки
+        # одного домохозяйства идут по очереди в порядке снимков: иначе
+        # две параллельные отправили бы новые сообщения дважды
+        async with HOUSEHOLDS.delivery_lock(household):
+            results = await BROADCASTER.publish(
+                broadcast_bot, household.members, messages,
+                delivered_lists.setdefault(household.id, {}),
+                parse_mode="Markdown"
+            )
+    
+    success_count = 0
+    for result in results:
+        if result.ok:
+            success_count += 1
+            if result.unchanged:
+                logger.info(
+                    f"Shopping list of user {result.chat_id} is up to date"
+                )
+            elif result.edited:
+                logger.info(f"Shopping list updated for user {result.chat_id}")
+            else:
+                logger.info(f"Shopping list sent to user {result.chat_id}")
+        else:
+            logger.error(
+                f"Failed to send shopping list to user {result.chat_id}: "
+                f"{result.error}"
+            )
+    
+    # Подтверждаем отправку
+    await edit_query_message(
+        update.callback_query,
+        f"✅ Список покупок оновлений та надісланий "
+        f"{success_count} членам сім'ї!"
+    )
+    logger.info(f"User {user_id} completed shopping list with {count} items")
+
+
+# ============================================================================
+# APPLICATION LIFECYCLE / ЖИЗНЕННЫЙ ЦИКЛ ПРИЛОЖЕНИЯ
+# ============================================================================
+
+async def track_first_response(
+    update: Update,
+    context: CallbackContext
+) -> None:
+    """Отмечает конец обработки первого обновления после запуска"""
+    STARTUP.mark_first_response()
+
+
+async def post_init(app: Application) -> None:
+    """Запускает фоновую запись списков и слежение за каталогом"""
+    await STORE.start()
+    await RELOADER.start()
+    await selected_products.start()
+    if BROADCAST_BOT is not None:
+        # Только пул соединений: getMe уже выполнил основной бот
+        await BROADCAST_BOT.request.initialize()
+
+
+async def post_stop(app: Application) -> None:
+    """Отправляет отложенные правки, пока клиент Bot API еще открыт"""
+    await EDITS.drain()
+
+
+async def post_shutdown(app: Application) -> None:
+    """Дописывает несохраненные изменения перед остановкой"""
+    await RELOADER.close()
+    await selected_products.close()
+    await STORE.close()
+    if BROADCAST_BOT is not None:
+        await BROADCAST_BOT.request.shutdown()
+
+
+# ============================================================================
+# MAIN APPLICATION / ОСНОВНАЯ ФУНКЦИЯ
+# ============================================================================
+
+def main() -> None:
+    """Основная функция запуска бота в режиме webhook на Render"""
+    global BROADCAST_BOT
+
+    try:
+        app = (
+            Application.builder()
+            .token(TOKEN)
+            .base_url(BOT_API_URL)
+            .request(make_request(INTERACTIVE_API_POOL))
+            # getUpdates не используется, но клиент для него создается
+            .get_updates_request(make_request(INTERACTIVE_API_POOL))
+            .concurrent_updates(SCHEDULER)
+            # Webhook-сервер свой (см. webserver.py), Updater не нужен
+            .updater(None)
+            .post_init(post_init)
+            .post_stop(post_stop)
+            .post_shutdown(post_shutdown)
+            .build()
+        )
+        BROADCAST_BOT = Bot(
+            TOKEN,
+            base_url=BOT_API_URL,
+            request=make_request(BROADCAST_API_POOL),
+            get_updates_request=make_request(BROADCAST_API_POOL)
+        )
+        # Каждый обработчик оборачивается сбором метрик
+        app.add_handler(
+            CommandHandler("start", instrument_handler("start", start))
+        )
+        app.add_handler(
+            CommandHandler("clear", instrument_handler("clear", clear_list))
+        )
+        app.add_handler(
+            CommandHandler("stats", instrument_handler("stats", show_stats))
+        )
+        app.add_handler(
+            CommandHandler(
+                "reload", instrument_handler("reload", reload_catalog)
+            )
+        )
+        app.add_handler(
+            CommandHandler("find", instrument_handler("find", find_products))
+        )
+        app.add_handler(InlineQueryHandler(
+            instrument_handler("inline_search", inline_search)
+        ))
+        app.add_handler(CallbackQueryHandler(
+            instrument_handler("button_handler", button_handler)
+        ))
+        # Группа 1 выполняется после основного обработчика обновления
+        app.add_handler(TypeHandler(Update, track_first_response), group=1)
+        STARTUP.mark("setup")
+
+        logger.info("=" * 50)
+        logger.info("Бот для составления списков покупок успешно запущен (в режиме веб-перехватчика)!")
+        logger.info(
+            f"Домохозяйств: {len(HOUSEHOLDS)}, "
+            f"пользователей: {HOUSEHOLDS.users}"
+        )
+        logger.info(f"Загружено категорий: {len(CATALOG.categories)}")
+        logger.info("=" * 50)
+
+        # --- Render webhook config ---
+        render_url = os.getenv("RENDER_EXTERNAL_URL")
+        if not render_url:
+            raise RuntimeError("RENDER_EXTERNAL_URL is not set")
+
+        port = int(os.getenv("PORT", "10000"))
+        webhook_path = "/webhook"
+        webhook_url = f"{render_url}{webhook_path}"
+
+        logger.info(f"Используется URL веб-перехватчика: {webhook_url} на порту {port}")
+
+        # Свой сервер вместо run_webhook: рядом с /webhook отдается /metrics
+        asyncio.run(serve_webhook(
+            app,
+            listen="0.0.0.0",
+            port=port,
+            webhook_path=webhook_path,
+            webhook_url=webhook_url,
+            allowed_updates=Update.ALL_TYPES,
+            # Списки переживают перезапуск, поэтому клики, накопившиеся
+            # за время сна сервиса, обрабатываем, а не выбрасываем
+            drop_pending_updates=False,
+            secret_token=WEBHOOK_SECRET,
+            ingress=INGRESS,
+            startup=STARTUP,
+        ))
+
+    except Exception as e:
+        logger.error(f"Не удалось запустить бота: {e}")
+        raise
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,396 @@
+"""
+Broadcast engine
+Параллельная рассылка сообщений с ограничением скорости
+
+Сообщения получателям отправляются одновременно (не более max_concurrency
+получателей за раз), каждое обращение к API проходит через два
+token bucket: общий для бота (по умолчанию 30 сообщений/с) и отдельный
+для каждого чата (1 сообщение/с с небольшим запасом на серию).
+RetryAfter от Telegram приостанавливает общий лимит на указанное время,
+сетевые ошибки повторяются с экспоненциальной задержкой. Результат
+доставки возвращается отдельно для каждого получателя.
+
+publish() обновляет ранее доставленные сообщения на месте: части, хеш
+которых не изменился, пропускаются, измененные редактируются
+(edit_message_text), а новое сообщение отправляется, только если старое
+отредактировать нельзя или частей стало больше.
+"""
+
+import asyncio
+import hashlib
+import logging
+import time
+from datetime import timedelta
+from typing import (
+    Dict,
+    Iterable,
+    List,
+    MutableMapping,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple
+)
+
+from telegram import Bot
+from telegram.error import (
+    BadRequest,
+    Forbidden,
+    NetworkError,
+    RetryAfter,
+    TimedOut
+)
+
+logger = logging.getLogger(__name__)
+
+# Лимиты Telegram Bot API для рассылки
+GLOBAL_RATE = 30.0
+PER_CHAT_RATE = 1.0
+PER_CHAT_BURST = 3
+
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+
+# Сколько бакетов чатов держать, прежде чем удалять простаивающие
+_MAX_IDLE_CHAT_BUCKETS = 1024
+
+
+# ============================================================================
+# RATE LIMITING / ОГРАНИЧЕНИЕ СКОРОСТИ
+# ============================================================================
+
+class TokenBucket:
+    """Асинхронный token bucket: rate токенов в секунду, запас capacity"""
+
+    __slots__ = ("rate", "capacity", "_tokens", "_updated", "_paused_until")
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    @property
+    def idle(self) -> bool:
+        """True, если бакет полон (им давно не пользовались)"""
+        self._refill(time.monotonic())
+        return self._tokens >= self.capacity
+
+    def pause(self, seconds: float) -> None:
+        """Запрещает выдачу токенов на seconds секунд"""
+        self._paused_until = max(
+            self._paused_until, time.monotonic() + seconds
+        )
+
+    async def acquire(self) -> None:
+        """Ожидает и забирает один токен"""
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            self._refill(now)
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class RateLimiter:
+    """Общий лимит бота плюс отдельные лимиты для каждого чата"""
+
+    def __init__(
+        self,
+        global_rate: float = GLOBAL_RATE,
+        per_chat_rate: float = PER_CHAT_RATE,
+        per_chat_burst: int = PER_CHAT_BURST
+    ) -> None:
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self._chats: Dict[int, TokenBucket] = {}
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= _MAX_IDLE_CHAT_BUCKETS:
+                self._chats = {
+                    key: value for key, value in self._chats.items()
+                    if not value.idle
+                }
+            bucket = TokenBucket(self.per_chat_rate, self.per_chat_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    async def acquire(self, chat_id: int) -> None:
+        """Ожидает разрешения на отправку сообщения в чат"""
+        await self._chat_bucket(chat_id).acquire()
+        await self.global_bucket.acquire()
+
+    def pause(self, seconds: float) -> None:
+        """Приостанавливает все отправки (после RetryAfter)"""
+        self.global_bucket.pause(seconds)
+
+
+# ============================================================================
+# BROADCAST / РАССЫЛКА
+# ============================================================================
+
+class DeliveryResult(NamedTuple):
+    """Результат доставки сообщений одному получателю"""
+    chat_id: int
+    ok: bool
+    message_ids: List[int]
+    attempts: int
+    error: Optional[str] = None
+    # Сколько сообщений отредактировано на месте (publish)
+    edited: int = 0
+    # Сообщения уже были актуальны, запросов к API не было (publish)
+    unchanged: bool = False
+
+
+class Delivered(NamedTuple):
+    """Сообщения, доставленные получателю, и хеши их содержимого"""
+    message_ids: Tuple[int, ...]
+    digests: Tuple[str, ...]
+
+
+def content_digest(text: str) -> str:
+    """Короткий хеш текста сообщения"""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _not_modified(error: BadRequest) -> bool:
+    """Telegram отвечает ошибкой на правку без изменений"""
+    return "not modified" in error.message.lower()
+
+
+def _attempts_of(error: BaseException) -> int:
+    """Сколько обращений к API сделано до ошибки (см. Broadcaster._call)"""
+    return getattr(error, "attempts", 0)
+
+
+def _seconds(value) -> float:
+    """Переводит retry_after (int или timedelta) в секунды"""
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return float(value)
+
+
+class Broadcaster:
+    """Рассылает сообщения нескольким получателям параллельно"""
+
+    def __init__(
+        self,
+        limiter: Optional[RateLimiter] = None,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        backoff: float = DEFAULT_BACKOFF
+    ) -> None:
+        self.limiter = limiter or RateLimiter()
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+    async def _call(self, method, chat_id: int, **kwargs):
+        """Вызывает метод API для чата с учетом лимитов и повторов"""
+        attempt = 0
+        try:
+            while True:
+                attempt += 1
+                await self.limiter.acquire(chat_id)
+                try:
+                    result = await method(chat_id=chat_id, **kwargs)
+                    return result, attempt
+                except (BadRequest, Forbidden):
+                    # Постоянные ошибки не повторяются (BadRequest в PTB -
+                    # подкласс NetworkError)
+                    raise
+                except RetryAfter as e:
+                    delay = _seconds(e.retry_after)
+                    logger.warning(
+                        f"Flood control for chat {chat_id}: {delay}s"
+                    )
+                    self.limiter.pause(delay)
+                    if attempt > self.max_retries:
+                        raise
+                except (TimedOut, NetworkError):
+                    if attempt > self.max_retries:
+                        raise
+                    await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+        except Exception as e:
+            # Число обращений нужно результату доставки и при ошибке
+            e.attempts = attempt
+            raise
+
+    async def _send_one(self, bot: Bot, chat_id: int, **kwargs):
+        """Отправляет одно сообщение с учетом лимитов и повторов"""
+        return await self._call(bot.send_message, chat_id, **kwargs)
+
+    async def _edit_one(
+        self,
+        bot: Bot,
+        chat_id: int,
+        message_id: int,
+        **kwargs
+    ) -> Tuple[bool, int]:
+        """Редактирует сообщение; False, если его уже не изменить"""
+        try:
+            _, attempts = await self._call(
+                bot.edit_message_text, chat_id,
+                message_id=message_id, **kwargs
+            )
+        except BadRequest as e:
+            if _not_modified(e):
+                return True, _attempts_of(e)
+            # Сообщение удалено или слишком старое - отправим новое
+            logger.info(f"Cannot edit message {message_id} in {chat_id}: {e}")
+            return False, _attempts_of(e)
+        return True, attempts
+
+    async def _deliver(
+        self,
+        bot: Bot,
+        chat_id: int,
+        messages: Sequence[str],
+        semaphore: asyncio.Semaphore,
+        **kwargs
+    ) -> DeliveryResult:
+        """Отправляет все части одному получателю по порядку"""
+        message_ids: List[int] = []
+        attempts = 0
+        async with semaphore:
+            try:
+                for text in messages:
+                    message, tries = await self._send_one(
+                        bot, chat_id, text=text, **kwargs
+                    )
+                    attempts += tries
+                    message_ids.append(message.message_id)
+            except Exception as e:
+                return DeliveryResult(
+                    chat_id, False, message_ids,
+                    attempts + _attempts_of(e), str(e)
+                )
+        return DeliveryResult(chat_id, True, message_ids, attempts)
+
+    async def send(
+        self,
+        bot: Bot,
+        chat_ids: Iterable[int],
+        messages: Sequence[str],
+        **kwargs
+    ) -> List[DeliveryResult]:
+        """Рассылает messages всем chat_ids; kwargs передаются send_message"""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        return list(await asyncio.gather(*(
+            self._deliver(bot, chat_id, messages, semaphore, **kwargs)
+            for chat_id in chat_ids
+        )))
+
+    async def _update(
+        self,
+        bot: Bot,
+        chat_id: int,
+        messages: Sequence[str],
+        digests: Tuple[str, ...],
+        previous: Optional[Delivered],
+        semaphore: asyncio.Semaphore,
+        **kwargs
+    ) -> DeliveryResult:
+        """Обновляет сообщения одного получателя на месте"""
+        if previous is not None and previous.digests == digests:
+            return DeliveryResult(
+                chat_id, True, list(previous.message_ids), 0, unchanged=True
+            )
+
+        old_ids = previous.message_ids if previous else ()
+        old_digests = previous.digests if previous else ()
+        message_ids: List[int] = []
+        attempts = 0
+        edited = 0
+        editable = True
+        async with semaphore:
+            try:
+                for index, text in enumerate(messages):
+                    # Пока старые части редактируются, порядок сообщений
+                    # сохраняется; после первой неудачи - только новые
+                    if editable and index < len(old_ids):
+                        if old_digests[index] == digests[index]:
+                            message_ids.append(old_ids[index])
+                            continue
+                        ok, tries = await self._edit_one(
+                            bot, chat_id, old_ids[index], text=text, **kwargs
+                        )
+                        attempts += tries
+                        if ok:
+                            message_ids.append(old_ids[index])
+                            edited += 1
+                            continue
+                        editable = False
+                    message, tries = await self._send_one(
+                        bot, chat_id, text=text, **kwargs
+                    )
+                    attempts += tries
+                    message_ids.append(message.message_id)
+
+                # Лишние старые части (список стал короче или был заменен)
+                for message_id in old_ids:
+                    if message_id not in message_ids:
+                        try:
+                            _, tries = await self._call(
+                                bot.delete_message, chat_id,
+                                message_id=message_id
+                            )
+                            attempts += tries
+                        except BadRequest as e:
+                            attempts += _attempts_of(e)
+                            logger.info(
+                                f"Cannot delete message {message_id} "
+                                f"in {chat_id}: {e}"
+                            )
+            except Exception as e:
+                return DeliveryResult(
+                    chat_id, False, message_ids,
+                    attempts + _attempts_of(e), str(e), edited
+                )
+        return DeliveryResult(
+            chat_id, True, message_ids, attempts, None, edited
+        )
+
+    async def publish(
+        self,
+        bot: Bot,
+        chat_ids: Iterable[int],
+        messages: Sequence[str],
+        delivered: MutableMapping[int, Delivered],
+        **kwargs
+    ) -> List[DeliveryResult]:
+        """Обновляет доставленные ранее сообщения и запоминает новые"""
+        digests = tuple(content_digest(text) for text in messages)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        results = list(await asyncio.gather(*(
+            self._update(
+                bot, chat_id, messages, digests,
+                delivered.get(chat_id), semaphore, **kwargs
+            )
+            for chat_id in chat_ids
+        )))
+        for result in results:
+            if result.ok:
+                delivered[result.chat_id] = Delivered(
+                    tuple(result.message_ids), digests
+                )
+            else:
+                # Что именно осталось в чате, неизвестно - в следующий раз
+                # получатель получит список заново
+                delivered.pop(result.chat_id, None)
+        return results
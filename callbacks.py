@@ -0,0 +1,189 @@
+"""
+Compact callback_data codec
+Компактное кодирование callback_data для inline-кнопок
+
+Формат: <версия протокола><опкод><тег каталога><ID в base36>
+
+    "2c03f9k5"   - категория 5 в каталоге с тегом "03f9k"
+    "2t03f9ka1"  - переключение продукта 361
+    "2d03f9k"    - "Готово" (без аргумента)
+
+Вместо названий продуктов (несколько байт на символ в UTF-8) кнопка несет
+несколько ASCII-символов, что далеко от лимита Telegram в 64 байта.
+Тег каталога позволяет дешево отбросить кнопки, созданные для старой
+версии каталога, а версия протокола - кнопки старого формата. Тег
+выводится из хеша каталога; если он совпал с тегом текущей или недавней
+версии, install_catalog заменяет его соседним свободным (assign_unique_tag):
+иначе старые кнопки декодировались бы по новому каталогу.
+"""
+
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, NamedTuple, Optional
+
+from catalog import CompiledCatalog
+
+# Версия формата callback_data (меняется при несовместимых изменениях)
+PROTOCOL_VERSION = "2"
+
+# Максимальная длина callback_data в Telegram (в байтах)
+MAX_CALLBACK_BYTES = 64
+
+_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+_TAG_LENGTH = 5
+_TAG_SPACE = 36 ** _TAG_LENGTH
+_HEADER_LENGTH = 2 + _TAG_LENGTH
+
+# ============================================================================
+# OPCODES / КОДЫ ОПЕРАЦИЙ
+# ============================================================================
+
+OP_CATEGORY = "c"   # открыть категорию (аргумент - ID категории)
+OP_SCREEN = "s"     # открыть подкатегорию (аргумент - ID экрана)
+OP_TOGGLE = "t"     # выбрать/снять продукт (аргумент - ID продукта)
+OP_BACK = "b"       # назад к подкатегориям (аргумент - ID категории)
+OP_HOME = "h"       # назад к списку категорий
+OP_DONE = "d"       # завершить выбор и отправить список
+OP_PAGE = "p"       # страница экрана продуктов (аргумент - ID продукта)
+
+# Для опкодов с аргументом - функция, возвращающая верхнюю границу ID
+_ARG_LIMITS: Dict[str, Callable[[CompiledCatalog], int]] = {
+    OP_CATEGORY: lambda catalog: len(catalog.categories),
+    OP_SCREEN: lambda catalog: len(catalog.screens),
+    OP_TOGGLE: lambda catalog: len(catalog.products),
+    OP_BACK: lambda catalog: len(catalog.categories),
+    OP_PAGE: lambda catalog: len(catalog.products),
+}
+_NO_ARG_OPS = frozenset({OP_HOME, OP_DONE})
+
+
+class Callback(NamedTuple):
+    """Декодированная callback_data"""
+    op: str
+    arg: Optional[int] = None
+
+
+# ============================================================================
+# ENCODING / КОДИРОВАНИЕ
+# ============================================================================
+
+def to_base36(value: int) -> str:
+    """Переводит неотрицательное число в base36"""
+    if value < 0:
+        raise ValueError(f"Negative ID cannot be encoded: {value}")
+    digits = []
+    while True:
+        value, rem = divmod(value, 36)
+        digits.append(_DIGITS[rem])
+        if not value:
+            return "".join(reversed(digits))
+
+
+# Версия каталога -> тег, замененный из-за совпадения с другой версией
+_REASSIGNED_TAGS: Dict[str, str] = {}
+
+
+def catalog_tag(catalog: CompiledCatalog) -> str:
+    """Короткий тег версии каталога для callback_data"""
+    tag = _REASSIGNED_TAGS.get(catalog.version)
+    return tag if tag is not None else _tag_for_version(catalog.version)
+
+
+def _format_tag(value: int) -> str:
+    return to_base36(value % _TAG_SPACE).rjust(_TAG_LENGTH, "0")
+
+
+@lru_cache(maxsize=16)
+def _tag_for_version(version: str) -> str:
+    return _format_tag(int(version or "0", 16))
+
+
+def assign_unique_tag(
+    catalog: CompiledCatalog,
+    others: Iterable[CompiledCatalog]
+) -> bool:
+    """Делает тег каталога отличным от тегов других версий; True - сменен"""
+    # Одинаковая версия - одинаковые ID, такой тег можно разделить
+    taken = {
+        catalog_tag(other) for other in others
+        if other.version != catalog.version
+    }
+    tag = catalog_tag(catalog)
+    if tag not in taken:
+        return False
+    value = int(tag, 36)
+    while tag in taken:
+        value += 1
+        tag = _format_tag(value)
+    _REASSIGNED_TAGS[catalog.version] = tag
+    return True
+
+
+def encode(catalog: CompiledCatalog, op: str, arg: Optional[int] = None) -> str:
+    """Кодирует операцию в callback_data"""
+    if op in _NO_ARG_OPS:
+        if arg is not None:
+            raise ValueError(f"Opcode {op!r} takes no argument")
+        return f"{PROTOCOL_VERSION}{op}{catalog_tag(catalog)}"
+    if op not in _ARG_LIMITS or arg is None:
+        raise ValueError(f"Unknown opcode or missing argument: {op!r}")
+    return f"{PROTOCOL_VERSION}{op}{catalog_tag(catalog)}{to_base36(arg)}"
+
+
+# ============================================================================
+# DECODING / ДЕКОДИРОВАНИЕ
+# ============================================================================
+
+def decode(data: Optional[str], catalog: CompiledCatalog) -> Optional[Callback]:
+    """Декодирует callback_data; возвращает None для чужих/устаревших данных"""
+    if not data or len(data) < _HEADER_LENGTH or data[0] != PROTOCOL_VERSION:
+        return None
+    if data[2:_HEADER_LENGTH] != catalog_tag(catalog):
+        return None
+
+    op = data[1]
+    raw = data[_HEADER_LENGTH:]
+    if op in _NO_ARG_OPS:
+        return Callback(op) if not raw else None
+
+    limit = _ARG_LIMITS.get(op)
+    if limit is None or not (raw.isascii() and raw.isalnum()):
+        return None
+    arg = int(raw, 36)
+    if arg >= limit(catalog):
+        return None
+    # "Назад" ведет к подкатегориям: у категории без них такой кнопки нет
+    if op == OP_BACK and not catalog.category(arg).has_subcategories:
+        return None
+    return Callback(op, arg)
+
+
+# ============================================================================
+# CATALOG VERSIONS / ВЕРСИИ КАТАЛОГА
+# ============================================================================
+
+def payload_tag(data: Optional[str]) -> Optional[str]:
+    """Тег каталога, для которого была создана callback_data"""
+    if not data or len(data) < _HEADER_LENGTH or data[0] != PROTOCOL_VERSION:
+        return None
+    return data[2:_HEADER_LENGTH]
+
+
+def translate(
+    callback: Callback,
+    source: CompiledCatalog,
+    target: CompiledCatalog
+) -> Optional[Callback]:
+    """Переводит аргумент из одной версии каталога в другую по названиям"""
+    if callback.arg is None or source is target:
+        return callback
+
+    if callback.op in (OP_TOGGLE, OP_PAGE):
+        moved = target.product_by_key(source.product_key(callback.arg))
+    elif callback.op == OP_SCREEN:
+        screen = source.screen(callback.arg)
+        moved = target.screen_by_path(screen.category, screen.subcategory)
+    else:
+        moved = target.category_by_name(source.category(callback.arg).name)
+        if callback.op == OP_BACK and moved and not moved.has_subcategories:
+            moved = None
+    return None if moved is None else Callback(callback.op, moved.id)
@@ -0,0 +1,257 @@
+"""
+Compiled product catalog
+Скомпилированный каталог продуктов с обратными индексами
+
+Исходный каталог (словарь категорий из JSON/YAML-файла) компилируется
+в неизменяемую структуру: каждому продукту, категории и экрану присваивается
+стабильный числовой ID, а поиск "продукт -> категория/подкатегория" и
+"подкатегория -> родитель" выполняется за O(1).
+"""
+
+import hashlib
+import json
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+from telegram.helpers import escape_markdown
+
+# Исходный формат каталога: категория -> список продуктов
+# или категория -> {подкатегория -> список продуктов}
+CatalogSource = Dict[str, Union[list, dict]]
+
+# Стабильный ключ продукта: (категория, подкатегория, название)
+ProductKey = Tuple[str, Optional[str], str]
+
+
+# ============================================================================
+# CATALOG RECORDS / ЗАПИСИ КАТАЛОГА
+# ============================================================================
+
+class Product(NamedTuple):
+    """Продукт каталога"""
+    id: int
+    name: str
+    screen_id: int
+    # Название, экранированное для parse_mode="Markdown" (один раз при сборке)
+    markdown: str
+
+
+class Screen(NamedTuple):
+    """Экран со списком продуктов (простая категория или подкатегория)"""
+    id: int
+    category_id: int
+    category: str
+    subcategory: Optional[str]
+    start: int
+    stop: int
+
+    @property
+    def product_ids(self) -> range:
+        """ID продуктов экрана (идут подряд в порядке каталога)"""
+        return range(self.start, self.stop)
+
+
+class Category(NamedTuple):
+    """Категория верхнего уровня"""
+    id: int
+    name: str
+    screen_ids: Tuple[int, ...]
+    has_subcategories: bool
+
+
+# ============================================================================
+# COMPILED CATALOG / СКОМПИЛИРОВАННЫЙ КАТАЛОГ
+# ============================================================================
+
+class CompiledCatalog:
+    """Неизменяемый каталог с индексами для быстрого поиска"""
+
+    __slots__ = (
+        "categories", "screens", "products", "version",
+        "_category_by_name", "_product_by_key", "_screen_by_path",
+    )
+
+    def __init__(
+        self,
+        categories: Tuple[Category, ...],
+        screens: Tuple[Screen, ...],
+        products: Tuple[Product, ...],
+        version: str = ""
+    ) -> None:
+        self.categories = categories
+        self.screens = screens
+        self.products = products
+        # Хеш содержимого исходного каталога (меняется при любой правке)
+        self.version = version
+        self._category_by_name: Dict[str, int] = {
+            category.name: category.id for category in categories
+        }
+        self._product_by_key: Dict[ProductKey, int] = {
+            self.product_key(product.id): product.id for product in products
+        }
+        self._screen_by_path: Dict[Tuple[str, Optional[str]], int] = {
+            (screen.category, screen.subcategory): screen.id
+            for screen in screens
+        }
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def category(self, category_id: int) -> Category:
+        """Возвращает категорию по ID"""
+        return self.categories[category_id]
+
+    def category_by_name(self, name: str) -> Optional[Category]:
+        """Возвращает категорию по названию"""
+        category_id = self._category_by_name.get(name)
+        return None if category_id is None else self.categories[category_id]
+
+    def screen(self, screen_id: int) -> Screen:
+        """Возвращает экран по ID"""
+        return self.screens[screen_id]
+
+    def screen_by_path(
+        self,
+        category: str,
+        subcategory: Optional[str]
+    ) -> Optional[Screen]:
+        """Возвращает экран по названиям категории и подкатегории"""
+        screen_id = self._screen_by_path.get((category, subcategory))
+        return None if screen_id is None else self.screens[screen_id]
+
+    def product(self, product_id: int) -> Product:
+        """Возвращает продукт по ID"""
+        return self.products[product_id]
+
+    def locate(self, product_id: int) -> Screen:
+        """Возвращает экран (категорию/подкатегорию), где находится продукт"""
+        return self.screens[self.products[product_id].screen_id]
+
+    def parent(self, screen_id: int) -> Category:
+        """Возвращает родительскую категорию экрана"""
+        return self.categories[self.screens[screen_id].category_id]
+
+    def product_key(self, product_id: int) -> ProductKey:
+        """Возвращает стабильный ключ продукта"""
+        product = self.products[product_id]
+        screen = self.screens[product.screen_id]
+        return screen.category, screen.subcategory, product.name
+
+    def product_by_key(self, key: ProductKey) -> Optional[Product]:
+        """Возвращает продукт по стабильному ключу"""
+        product_id = self._product_by_key.get(key)
+        return None if product_id is None else self.products[product_id]
+
+
+def compile_catalog(source: CatalogSource) -> CompiledCatalog:
+    """Компилирует исходный словарь категорий в CompiledCatalog"""
+    categories: List[Category] = []
+    screens: List[Screen] = []
+    products: List[Product] = []
+
+    def add_screen(
+        category_id: int,
+        category: str,
+        subcategory: Optional[str],
+        items: list
+    ) -> int:
+        screen_id = len(screens)
+        start = len(products)
+        for name in items:
+            products.append(Product(
+                len(products), name, screen_id, escape_markdown(name)
+            ))
+        screens.append(Screen(
+            screen_id, category_id, category, subcategory,
+            start, len(products)
+        ))
+        return screen_id
+
+    for category_id, (name, items) in enumerate(source.items()):
+        if isinstance(items, dict):
+            screen_ids = tuple(
+                add_screen(category_id, name, subcategory, subitems)
+                for subcategory, subitems in items.items()
+            )
+            has_subcategories = True
+        else:
+            screen_ids = (add_screen(category_id, name, None, items),)
+            has_subcategories = False
+        categories.append(
+            Category(category_id, name, screen_ids, has_subcategories)
+        )
+
+    return CompiledCatalog(
+        tuple(categories), tuple(screens), tuple(products),
+        catalog_version(source)
+    )
+
+
+def catalog_version(source: CatalogSource) -> str:
+    """Вычисляет хеш содержимого исходного каталога"""
+    payload = json.dumps(source, ensure_ascii=False, sort_keys=False)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def product_id_map(
+    old: CompiledCatalog,
+    new: CompiledCatalog
+) -> List[Optional[int]]:
+    """Для каждого ID старого каталога - ID того же продукта в новом"""
+    mapping: List[Optional[int]] = []
+    for product in old.products:
+        moved = new.product_by_key(old.product_key(product.id))
+        mapping.append(None if moved is None else moved.id)
+    return mapping
+
+
+# ============================================================================
+# CATALOG FILES / ФАЙЛЫ КАТАЛОГА
+# ============================================================================
+
+def validate_source(source: object) -> CatalogSource:
+    """Проверяет структуру исходного каталога; ValueError при ошибке"""
+    if not isinstance(source, dict) or not source:
+        raise ValueError("Catalog must be a non-empty mapping of categories")
+
+    def check_items(path: str, items: object) -> None:
+        if not isinstance(items, list) or not items:
+            raise ValueError(f"{path}: expected a non-empty list of products")
+        seen = set()
+        for name in items:
+            if not isinstance(name, str) or not name.strip():
+                raise ValueError(f"{path}: invalid product name {name!r}")
+            if name in seen:
+                raise ValueError(f"{path}: duplicate product {name!r}")
+            seen.add(name)
+
+    for category, items in source.items():
+        if not isinstance(category, str) or not category.strip():
+            raise ValueError(f"Invalid category name {category!r}")
+        if isinstance(items, dict):
+            if not items:
+                raise ValueError(f"{category}: no subcategories")
+            for subcategory, subitems in items.items():
+                if not isinstance(subcategory, str) or not subcategory.strip():
+                    raise ValueError(
+                        f"{category}: invalid subcategory {subcategory!r}"
+                    )
+                check_items(f"{category}/{subcategory}", subitems)
+        else:
+            check_items(category, items)
+    return source
+
+
+def load_catalog_source(path: str) -> CatalogSource:
+    """Читает и проверяет каталог из JSON- или YAML-файла"""
+    with open(path, encoding="utf-8") as f:
+        if path.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError as e:
+                raise ValueError(
+                    "PyYAML is required to load YAML catalogs"
+                ) from e
+            source = yaml.safe_load(f)
+        else:
+            source = json.load(f)
+    return validate_source(source)
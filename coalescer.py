@@ -0,0 +1,184 @@
+"""
+Edit coalescer
+Объединение частых правок одного сообщения в одну
+
+Когда пользователь быстро отмечает несколько продуктов подряд, состояние
+меняется сразу, а правка сообщения откладывается на короткое "окно тишины":
+каждый новый клик сдвигает окно, и по его окончании отправляется только
+последняя версия клавиатуры. Правки одного сообщения выполняются строго
+по очереди, а если текст и клавиатура совпадают с последними отправленными,
+обращение к API не выполняется вовсе.
+"""
+
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from telegram import Bot, InlineKeyboardMarkup
+from telegram.error import BadRequest
+
+logger = logging.getLogger(__name__)
+
+# Окно тишины по умолчанию (в секундах)
+DEFAULT_QUIET_WINDOW = 0.3
+
+# Сколько сообщений отслеживать одновременно
+DEFAULT_MAX_TRACKED = 4096
+
+MessageKey = Tuple[int, int]
+
+
+class _MessageState:
+    """Состояние правок одного сообщения"""
+
+    __slots__ = ("lock", "signature", "bot", "kwargs", "deadline", "task")
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.signature: Optional[Tuple[str, Any]] = None
+        self.bot: Optional[Bot] = None
+        self.kwargs: Dict[str, Any] = {}
+        self.deadline = 0.0
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def busy(self) -> bool:
+        return self.task is not None or self.lock.locked()
+
+
+class EditCoalescer:
+    """Откладывает и объединяет правки сообщений по ключу (чат, сообщение)"""
+
+    def __init__(
+        self,
+        quiet_window: float = DEFAULT_QUIET_WINDOW,
+        max_tracked: int = DEFAULT_MAX_TRACKED
+    ) -> None:
+        self.quiet_window = quiet_window
+        self.max_tracked = max_tracked
+        self.sent = 0
+        self.skipped = 0
+        self.coalesced = 0
+        self._states: "OrderedDict[MessageKey, _MessageState]" = OrderedDict()
+
+    def _state(self, key: MessageKey) -> _MessageState:
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = _MessageState()
+            self._trim()
+        else:
+            self._states.move_to_end(key)
+        return state
+
+    def _trim(self) -> None:
+        """Забывает самые старые сообщения, у которых нет отложенных правок"""
+        excess = len(self._states) - self.max_tracked
+        if excess <= 0:
+            return
+        for key in list(self._states):
+            if not self._states[key].busy:
+                del self._states[key]
+                excess -= 1
+                if not excess:
+                    break
+
+    async def edit(
+        self,
+        bot: Bot,
+        chat_id: int,
+        message_id: int,
+        text: str,
+        reply_markup: Optional[InlineKeyboardMarkup] = None,
+        parse_mode: Optional[str] = None,
+        debounce: bool = False
+    ) -> None:
+        """Правит сообщение сразу или после окна тишины (debounce=True)"""
+        state = self._state((chat_id, message_id))
+        state.bot = bot
+        state.kwargs = {
+            "text": text,
+            "reply_markup": reply_markup,
+            "parse_mode": parse_mode,
+        }
+        loop = asyncio.get_running_loop()
+
+        if debounce:
+            state.deadline = loop.time() + self.quiet_window
+            if state.task is not None:
+                self.coalesced += 1
+            else:
+                state.task = loop.create_task(
+                    self._flush_later(chat_id, message_id, state)
+                )
+            return
+
+        # Немедленная правка заменяет отложенную
+        if state.task is not None:
+            self.coalesced += 1
+            state.task.cancel()
+            state.task = None
+        await self._send(chat_id, message_id, state)
+
+    async def _flush_later(
+        self,
+        chat_id: int,
+        message_id: int,
+        state: _MessageState
+    ) -> None:
+        """Ждет окончания окна тишины и отправляет последнюю версию"""
+        loop = asyncio.get_running_loop()
+        while True:
+            delay = state.deadline - loop.time()
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+        state.task = None
+        try:
+            await self._send(chat_id, message_id, state)
+        except Exception as e:
+            logger.error(
+                f"Failed to edit message {message_id} in {chat_id}: {e}"
+            )
+
+    async def _send(
+        self,
+        chat_id: int,
+        message_id: int,
+        state: _MessageState
+    ) -> None:
+        """Отправляет актуальную версию, если она отличается от последней"""
+        async with state.lock:
+            kwargs = state.kwargs
+            signature = (kwargs["text"], kwargs["reply_markup"])
+            if signature == state.signature:
+                self.skipped += 1
+                return
+            try:
+                await state.bot.edit_message_text(
+                    chat_id=chat_id, message_id=message_id, **kwargs
+                )
+            except BadRequest as e:
+                # Гонка с другой правкой: сообщение уже в нужном виде
+                if "not modified" not in str(e).lower():
+                    raise
+            state.signature = signature
+            self.sent += 1
+
+    async def drain(self) -> None:
+        """Немедленно отправляет все отложенные правки"""
+        for (chat_id, message_id), state in list(self._states.items()):
+            if state.task is not None:
+                state.task.cancel()
+                state.task = None
+                try:
+                    await self._send(chat_id, message_id, state)
+                except Exception as e:
+                    logger.error(
+                        f"Failed to edit message {message_id} in {chat_id}: {e}"
+                    )
+
+    @property
+    def pending(self) -> int:
+        """Количество сообщений с отложенными правками"""
+        return sum(1 for state in self._states.values() if state.task)
@@ -0,0 +1,308 @@
+"""
+Fake Telegram Bot API
+Локальный сервер, изображающий Telegram Bot API, для нагрузочных тестов
+
+Бот направляется на него переменной BOT_API_URL
+(http://127.0.0.1:8081/bot): запросы обрабатываются без сети, с
+настраиваемой задержкой и внедрением ошибок, поэтому настройки пулов
+соединений (см. transport.py) и рассылки можно проверять офлайн.
+
+    * задержка ответа: latency + случайная добавка до jitter секунд;
+    * error_rate - доля ответов 500, flood_rate - доля ответов 429 с
+      retry_after (как при превышении лимитов Telegram);
+    * отправленные сообщения запоминаются: правка несуществующего
+      сообщения и правка без изменений отвечают теми же ошибками 400,
+      что и настоящий Bot API;
+    * GET /stats отдает счетчики запросов и ошибок по методам (JSON).
+
+Использование:
+
+    python fakeapi.py --port 8081 --latency 0.05 --jitter 0.05
+    python fakeapi.py --error-rate 0.01 --flood-rate 0.01 --retry-after 1
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter
+from typing import Any, Dict, Optional, Tuple
+
+import tornado.web
+
+DEFAULT_PORT = 8081
+
+BOT_USER = {
+    "id": 1,
+    "is_bot": True,
+    "first_name": "Fake",
+    "username": "fake_bot",
+    "can_join_groups": True,
+    "can_read_all_group_messages": False,
+    "supports_inline_queries": True,
+}
+
+
+# Методы настройки бота: ошибки в них не внедряются, иначе бот не запустится
+_SETUP_METHODS = frozenset(
+    ("getMe", "getWebhookInfo", "setWebhook", "deleteWebhook")
+)
+
+
+class ApiError(Exception):
+    """Ответ Bot API с ошибкой"""
+
+    def __init__(
+        self,
+        code: int,
+        description: str,
+        parameters: Optional[Dict[str, Any]] = None
+    ) -> None:
+        super().__init__(description)
+        self.code = code
+        self.description = description
+        self.parameters = parameters
+
+
+class FakeBotAPI:
+    """Состояние поддельного Bot API: сообщения, webhook и счетчики"""
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        flood_rate: float = 0.0,
+        retry_after: int = 1,
+        seed: Optional[int] = None
+    ) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.requests: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.webhook: Dict[str, Any] = {"url": ""}
+        # (чат, сообщение) -> (текст, клавиатура)
+        self.messages: Dict[Tuple[int, int], Tuple[str, Any]] = {}
+        self._message_ids = itertools.count(1)
+
+    def _message(self, chat_id: int, message_id: int) -> Dict[str, Any]:
+        text, markup = self.messages[(chat_id, message_id)]
+        message = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            "text": text,
+        }
+        if markup is not None:
+            message["reply_markup"] = markup
+        return message
+
+    def _edit(self, params: Dict[str, Any], text: Optional[str]) -> Any:
+        if "inline_message_id" in params:
+            return True
+        key = (int(params["chat_id"]), int(params["message_id"]))
+        if key not in self.messages:
+            raise ApiError(400, "Bad Request: message to edit not found")
+        old_text, old_markup = self.messages[key]
+        new_text = old_text if text is None else text
+        markup = params.get("reply_markup")
+        if new_text == old_text and markup == old_markup:
+            raise ApiError(
+                400,
+                "Bad Request: message is not modified: specified new "
+                "message content and reply markup are exactly the same "
+                "as a current content and reply markup of the message"
+            )
+        self.messages[key] = (new_text, markup)
+        return self._message(*key)
+
+    def call(self, method: str, params: Dict[str, Any]) -> Any:
+        """Выполняет метод Bot API; ApiError при ошибке"""
+        if method == "getMe":
+            return BOT_USER
+        if method == "getWebhookInfo":
+            return {
+                "has_custom_certificate": False,
+                "pending_update_count": 0,
+                **self.webhook,
+            }
+        if method == "setWebhook":
+            self.webhook = {"url": params.get("url", "")}
+            if params.get("allowed_updates") is not None:
+                self.webhook["allowed_updates"] = params["allowed_updates"]
+            return True
+        if method == "deleteWebhook":
+            self.webhook = {"url": ""}
+            return True
+        if method == "sendMessage":
+            chat_id = int(params["chat_id"])
+            message_id = next(self._message_ids)
+            self.messages[(chat_id, message_id)] = (
+                params["text"], params.get("reply_markup")
+            )
+            return self._message(chat_id, message_id)
+        if method == "editMessageText":
+            return self._edit(params, params["text"])
+        if method == "editMessageReplyMarkup":
+            return self._edit(params, None)
+        if method == "deleteMessage":
+            key = (int(params["chat_id"]), int(params["message_id"]))
+            if self.messages.pop(key, None) is None:
+                raise ApiError(400, "Bad Request: message to delete not found")
+            return True
+        # answerCallbackQuery, answerInlineQuery и прочие: просто успех
+        return True
+
+    def inject(self) -> None:
+        """Случайная ошибка сервера или превышение лимита"""
+        roll = self.random.random()
+        if roll < self.flood_rate:
+            raise ApiError(
+                429,
+                f"Too Many Requests: retry after {self.retry_after}",
+                {"retry_after": self.retry_after}
+            )
+        if roll < self.flood_rate + self.error_rate:
+            raise ApiError(500, "Internal Server Error")
+
+    async def delay(self) -> None:
+        """Задержка ответа"""
+        seconds = self.latency + self.random.random() * self.jitter
+        if seconds > 0:
+            await asyncio.sleep(seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики запросов и ошибок по методам"""
+        return {
+            "requests": dict(self.requests),
+            "errors": dict(self.errors),
+            "messages": len(self.messages),
+        }
+
+    def application(self) -> tornado.web.Application:
+        """tornado-приложение с маршрутами Bot API и /stats"""
+        return tornado.web.Application([
+            (r"/bot([^/]+)/(\w+)", MethodHandler, {"api": self}),
+            (r"/stats/?", StatsHandler, {"api": self}),
+        ], log_function=lambda handler: None)
+
+
+def _decode(value: str) -> Any:
+    """Значение параметра формы: PTB кодирует объекты и списки в JSON"""
+    if value.startswith(("{", "[")):
+        try:
+            return json.loads(value)
+        except ValueError:
+            pass
+    return value
+
+
+class MethodHandler(tornado.web.RequestHandler):
+    """Один вызов метода Bot API (GET или POST, форма или JSON)"""
+
+    SUPPORTED_METHODS = ("GET", "POST")
+
+    def initialize(self, api: FakeBotAPI) -> None:
+        self.api = api
+
+    def _params(self) -> Dict[str, Any]:
+        content_type = self.request.headers.get("Content-Type", "")
+        if content_type.startswith("application/json"):
+            return json.loads(self.request.body or b"{}")
+        arguments = dict(self.request.query_arguments)
+        arguments.update(self.request.body_arguments)
+        return {
+            name: _decode(values[-1].decode())
+            for name, values in arguments.items()
+        }
+
+    async def post(self, token: str, method: str) -> None:
+        self.api.requests[method] += 1
+        await self.api.delay()
+        try:
+            if method not in _SETUP_METHODS:
+                self.api.inject()
+            result = self.api.call(method, self._params())
+        except ApiError as e:
+            self.api.errors[method] += 1
+            self.set_status(e.code)
+            body = {
+                "ok": False,
+                "error_code": e.code,
+                "description": e.description,
+            }
+            if e.parameters:
+                body["parameters"] = e.parameters
+            self.write(body)
+        except (KeyError, ValueError) as e:
+            self.api.errors[method] += 1
+            self.set_status(400)
+            self.write({
+                "ok": False,
+                "error_code": 400,
+                "description": f"Bad Request: invalid parameters ({e})",
+            })
+        else:
+            self.write({"ok": True, "result": result})
+
+    get = post
+
+    def log_exception(self, typ, value, tb) -> None:
+        """Ошибки уже отданы клиенту ответом"""
+
+
+class StatsHandler(tornado.web.RequestHandler):
+    """Счетчики поддельного API"""
+
+    SUPPORTED_METHODS = ("GET",)
+
+    def initialize(self, api: FakeBotAPI) -> None:
+        self.api = api
+
+    def get(self) -> None:
+        self.write(self.api.stats())
+
+
+async def serve(api: FakeBotAPI, port: int, address: str) -> None:
+    """Запускает сервер и работает до прерывания"""
+    api.application().listen(port, address=address)
+    print(f"Fake Bot API on http://{address}:{port}/bot")
+    await asyncio.Event().wait()
+
+
+def main() -> None:
+    """Точка входа командной строки"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--address", default="127.0.0.1")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--flood-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    api = FakeBotAPI(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        flood_rate=args.flood_rate,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    try:
+        asyncio.run(serve(api, args.port, args.address))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
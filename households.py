@@ -0,0 +1,129 @@
+"""
+Households
+Домохозяйства: группы пользователей с общим списком покупок
+
+Каждый пользователь входит не больше чем в одно домохозяйство. Индекс
+"пользователь -> домохозяйство" строится один раз при загрузке
+конфигурации, поэтому проверка доступа - это поиск в словаре. Изменения
+общего списка одного домохозяйства выполняются под его собственной
+asyncio-блокировкой: домохозяйства не ждут друг друга. Рассылка
+списка идет под отдельной блокировкой, чтобы клики участников не ждали
+сетевых запросов.
+
+Формат файла (JSON): {"ID домохозяйства": [ID пользователей, ...]}
+"""
+
+import asyncio
+import json
+from typing import (
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    Mapping,
+    NamedTuple,
+    Optional
+)
+
+# ID домохозяйства по умолчанию (если файл конфигурации не задан)
+DEFAULT_HOUSEHOLD_ID = "family"
+
+
+class Household(NamedTuple):
+    """Домохозяйство и его участники"""
+    id: str
+    members: FrozenSet[int]
+
+
+class HouseholdRegistry:
+    """Домохозяйства с индексом по пользователям и блокировками"""
+
+    def __init__(self, households: Iterable[Household]) -> None:
+        self._households: Dict[str, Household] = {}
+        self._by_user: Dict[int, Household] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._delivery_locks: Dict[str, asyncio.Lock] = {}
+        for household in households:
+            if household.id in self._households:
+                raise ValueError(f"Duplicate household: {household.id}")
+            self._households[household.id] = household
+            for user_id in household.members:
+                other = self._by_user.setdefault(user_id, household)
+                if other is not household:
+                    raise ValueError(
+                        f"User {user_id} belongs to households "
+                        f"{other.id} and {household.id}"
+                    )
+
+    @classmethod
+    def from_mapping(
+        cls,
+        source: Mapping[str, Iterable[int]]
+    ) -> "HouseholdRegistry":
+        """Создает реестр из словаря ID домохозяйства -> ID участников"""
+        households = []
+        for household_id, members in source.items():
+            if not isinstance(household_id, str) or not household_id.strip():
+                raise ValueError(f"Invalid household ID {household_id!r}")
+            if isinstance(members, (str, bytes)) or not all(
+                isinstance(user_id, int) for user_id in members
+            ):
+                raise ValueError(
+                    f"{household_id}: expected a list of user IDs"
+                )
+            households.append(Household(household_id, frozenset(members)))
+        return cls(households)
+
+    def household_of(self, user_id: int) -> Optional[Household]:
+        """Домохозяйство пользователя; None - доступа нет"""
+        return self._by_user.get(user_id)
+
+    def get(self, household_id: str) -> Optional[Household]:
+        """Домохозяйство по ID"""
+        return self._households.get(household_id)
+
+    def lock(self, household: Household) -> asyncio.Lock:
+        """Блокировка, под которой меняется общий список домохозяйства"""
+        lock = self._locks.get(household.id)
+        if lock is None:
+            lock = self._locks[household.id] = asyncio.Lock()
+        return lock
+
+    def delivery_lock(self, household: Household) -> asyncio.Lock:
+        """Блокировка, под которой рассылается список домохозяйства"""
+        lock = self._delivery_locks.get(household.id)
+        if lock is None:
+            lock = self._delivery_locks[household.id] = asyncio.Lock()
+        return lock
+
+    def busy(self, household_id: str) -> bool:
+        """True, если список домохозяйства сейчас меняется"""
+        lock = self._locks.get(household_id)
+        return lock is not None and lock.locked()
+
+    @property
+    def users(self) -> int:
+        """Количество пользователей во всех домохозяйствах"""
+        return len(self._by_user)
+
+    def __iter__(self) -> Iterator[Household]:
+        return iter(self._households.values())
+
+    def __len__(self) -> int:
+        return len(self._households)
+
+
+def load_households(
+    path: Optional[str],
+    default_members: Iterable[int] = ()
+) -> HouseholdRegistry:
+    """Читает домохозяйства из JSON-файла; без файла - одно по умолчанию"""
+    if not path:
+        return HouseholdRegistry(
+            [Household(DEFAULT_HOUSEHOLD_ID, frozenset(default_members))]
+        )
+    with open(path, encoding="utf-8") as f:
+        source = json.load(f)
+    if not isinstance(source, dict) or not source:
+        raise ValueError("Households file must be a non-empty mapping")
+    return HouseholdRegistry.from_mapping(source)
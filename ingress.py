@@ -0,0 +1,129 @@
+"""
+Webhook ingress
+Быстрый отсев входящих обновлений до построения объектов Update
+
+Каждый POST на /webhook проходит через Ingress до Update.de_json и до
+каких-либо обращений к Bot API:
+
+    1. если очередь обработки переполнена, обновление отбрасывается сразу
+       (load shedding): под нагрузкой лишняя работа только увеличивает
+       задержку для всех;
+    2. тело разбирается обычным json.loads и повторная доставка того же
+       update_id (Telegram повторяет запросы после таймаутов) отсеивается;
+    3. ID отправителя берется прямо из JSON: обновления от неизвестных
+       пользователей и обновления без отправителя отбрасываются.
+
+Проверка секретного заголовка выполняется раньше - в WebhookHandler.
+"""
+
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Set, Tuple
+
+from metrics import REGISTRY
+
+# Сколько обновлений может ждать обработки, прежде чем новые отбрасываются
+DEFAULT_MAX_BACKLOG = 512
+
+# Сколько последних update_id помнить для отсева повторных доставок
+DEFAULT_DEDUP_WINDOW = 4096
+
+# Итоги проверки обновления
+ACCEPTED = "accepted"
+SHED = "shed"
+MALFORMED = "malformed"
+DUPLICATE = "duplicate"
+UNKNOWN_SENDER = "unknown_sender"
+
+# Поля обновления, в которых есть объект с отправителем ("from")
+_SENDER_FIELDS = (
+    "callback_query",
+    "message",
+    "inline_query",
+    "edited_message",
+    "chosen_inline_result",
+    "my_chat_member",
+    "pre_checkout_query",
+    "shipping_query",
+)
+
+INGRESS_UPDATES = REGISTRY.counter(
+    "webhook_updates_total",
+    "Webhook deliveries by ingress verdict",
+    ("result",)
+)
+
+
+def sender_id(data: Dict[str, Any]) -> Optional[int]:
+    """ID пользователя, от которого пришло обновление (по сырому JSON)"""
+    for field in _SENDER_FIELDS:
+        payload = data.get(field)
+        if payload is not None:
+            sender = payload.get("from")
+            if isinstance(sender, dict):
+                user_id = sender.get("id")
+                return user_id if isinstance(user_id, int) else None
+            return None
+    return None
+
+
+class Ingress:
+    """Отсев обновлений: перегрузка, повторы, неизвестные отправители"""
+
+    def __init__(
+        self,
+        is_allowed: Callable[[int], bool],
+        backlog: Callable[[], int] = lambda: 0,
+        max_backlog: int = DEFAULT_MAX_BACKLOG,
+        dedup_window: int = DEFAULT_DEDUP_WINDOW
+    ) -> None:
+        self.is_allowed = is_allowed
+        self.backlog = backlog
+        self.max_backlog = max_backlog
+        self._seen: Set[int] = set()
+        self._order: Deque[int] = deque(maxlen=dedup_window)
+
+    def _remember(self, update_id: int) -> bool:
+        """Запоминает update_id; False, если он уже встречался"""
+        if update_id in self._seen:
+            return False
+        if len(self._order) == self._order.maxlen:
+            self._seen.discard(self._order[0])
+        self._order.append(update_id)
+        self._seen.add(update_id)
+        return True
+
+    def check(self, data: Any) -> str:
+        """Решение по разобранному телу запроса"""
+        if not isinstance(data, dict):
+            return MALFORMED
+        update_id = data.get("update_id")
+        if not isinstance(update_id, int):
+            return MALFORMED
+        if not self._remember(update_id):
+            return DUPLICATE
+        user_id = sender_id(data)
+        if user_id is None or not self.is_allowed(user_id):
+            return UNKNOWN_SENDER
+        return ACCEPTED
+
+    def overloaded(self) -> bool:
+        """True, если новые обновления нужно отбрасывать"""
+        return self.backlog() >= self.max_backlog
+
+    def admit(
+        self,
+        body: bytes,
+        parse: Callable[[bytes], Any]
+    ) -> Tuple[str, Any]:
+        """Проверяет тело запроса; возвращает (итог, разобранный JSON)"""
+        if self.overloaded():
+            verdict, data = SHED, None
+        else:
+            try:
+                data = parse(body)
+            except ValueError:
+                verdict, data = MALFORMED, None
+            else:
+                verdict = self.check(data)
+        INGRESS_UPDATES.inc(verdict)
+        return verdict, data
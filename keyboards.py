@@ -0,0 +1,309 @@
+"""
+Keyboard cache
+Кеш inline-клавиатур для экранов категорий, подкатегорий и продуктов
+
+Клавиатуры категорий и подкатегорий зависят только от каталога, поэтому
+строятся один раз при старте. Клавиатура экрана продуктов зависит еще и от
+того, какие продукты этого экрана выбраны. Большие экраны делятся на
+страницы по page_size продуктов в columns столбцов: клавиатура страницы
+хранится в ограниченном LRU по ключу (ID экрана, номер страницы, битовая
+маска выбранных продуктов страницы), поэтому размер клавиатуры и правки
+сообщения не зависит от размера категории.
+При смене каталога (другая версия) кеш полностью перестраивается.
+"""
+
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from callbacks import (
+    OP_BACK,
+    OP_CATEGORY,
+    OP_DONE,
+    OP_HOME,
+    OP_PAGE,
+    OP_SCREEN,
+    OP_TOGGLE,
+    encode
+)
+from catalog import CompiledCatalog, Product, Screen
+from selection import Selection
+
+# Размер LRU для клавиатур экранов продуктов по умолчанию
+DEFAULT_MAX_PRODUCT_KEYBOARDS = 1024
+
+# Продуктов на странице и столбцов кнопок по умолчанию
+DEFAULT_PAGE_SIZE = 20
+DEFAULT_COLUMNS = 2
+
+# Ключ клавиатуры страницы: (ID экрана, номер страницы, маска страницы)
+ProductsKey = Tuple[int, int, int]
+
+# Лимит Telegram на число кнопок в одной inline-клавиатуре
+MAX_KEYBOARD_BUTTONS = 100
+
+# Служебные кнопки экрана продуктов: назад/вперед, "Назад", "Готово"
+_NAVIGATION_BUTTONS = 4
+
+CHECKMARK = "✅ "
+
+
+# ============================================================================
+# KEYBOARD BUILDERS / ПОСТРОЕНИЕ КЛАВИАТУР
+# ============================================================================
+
+def _columns(
+    buttons: List[InlineKeyboardButton],
+    columns: int
+) -> List[List[InlineKeyboardButton]]:
+    """Раскладывает кнопки по columns в ряд"""
+    return [buttons[i:i + columns] for i in range(0, len(buttons), columns)]
+
+
+def _two_columns(
+    buttons: List[InlineKeyboardButton]
+) -> List[List[InlineKeyboardButton]]:
+    """Раскладывает кнопки по две в ряд"""
+    return _columns(buttons, 2)
+
+
+def page_count(screen: Screen, page_size: int) -> int:
+    """Количество страниц экрана продуктов"""
+    return max(1, -(-len(screen.product_ids) // page_size))
+
+
+def page_range(screen: Screen, page: int, page_size: int) -> range:
+    """ID продуктов на странице экрана"""
+    start = screen.start + page * page_size
+    return range(start, min(start + page_size, screen.stop))
+
+
+def build_categories_markup(catalog: CompiledCatalog) -> InlineKeyboardMarkup:
+    """Строит клавиатуру главного меню с категориями"""
+    return InlineKeyboardMarkup(_two_columns([
+        InlineKeyboardButton(
+            category.name,
+            callback_data=encode(catalog, OP_CATEGORY, category.id)
+        )
+        for category in catalog.categories
+    ]))
+
+
+def build_subcategories_markup(
+    catalog: CompiledCatalog,
+    category_id: int
+) -> InlineKeyboardMarkup:
+    """Строит клавиатуру подкатегорий с кнопкой "Назад" """
+    keyboard = _two_columns([
+        InlineKeyboardButton(
+            catalog.screen(screen_id).subcategory,
+            callback_data=encode(catalog, OP_SCREEN, screen_id)
+        )
+        for screen_id in catalog.category(category_id).screen_ids
+    ])
+    keyboard.append([
+        InlineKeyboardButton(
+            "🔙 Назад", callback_data=encode(catalog, OP_HOME)
+        )
+    ])
+    return InlineKeyboardMarkup(keyboard)
+
+
+def build_products_markup(
+    catalog: CompiledCatalog,
+    screen: Screen,
+    mask: int,
+    page: int = 0,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    columns: int = DEFAULT_COLUMNS
+) -> InlineKeyboardMarkup:
+    """Строит клавиатуру страницы; бит i маски - выбран i-й продукт страницы"""
+    buttons = []
+    for offset, product_id in enumerate(page_range(screen, page, page_size)):
+        # Добавляем галочку, если продукт уже выбран
+        mark = CHECKMARK if mask >> offset & 1 else ""
+        buttons.append(
+            InlineKeyboardButton(
+                f"{mark}{catalog.product(product_id).name}",
+                callback_data=encode(catalog, OP_TOGGLE, product_id)
+            )
+        )
+    keyboard = _columns(buttons, columns)
+
+    # Листание страниц: кнопка несет ID первого продукта нужной страницы
+    pages = page_count(screen, page_size)
+    if pages > 1:
+        row = []
+        if page > 0:
+            row.append(InlineKeyboardButton(
+                "◀️",
+                callback_data=encode(
+                    catalog, OP_PAGE, screen.start + (page - 1) * page_size
+                )
+            ))
+        if page < pages - 1:
+            row.append(InlineKeyboardButton(
+                "▶️",
+                callback_data=encode(
+                    catalog, OP_PAGE, screen.start + (page + 1) * page_size
+                )
+            ))
+        keyboard.append(row)
+
+    # Кнопки навигации
+    if screen.subcategory:
+        back_callback_data = encode(catalog, OP_BACK, screen.category_id)
+    else:
+        back_callback_data = encode(catalog, OP_HOME)
+    keyboard.append([
+        InlineKeyboardButton("🔙 Назад", callback_data=back_callback_data)
+    ])
+    keyboard.append([
+        InlineKeyboardButton(
+            "✅ Готово", callback_data=encode(catalog, OP_DONE)
+        )
+    ])
+    return InlineKeyboardMarkup(keyboard)
+
+
+def build_search_markup(
+    catalog: CompiledCatalog,
+    products: Sequence[Product],
+    selection: Selection
+) -> InlineKeyboardMarkup:
+    """Строит клавиатуру результатов поиска: продукт и его категория"""
+    keyboard = []
+    for product in products:
+        screen = catalog.screen(product.screen_id)
+        place = screen.subcategory or screen.category
+        mark = CHECKMARK if product.id in selection else ""
+        keyboard.append([
+            InlineKeyboardButton(
+                f"{mark}{product.name} · {place}",
+                callback_data=encode(catalog, OP_TOGGLE, product.id)
+            )
+        ])
+    keyboard.append([
+        InlineKeyboardButton(
+            "🔙 Категорії", callback_data=encode(catalog, OP_HOME)
+        ),
+        InlineKeyboardButton(
+            "✅ Готово", callback_data=encode(catalog, OP_DONE)
+        ),
+    ])
+    return InlineKeyboardMarkup(keyboard)
+
+
+# ============================================================================
+# KEYBOARD CACHE / КЕШ КЛАВИАТУР
+# ============================================================================
+
+class KeyboardCache:
+    """Кеш готовых InlineKeyboardMarkup, привязанный к версии каталога"""
+
+    def __init__(
+        self,
+        catalog: CompiledCatalog,
+        max_product_keyboards: int = DEFAULT_MAX_PRODUCT_KEYBOARDS,
+        page_size: int = DEFAULT_PAGE_SIZE,
+        columns: int = DEFAULT_COLUMNS
+    ) -> None:
+        if not 0 < page_size <= MAX_KEYBOARD_BUTTONS - _NAVIGATION_BUTTONS:
+            raise ValueError(f"Invalid page size: {page_size}")
+        if columns < 1:
+            raise ValueError(f"Invalid number of columns: {columns}")
+        self.max_product_keyboards = max_product_keyboards
+        self.page_size = page_size
+        self.columns = columns
+        self.hits = 0
+        self.misses = 0
+        self._products: "OrderedDict[ProductsKey, InlineKeyboardMarkup]"
+        self._products = OrderedDict()
+        self._subcategories: Dict[int, InlineKeyboardMarkup] = {}
+        self._categories: Optional[InlineKeyboardMarkup] = None
+        self.catalog = catalog
+        self.rebuild(catalog)
+
+    def rebuild(self, catalog: CompiledCatalog) -> None:
+        """Сбрасывает кеш и заново строит статические клавиатуры"""
+        self.catalog = catalog
+        self._products.clear()
+        self._categories = build_categories_markup(catalog)
+        self._subcategories = {
+            category.id: build_subcategories_markup(catalog, category.id)
+            for category in catalog.categories
+            if category.has_subcategories
+        }
+
+    def warm(self) -> None:
+        """Заранее строит первые страницы всех экранов без выбранных"""
+        for screen in self.catalog.screens[:self.max_product_keyboards]:
+            key = (screen.id, 0, 0)
+            if key not in self._products:
+                self._products[key] = build_products_markup(
+                    self.catalog, screen, 0, 0, self.page_size, self.columns
+                )
+
+    def _sync(self, catalog: CompiledCatalog) -> None:
+        """Перестраивает кеш, если каталог сменился"""
+        if catalog is self.catalog:
+            return
+        if catalog.version != self.catalog.version:
+            self.rebuild(catalog)
+        else:
+            self.catalog = catalog
+
+    def categories(self, catalog: CompiledCatalog) -> InlineKeyboardMarkup:
+        """Клавиатура главного меню"""
+        self._sync(catalog)
+        return self._categories
+
+    def subcategories(
+        self,
+        catalog: CompiledCatalog,
+        category_id: int
+    ) -> InlineKeyboardMarkup:
+        """Клавиатура подкатегорий категории"""
+        self._sync(catalog)
+        return self._subcategories[category_id]
+
+    def pages(self, screen: Screen) -> int:
+        """Количество страниц экрана"""
+        return page_count(screen, self.page_size)
+
+    def page_of(self, screen: Screen, product_id: int) -> int:
+        """Номер страницы экрана, на которой находится продукт"""
+        return (product_id - screen.start) // self.page_size
+
+    def page_products(self, screen: Screen, page: int) -> range:
+        """ID продуктов на странице экрана"""
+        return page_range(screen, page, self.page_size)
+
+    def products(
+        self,
+        catalog: CompiledCatalog,
+        screen: Screen,
+        mask: int,
+        page: int = 0
+    ) -> InlineKeyboardMarkup:
+        """Клавиатура страницы продуктов для маски выбора этой страницы"""
+        self._sync(catalog)
+        key = (screen.id, page, mask)
+        markup = self._products.get(key)
+        if markup is not None:
+            self.hits += 1
+            self._products.move_to_end(key)
+            return markup
+
+        self.misses += 1
+        markup = build_products_markup(
+            catalog, screen, mask, page, self.page_size, self.columns
+        )
+        self._products[key] = markup
+        if len(self._products) > self.max_product_keyboards:
+            self._products.popitem(last=False)
+        return markup
+
+    def __len__(self) -> int:
+        return len(self._products)
@@ -0,0 +1,1179 @@
+"""
+Webhook load test
+Сквозной нагрузочный и длительный тест webhook-сервера бота
+
+В отличие от bench.py, здесь работает настоящий процесс бота (bot.py со
+своим webhook-сервером, см. webserver.py), а Telegram изображает
+поддельный Bot API (fakeapi.py) внутри этого процесса. Множество
+симулированных пользователей шлет на /webhook конкурентные POST-запросы с
+обновлениями: /start, выбор категорий и подкатегорий, листание, отметки
+продуктов и "Готово". Нагрузка открытая: обновления отправляются с
+заданной частотой независимо от того, успевает ли бот, поэтому рост
+задержки не маскируется замедлением клиента.
+
+Частота поднимается ступенями (--rates, по --step секунд на ступень),
+пока p99 задержки не превысит --max-p99 или обновления не начнут
+теряться. Для каждой ступени выводятся:
+
+    * заданная и фактическая частота, число отправленных обновлений;
+    * задержка p50/p90/p99/max - от POST до ответа бота
+      (answerCallbackQuery для кнопок, меню для /start);
+    * потерянные обновления (ответа нет дольше ANSWER_TIMEOUT) и
+      пропущенные такты (все пользователи заняты - нужно больше --users);
+    * память процесса бота (RSS) и загрузка процессора ботом и самим
+      генератором нагрузки: если генератору не хватает ядра, предел
+      упирается в него, а не в бота.
+
+С --soak нагрузка держится на первой частоте из --rates заданное время
+окнами по --window секунд; в итогах - рост памяти за прогон и его
+оценка в час. После прогона проверяется состояние: клавиатуры меню
+должны показывать последний открытый экран с отметками, совпадающими с
+моделью списка, а список, отправленный по "Готово", - совпадать с
+render_shopping_list для модели. Проверяются домохозяйства из одного
+участника без потерянных обновлений и только без внедренных ошибок API.
+
+Использование:
+
+    python loadtest.py                                # 25, 50, 100, 200/с
+    python loadtest.py --rates 50 100 200 400 --step 20 --users 500
+    python loadtest.py --rates 50 --soak 3600 --window 60
+    python loadtest.py --mode send --household-size 2 --api-latency 0.05
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import httpx
+
+from callbacks import (
+    OP_BACK,
+    OP_CATEGORY,
+    OP_DONE,
+    OP_HOME,
+    OP_PAGE,
+    OP_SCREEN,
+    OP_TOGGLE,
+    Callback,
+    decode,
+    encode
+)
+from catalog import CompiledCatalog, compile_catalog, load_catalog_source
+from fakeapi import FakeBotAPI
+from keyboards import DEFAULT_COLUMNS, DEFAULT_PAGE_SIZE, KeyboardCache
+from render import render_shopping_list
+from selection import Selection
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BOT_SCRIPT = os.path.join(HERE, "bot.py")
+
+TOKEN = "123456:loadtest"
+SECRET = "loadtest-secret"
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+# ID первого симулированного пользователя
+BASE_USER_ID = 700_000_000
+
+# Через сколько секунд обновление без ответа считается потерянным
+ANSWER_TIMEOUT = 10.0
+
+# Сколько секунд без обращений к Bot API означает, что бот закончил работу
+QUIET_PERIOD = 1.0
+
+# Сколько ждать запуска бота
+STARTUP_TIMEOUT = 30.0
+
+# Telegram по умолчанию держит до 40 соединений с webhook
+DEFAULT_CONNECTIONS = 40
+
+MENU_TEXT = "🛍 Оберіть категорію:"
+EMPTY_LIST_TEXT = "❌ Ви не обрали жодного продукту."
+DONE_TEXT = "✅ Список покупок оновлений та надісланий {members} членам"
+
+# Вес кнопки при выборе следующего нажатия: чаще всего отмечают продукты
+OP_WEIGHTS = {
+    OP_TOGGLE: 10,
+    OP_CATEGORY: 1,
+    OP_SCREEN: 1,
+    OP_PAGE: 1,
+    OP_BACK: 1,
+    OP_HOME: 1,
+    OP_DONE: 1,
+}
+
+# Доля нажатий, после которых пользователь не ждет ответа (серия кликов)
+BURST_PROBABILITY = 0.2
+
+# Экран меню в модели: ("categories",), ("subcategories", ID категории),
+# ("products", ID экрана, страница); None - меню без клавиатуры
+ScreenState = Optional[Tuple[int, ...]]
+CATEGORIES: ScreenState = ("categories",)
+
+
+# ============================================================================
+# FAKE TELEGRAM / ПОДДЕЛЬНЫЙ TELEGRAM
+# ============================================================================
+
+class RecordingAPI(FakeBotAPI):
+    """Поддельный Bot API, который сообщает о ответах бота"""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._answers: Dict[str, asyncio.Future] = {}
+        self._menus: Dict[int, asyncio.Future] = {}
+        # Сообщения с меню в каждом чате (остальные - списки покупок)
+        self.menu_ids: Dict[int, Set[int]] = defaultdict(set)
+
+    def expect_answer(self, query_id: str) -> asyncio.Future:
+        """Future со временем ответа на нажатие кнопки"""
+        future = asyncio.get_running_loop().create_future()
+        self._answers[query_id] = future
+        return future
+
+    def expect_menu(self, chat_id: int) -> asyncio.Future:
+        """Future со временем отправки меню и ID его сообщения"""
+        future = asyncio.get_running_loop().create_future()
+        self._menus[chat_id] = future
+        return future
+
+    def forget(self, query_id: Optional[str], chat_id: int) -> None:
+        """Перестает ждать ответ (обновление не доставлено)"""
+        if query_id is None:
+            self._menus.pop(chat_id, None)
+        else:
+            self._answers.pop(query_id, None)
+
+    def call(self, method: str, params: Dict[str, Any]) -> Any:
+        result = super().call(method, params)
+        now = time.monotonic()
+        if method == "answerCallbackQuery":
+            future = self._answers.pop(str(params["callback_query_id"]), None)
+            if future is not None and not future.done():
+                future.set_result(now)
+        elif method == "sendMessage" and params["text"] == MENU_TEXT:
+            chat_id = int(params["chat_id"])
+            self.menu_ids[chat_id].add(result["message_id"])
+            future = self._menus.pop(chat_id, None)
+            if future is not None and not future.done():
+                future.set_result((now, result["message_id"]))
+        return result
+
+    def chat_messages(self) -> Dict[int, List[Tuple[int, str]]]:
+        """Сообщения, кроме меню, по чатам: (ID, текст) по порядку"""
+        chats: Dict[int, List[Tuple[int, str]]] = defaultdict(list)
+        for (chat_id, message_id), (text, _) in sorted(self.messages.items()):
+            if message_id not in self.menu_ids[chat_id]:
+                chats[chat_id].append((message_id, text))
+        return chats
+
+    @property
+    def total_requests(self) -> int:
+        return sum(self.requests.values())
+
+
+# ============================================================================
+# BOT PROCESS / ПРОЦЕСС БОТА
+# ============================================================================
+
+def free_port() -> int:
+    """Свободный TCP-порт на localhost"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def read_rss(pid: int) -> Optional[int]:
+    """Резидентная память процесса (в байтах); None без /proc"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def read_cpu(pid: int) -> Optional[float]:
+    """Процессорное время процесса (в секундах); None без /proc"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        # Поля 14 и 15 - utime и stime в тиках
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class BotProcess:
+    """bot.py в отдельном процессе, направленный на поддельный API"""
+
+    def __init__(self, env: Dict[str, str], log_path: str) -> None:
+        self.env = env
+        self.log_path = log_path
+        self.process: Optional[subprocess.Popen] = None
+
+    def start(self) -> None:
+        with open(self.log_path, "wb") as log:
+            self.process = subprocess.Popen(
+                [sys.executable, BOT_SCRIPT],
+                cwd=HERE,
+                env=self.env,
+                stdout=log,
+                stderr=subprocess.STDOUT
+            )
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def log_tail(self, lines: int = 20) -> str:
+        with open(self.log_path, encoding="utf-8", errors="replace") as f:
+            return "".join(f.readlines()[-lines:])
+
+    def log_errors(self) -> int:
+        """Количество ошибок и трассировок в логе бота"""
+        with open(self.log_path, encoding="utf-8", errors="replace") as f:
+            return sum(
+                1 for line in f
+                if " - ERROR - " in line or line.startswith("Traceback")
+            )
+
+    def stop(self, timeout: float = 15.0) -> Optional[int]:
+        """Останавливает бота как Render (SIGTERM); код завершения"""
+        if self.process is None:
+            return None
+        if self.alive():
+            self.process.send_signal(signal.SIGTERM)
+            try:
+                self.process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        return self.process.returncode
+
+
+def parse_metrics(text: str) -> Dict[str, float]:
+    """Метрики в текстовом формате Prometheus: имя{метки} -> значение"""
+    metrics = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        key, _, value = line.rpartition(" ")
+        try:
+            metrics[key] = float(value)
+        except ValueError:
+            pass
+    return metrics
+
+
+def metric_sum(
+    metrics: Dict[str, float],
+    name: str,
+    label: str = ""
+) -> float:
+    """Сумма серий метрики (с меткой label, если задана)"""
+    return sum(
+        value for key, value in metrics.items()
+        if key.split("{", 1)[0] == name and label in key
+    )
+
+
+# ============================================================================
+# SIMULATED USERS / СИМУЛИРОВАННЫЕ ПОЛЬЗОВАТЕЛИ
+# ============================================================================
+
+class SimHousehold:
+    """Домохозяйство и модель его общего списка"""
+
+    def __init__(self, household_id: str, size: int) -> None:
+        self.id = household_id
+        self.selection = Selection(size)
+        # Последний список, отправленный по "Готово", и список для diff
+        self.rendered: Optional[List[str]] = None
+        self.published: Optional[Selection] = None
+        self.members: List["SimUser"] = []
+        # False - модель могла разойтись с ботом (потерянное обновление)
+        self.exact = True
+
+
+class SimUser:
+    """Пользователь: его меню и экран, который в нем открыт"""
+
+    def __init__(self, user_id: int, household: SimHousehold) -> None:
+        self.id = user_id
+        self.household = household
+        self.menu: Optional[int] = None
+        self.screen: ScreenState = None
+
+
+class Window:
+    """Итоги одной ступени нагрузки"""
+
+    def __init__(self, rate: float, duration: float) -> None:
+        self.rate = rate
+        self.duration = duration
+        self.elapsed = 0.0
+        self.sent = 0
+        self.latencies: List[float] = []
+        self.acks: List[float] = []
+        self.lost = 0
+        self.missed = 0
+        self.http_errors = 0
+        self.rss: Optional[int] = None
+        # Доли ядра, занятые ботом и генератором нагрузки
+        self.bot_cpu: Optional[float] = None
+        self.load_cpu = 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+        acks = sorted(self.acks)
+        return {
+            "rate": self.rate,
+            "achieved": self.sent / self.elapsed if self.elapsed else 0.0,
+            "sent": self.sent,
+            "p50": percentile(latencies, 0.50),
+            "p90": percentile(latencies, 0.90),
+            "p99": percentile(latencies, 0.99),
+            "max": latencies[-1] if latencies else 0.0,
+            "ack_p99": percentile(acks, 0.99),
+            "lost": self.lost,
+            "missed": self.missed,
+            "http_errors": self.http_errors,
+            "rss": self.rss,
+            "bot_cpu": self.bot_cpu,
+            "load_cpu": self.load_cpu,
+        }
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Перцентиль по отсортированному списку (ближайший ранг)"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return float(sorted_values[index])
+
+
+def _user(user_id: int) -> Dict[str, Any]:
+    return {"id": user_id, "is_bot": False, "first_name": f"u{user_id}"}
+
+
+def _chat(user_id: int) -> Dict[str, Any]:
+    return {"id": user_id, "type": "private"}
+
+
+def command_update(update_id: int, user_id: int, command: str) -> Dict:
+    """JSON обновления с командой, как его присылает Telegram"""
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": _chat(user_id),
+            "from": _user(user_id),
+            "text": command,
+            "entities": [
+                {"type": "bot_command", "offset": 0, "length": len(command)}
+            ],
+        },
+    }
+
+
+def callback_update(
+    update_id: int,
+    user_id: int,
+    message_id: int,
+    data: str
+) -> Dict:
+    """JSON обновления с нажатием inline-кнопки"""
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": _user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": _chat(user_id),
+                "from": {"id": 1, "is_bot": True, "first_name": "Fake"},
+                "text": MENU_TEXT,
+            },
+        },
+    }
+
+
+# ============================================================================
+# LOAD TEST / НАГРУЗОЧНЫЙ ТЕСТ
+# ============================================================================
+
+class LoadTest:
+    """Генератор нагрузки, модель состояния и проверки"""
+
+    def __init__(
+        self,
+        args: argparse.Namespace,
+        catalog: CompiledCatalog,
+        api: RecordingAPI,
+        bot: BotProcess,
+        webhook_url: str,
+        metrics_url: str
+    ) -> None:
+        self.args = args
+        self.catalog = catalog
+        self.api = api
+        self.bot = bot
+        self.webhook_url = webhook_url
+        self.metrics_url = metrics_url
+        self.random = random.Random(args.seed)
+        # Клавиатуры строятся тем же кодом и с теми же настройками, что в боте
+        self.keyboards = KeyboardCache(
+            catalog,
+            page_size=int(
+                os.environ.get("PRODUCT_PAGE_SIZE", DEFAULT_PAGE_SIZE)
+            ),
+            columns=int(os.environ.get("PRODUCT_COLUMNS", DEFAULT_COLUMNS))
+        )
+        self.households: List[SimHousehold] = []
+        self.users: List[SimUser] = []
+        for index in range(args.users):
+            if index % args.household_size == 0:
+                household = SimHousehold(
+                    f"load-{len(self.households)}", len(catalog)
+                )
+                self.households.append(household)
+            user = SimUser(BASE_USER_ID + index, household)
+            household.members.append(user)
+            self.users.append(user)
+        self.idle: "asyncio.Queue[SimUser]" = asyncio.Queue()
+        for user in self.users:
+            self.idle.put_nowait(user)
+        self.update_ids = itertools.count(1)
+        # update_id -> время отправки для обновлений, ждущих ответа
+        self.outstanding: Dict[int, float] = {}
+        self.tasks: Set[asyncio.Task] = set()
+        self.windows: List[Window] = []
+        self.rss: List[Tuple[float, int]] = []
+        self.client = httpx.AsyncClient(
+            headers={SECRET_HEADER: SECRET},
+            limits=httpx.Limits(max_connections=args.connections),
+            timeout=ANSWER_TIMEOUT
+        )
+
+    def households_file(self) -> Dict[str, List[int]]:
+        """Содержимое HOUSEHOLDS_FILE для бота"""
+        return {
+            household.id: [user.id for user in household.members]
+            for household in self.households
+        }
+
+    # ------------------------------------------------------------------------
+    # Model / Модель состояния
+    # ------------------------------------------------------------------------
+
+    def expected_markup(self, user: SimUser) -> Optional[Dict[str, Any]]:
+        """Клавиатура, которую бот должен показывать в меню пользователя"""
+        screen = user.screen
+        if screen is None:
+            return None
+        if screen[0] == "categories":
+            markup = self.keyboards.categories(self.catalog)
+        elif screen[0] == "subcategories":
+            markup = self.keyboards.subcategories(self.catalog, screen[1])
+        else:
+            product_screen = self.catalog.screen(screen[1])
+            mask = user.household.selection.range_mask(
+                self.keyboards.page_products(product_screen, screen[2])
+            )
+            markup = self.keyboards.products(
+                self.catalog, product_screen, mask, screen[2]
+            )
+        return markup.to_dict()
+
+    def choose(self, user: SimUser) -> str:
+        """Следующая нажатая кнопка среди кнопок открытого экрана"""
+        by_op: Dict[str, List[str]] = defaultdict(list)
+        for row in self.expected_markup(user)["inline_keyboard"]:
+            for button in row:
+                data = button["callback_data"]
+                by_op[decode(data, self.catalog).op].append(data)
+        ops = list(by_op)
+        op = self.random.choices(ops, [OP_WEIGHTS[op] for op in ops])[0]
+        return self.random.choice(by_op[op])
+
+    def apply(self, user: SimUser, callback: Callback) -> None:
+        """Меняет модель так же, как бот обработает нажатие"""
+        catalog = self.catalog
+        household = user.household
+        if callback.op == OP_CATEGORY:
+            category = catalog.category(callback.arg)
+            if category.has_subcategories:
+                user.screen = ("subcategories", category.id)
+            else:
+                user.screen = ("products", category.screen_ids[0], 0)
+        elif callback.op == OP_SCREEN:
+            user.screen = ("products", callback.arg, 0)
+        elif callback.op in (OP_TOGGLE, OP_PAGE):
+            if callback.op == OP_TOGGLE:
+                household.selection.toggle(callback.arg)
+            screen = catalog.locate(callback.arg)
+            user.screen = (
+                "products", screen.id,
+                self.keyboards.page_of(screen, callback.arg)
+            )
+        elif callback.op == OP_BACK:
+            user.screen = ("subcategories", callback.arg)
+        elif callback.op == OP_HOME:
+            user.screen = CATEGORIES
+        elif callback.op == OP_DONE:
+            user.screen = None
+            self.complete(household)
+
+    def complete(self, household: SimHousehold) -> None:
+        """"Готово": модель отправленного списка"""
+        selection = household.selection
+        # В режимах edit/diff опустевший список публикуется, если раньше
+        # уже был доставлен
+        if not selection and (
+            self.args.mode == "send" or household.published is None
+        ):
+            household.rendered = None
+            return
+        if self.args.mode == "send":
+            household.rendered = render_shopping_list(self.catalog, selection)
+            household.selection = Selection(len(self.catalog))
+            if len(household.members) > 1:
+                # Порядок "Готово" и отметок других участников неизвестен
+                household.exact = False
+            return
+        previous = household.published if self.args.mode == "diff" else None
+        household.rendered = render_shopping_list(
+            self.catalog, selection, previous=previous
+        )
+        household.published = Selection(
+            len(self.catalog), selection.to_bytes()
+        )
+
+    # ------------------------------------------------------------------------
+    # Requests / Запросы
+    # ------------------------------------------------------------------------
+
+    async def post(self, update: Dict[str, Any], window: Window) -> bool:
+        """POST обновления на /webhook; True - сервер его принял"""
+        started = time.monotonic()
+        try:
+            response = await self.client.post(self.webhook_url, json=update)
+        except httpx.HTTPError:
+            window.http_errors += 1
+            return False
+        window.acks.append(time.monotonic() - started)
+        if response.status_code != 200:
+            window.http_errors += 1
+            return False
+        return True
+
+    async def start_user(self, user: SimUser, window: Window) -> None:
+        """/start: новое меню с категориями"""
+        update_id = next(self.update_ids)
+        menu = self.api.expect_menu(user.id)
+        started = self.outstanding[update_id] = time.monotonic()
+        window.sent += 1
+        try:
+            if not await self.post(
+                command_update(update_id, user.id, "/start"), window
+            ):
+                self.api.forget(None, user.id)
+                window.lost += 1
+                return
+            try:
+                answered, message_id = await asyncio.wait_for(
+                    menu, ANSWER_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                # Список не менялся: следующий шаг снова отправит /start
+                window.lost += 1
+                return
+        finally:
+            del self.outstanding[update_id]
+        window.latencies.append(answered - started)
+        user.menu = message_id
+        user.screen = CATEGORIES
+
+    async def click(
+        self,
+        user: SimUser,
+        window: Window,
+        data: Optional[str] = None,
+        wait: bool = True
+    ) -> None:
+        """Нажатие кнопки в меню пользователя"""
+        data = data or self.choose(user)
+        update_id = next(self.update_ids)
+        query_id = str(update_id)
+        answer = self.api.expect_answer(query_id)
+        self.outstanding[update_id] = time.monotonic()
+        window.sent += 1
+        update = callback_update(update_id, user.id, user.menu, data)
+        if not await self.post(update, window):
+            self.api.forget(query_id, user.id)
+            del self.outstanding[update_id]
+            window.lost += 1
+            # Неизвестно, успел ли бот обработать нажатие
+            user.household.exact = False
+            return
+        # Обновления одного пользователя обрабатываются по порядку, поэтому
+        # модель можно менять сразу, не дожидаясь ответа
+        self.apply(user, decode(data, self.catalog))
+        waiting = self.wait_answer(user, answer, update_id, window)
+        if wait:
+            await waiting
+        else:
+            self.spawn(waiting)
+
+    async def wait_answer(
+        self,
+        user: SimUser,
+        answer: asyncio.Future,
+        update_id: int,
+        window: Window
+    ) -> None:
+        """Ждет ответ на нажатие и записывает задержку"""
+        try:
+            answered = await asyncio.wait_for(answer, ANSWER_TIMEOUT)
+        except asyncio.TimeoutError:
+            window.lost += 1
+            user.household.exact = False
+        else:
+            window.latencies.append(answered - self.outstanding[update_id])
+        finally:
+            del self.outstanding[update_id]
+
+    async def step(self, user: SimUser, window: Window) -> None:
+        """Одно действие пользователя; потом он снова свободен"""
+        try:
+            if user.screen is None:
+                await self.start_user(user, window)
+            else:
+                burst = self.random.random() < BURST_PROBABILITY
+                await self.click(user, window, wait=not burst)
+        finally:
+            self.idle.put_nowait(user)
+
+    def spawn(self, coroutine: Any) -> None:
+        task = asyncio.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    # ------------------------------------------------------------------------
+    # Load / Нагрузка
+    # ------------------------------------------------------------------------
+
+    async def run_window(self, window: Window) -> None:
+        """Открытая нагрузка: такт каждые 1/rate секунд"""
+        self.windows.append(window)
+        interval = 1.0 / window.rate
+        started = time.monotonic()
+        bot_cpu = read_cpu(self.bot.pid)
+        load_cpu = time.process_time()
+        deadline = started + window.duration
+        for tick in itertools.count(1):
+            at = started + tick * interval
+            if at > deadline:
+                break
+            delay = at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                user = self.idle.get_nowait()
+            except asyncio.QueueEmpty:
+                window.missed += 1
+                continue
+            self.spawn(self.step(user, window))
+        await asyncio.sleep(max(0.0, deadline - time.monotonic()))
+        window.elapsed = time.monotonic() - started
+        window.rss = self.rss[-1][1] if self.rss else None
+        window.load_cpu = (time.process_time() - load_cpu) / window.elapsed
+        if bot_cpu is not None:
+            window.bot_cpu = (
+                (read_cpu(self.bot.pid) or bot_cpu) - bot_cpu
+            ) / window.elapsed
+
+    def saturated(self, window: Window) -> bool:
+        """p99 выше порога или обновления теряются"""
+        now = time.monotonic()
+        late = sum(
+            1 for latency in window.latencies
+            if latency > self.args.max_p99
+        )
+        # Обновления, которые еще ждут ответа дольше порога, тоже опоздали
+        late += sum(
+            1 for sent in self.outstanding.values()
+            if now - sent > self.args.max_p99
+        )
+        return late > 0.01 * window.sent or window.lost > 0
+
+    async def sample_memory(self) -> None:
+        """Раз в секунду записывает RSS процесса бота"""
+        started = time.monotonic()
+        while True:
+            rss = read_rss(self.bot.pid)
+            if rss is not None:
+                self.rss.append((time.monotonic() - started, rss))
+            await asyncio.sleep(1.0)
+
+    async def quiesce(self, timeout: float = 60.0) -> bool:
+        """Ждет, пока бот закончит обработку и отложенные правки"""
+        while self.tasks:
+            await asyncio.wait(set(self.tasks))
+        deadline = time.monotonic() + timeout
+        total = self.api.total_requests
+        quiet_since = time.monotonic()
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+            if self.api.total_requests != total:
+                total = self.api.total_requests
+                quiet_since = time.monotonic()
+            elif time.monotonic() - quiet_since >= QUIET_PERIOD:
+                return True
+        return False
+
+    async def scrape(self) -> Dict[str, float]:
+        """Метрики бота с /metrics"""
+        response = await self.client.get(self.metrics_url)
+        return parse_metrics(response.text)
+
+    # ------------------------------------------------------------------------
+    # Checks / Проверки
+    # ------------------------------------------------------------------------
+
+    def checked(self) -> List[SimHousehold]:
+        """Домохозяйства, состояние которых модель знает точно"""
+        return [
+            household for household in self.households
+            if household.exact and len(household.members) == 1
+        ]
+
+    def check_keyboards(self) -> List[str]:
+        """Меню показывает последний открытый экран с верными отметками"""
+        errors = []
+        for household in self.checked():
+            user = household.members[0]
+            if user.menu is None:
+                continue
+            text, markup = self.api.messages[(user.id, user.menu)]
+            expected = self.expected_markup(user)
+            if markup != expected:
+                errors.append(
+                    f"user {user.id}: menu {user.menu} on {user.screen} "
+                    f"{_difference(markup, expected)}"
+                )
+        return errors
+
+    async def finish(self, household: SimHousehold) -> None:
+        """Последнее "Готово" домохозяйства перед проверкой списка"""
+        user = household.members[0]
+        window = self.windows[-1]
+        if user.screen is None:
+            await self.start_user(user, window)
+            if user.screen is None:
+                household.exact = False
+                return
+        await self.click(user, window, data=encode(self.catalog, OP_DONE))
+
+    def check_lists(self) -> List[str]:
+        """Отправленный список совпадает с моделью"""
+        errors = []
+        chats = self.api.chat_messages()
+        for household in self.checked():
+            user = household.members[0]
+            menu_text, _ = self.api.messages[(user.id, user.menu)]
+            if household.rendered is None:
+                if menu_text != EMPTY_LIST_TEXT:
+                    errors.append(
+                        f"user {user.id}: empty list, menu says {menu_text!r}"
+                    )
+                continue
+            done_text = DONE_TEXT.format(members=len(household.members))
+            if not menu_text.startswith(done_text):
+                errors.append(f"user {user.id}: menu says {menu_text!r}")
+            texts = [text for _, text in chats[user.id]]
+            if self.args.mode == "send":
+                # Каждое "Готово" отправляет список новыми сообщениями
+                delivered = texts[-len(household.rendered):]
+                ok = delivered == household.rendered
+            else:
+                # Список правится на месте в тех же сообщениях
+                ok = all(part in texts for part in household.rendered)
+            if not ok:
+                errors.append(
+                    f"user {user.id}: shopping list differs from the model "
+                    f"({len(household.selection)} products)"
+                )
+        return errors
+
+    async def verify(self) -> Dict[str, Any]:
+        """Проверки состояния после прогона"""
+        if self.args.api_error_rate or self.args.api_flood_rate:
+            return {"skipped": "API errors were injected"}
+        if not await self.quiesce():
+            return {"skipped": "bot did not settle"}
+        errors = self.check_keyboards()
+        keyboards = len(self.checked())
+
+        semaphore = asyncio.Semaphore(self.args.connections)
+
+        async def finish(household: SimHousehold) -> None:
+            async with semaphore:
+                await self.finish(household)
+
+        await asyncio.gather(*(finish(h) for h in self.checked()))
+        if not await self.quiesce():
+            return {"skipped": "bot did not settle", "errors": errors}
+        errors.extend(self.check_lists())
+        return {
+            "keyboards": keyboards,
+            "lists": len(self.checked()),
+            "errors": errors,
+        }
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+def _buttons(markup: Optional[Dict[str, Any]]) -> List[str]:
+    if markup is None:
+        return []
+    return [
+        button["text"] for row in markup["inline_keyboard"] for button in row
+    ]
+
+
+def _difference(
+    markup: Optional[Dict[str, Any]],
+    expected: Optional[Dict[str, Any]]
+) -> str:
+    """Чем клавиатура в сообщении отличается от ожидаемой"""
+    shown, wanted = _buttons(markup), _buttons(expected)
+    if len(shown) != len(wanted):
+        return f"shows {len(shown)} buttons instead of {len(wanted)}"
+    differs = [
+        f"{got!r} instead of {want!r}"
+        for got, want in zip(shown, wanted) if got != want
+    ]
+    return "shows " + ", ".join(differs or ["other callback data"])
+
+
+# ============================================================================
+# REPORT / ОТЧЕТ
+# ============================================================================
+
+def memory_growth(samples: List[Tuple[float, int]]) -> float:
+    """Наклон RSS по методу наименьших квадратов (байт в секунду)"""
+    if len(samples) < 2:
+        return 0.0
+    n = len(samples)
+    mean_t = sum(t for t, _ in samples) / n
+    mean_m = sum(m for _, m in samples) / n
+    variance = sum((t - mean_t) ** 2 for t, _ in samples)
+    if not variance:
+        return 0.0
+    covariance = sum((t - mean_t) * (m - mean_m) for t, m in samples)
+    return covariance / variance
+
+
+def _mib(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value / 2 ** 20:.1f}"
+
+
+def _percent(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value * 100:.0f}"
+
+
+def print_window(index: int, summary: Dict[str, Any]) -> None:
+    print(
+        f"{index:>4} {summary['rate']:>7.0f} {summary['achieved']:>8.1f} "
+        f"{summary['sent']:>7} {summary['p50'] * 1000:>7.0f} "
+        f"{summary['p90'] * 1000:>7.0f} {summary['p99'] * 1000:>7.0f} "
+        f"{summary['max'] * 1000:>7.0f} {summary['lost']:>6} "
+        f"{summary['missed']:>6} {_mib(summary['rss']):>7} "
+        f"{_percent(summary['bot_cpu']):>7} "
+        f"{_percent(summary['load_cpu']):>7}",
+        flush=True
+    )
+
+
+def print_header() -> None:
+    print(
+        f"{'step':>4} {'rate/s':>7} {'actual':>8} {'sent':>7} "
+        f"{'p50 ms':>7} {'p90 ms':>7} {'p99 ms':>7} {'max ms':>7} "
+        f"{'lost':>6} {'missed':>6} {'RSS MiB':>7} {'bot %':>7} "
+        f"{'load %':>7}"
+    )
+
+
+def print_report(
+    test: LoadTest,
+    summaries: List[Dict[str, Any]],
+    metrics: Dict[str, float],
+    checks: Dict[str, Any],
+    log_errors: int
+) -> None:
+    args = test.args
+    print("\nFinal (after all answers arrived):")
+    print_header()
+    for index, summary in enumerate(summaries, 1):
+        print_window(index, summary)
+
+    sustained = [
+        s for s in summaries
+        if s["p99"] <= args.max_p99 and not s["lost"]
+        and s["achieved"] >= 0.95 * s["rate"]
+    ]
+    if sustained:
+        print(f"\nSustained: {max(s['achieved'] for s in sustained):.1f} "
+              f"updates/s with p99 <= {args.max_p99 * 1000:.0f} ms "
+              f"and no lost updates")
+    else:
+        print(f"\nNo step kept p99 <= {args.max_p99 * 1000:.0f} ms "
+              f"without lost updates")
+    if any(s["missed"] for s in summaries):
+        print("Some ticks found no idle user: increase --users")
+    cores = os.cpu_count() or 1
+    if any(
+        s["load_cpu"] > 0.8 or (s["bot_cpu"] or 0.0) + s["load_cpu"]
+        > 0.9 * cores for s in summaries
+    ):
+        print("The load generator was short of CPU: the limit may be the "
+              "harness, not the bot")
+
+    if test.rss:
+        rss = [value for _, value in test.rss]
+        # Первое окно - прогрев (кеши клавиатур, пулы соединений)
+        warm = test.windows[0].duration if len(test.windows) > 1 else 0.0
+        steady = [(t, m) for t, m in test.rss if t >= warm] or test.rss
+        slope = memory_growth(steady)
+        print(
+            f"Memory: start {_mib(rss[0])} MiB, end {_mib(rss[-1])} MiB, "
+            f"peak {_mib(max(rss))} MiB, "
+            f"growth {_mib(steady[-1][1] - steady[0][1])} MiB "
+            f"({_mib(slope * 3600)} MiB/h)"
+        )
+
+    ingress = ", ".join(
+        "{} {:.0f}".format(result, metric_sum(
+            metrics, "webhook_updates_total", f'result="{result}"'
+        ))
+        for result in ("accepted", "shed", "duplicate")
+    )
+    print(
+        f"Bot: ingress {ingress}"
+        "; handler errors "
+        f"{metric_sum(metrics, 'bot_handler_errors_total'):.0f}"
+        f"; API errors "
+        f"{metric_sum(metrics, 'telegram_api_errors_total'):.0f}"
+        f"; sessions in memory "
+        f"{metric_sum(metrics, 'bot_sessions_in_memory'):.0f}"
+        f"; errors in log {log_errors}"
+    )
+    stats = test.api.stats()
+    print(
+        f"Fake API: {sum(stats['requests'].values())} requests, "
+        f"{sum(stats['errors'].values())} errors, "
+        f"{stats['messages']} messages"
+    )
+
+    if "skipped" in checks:
+        print(f"State checks skipped: {checks['skipped']}")
+    else:
+        print(
+            f"State checks: {checks['keyboards']} keyboards and "
+            f"{checks['lists']} shopping lists, "
+            f"{len(checks['errors'])} errors"
+        )
+    for error in checks.get("errors", [])[:20]:
+        print(f"  {error}")
+
+
+# ============================================================================
+# MAIN / ЗАПУСК
+# ============================================================================
+
+def bot_environment(
+    args: argparse.Namespace,
+    api_port: int,
+    port: int,
+    households_path: str
+) -> Dict[str, str]:
+    """Окружение процесса бота: остальные настройки берутся из своего"""
+    env = dict(os.environ)
+    env.update(
+        TELEGRAM_BOT_TOKEN=TOKEN,
+        WEBHOOK_SECRET=SECRET,
+        BOT_API_URL=f"http://127.0.0.1:{api_port}/bot",
+        RENDER_EXTERNAL_URL=f"http://127.0.0.1:{port}",
+        PORT=str(port),
+        HOUSEHOLDS_FILE=households_path,
+        CATALOG_FILE=args.catalog,
+        CATALOG_WATCH_INTERVAL="0",
+        LIST_DELIVERY_MODE=args.mode,
+        PYTHONUNBUFFERED="1",
+    )
+    return env
+
+
+async def wait_ready(test: LoadTest) -> None:
+    """Ждет, пока webhook-сервер бота начнет отвечать"""
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if not test.bot.alive():
+            raise RuntimeError(
+                f"Bot exited during startup:\n{test.bot.log_tail()}"
+            )
+        try:
+            await test.scrape()
+        except httpx.HTTPError:
+            await asyncio.sleep(0.1)
+        else:
+            # Регистрация webhook идет уже после открытия порта
+            while not test.api.webhook.get("url"):
+                await asyncio.sleep(0.05)
+            return
+    raise RuntimeError(f"Bot did not start:\n{test.bot.log_tail()}")
+
+
+async def run(args: argparse.Namespace) -> int:
+    catalog = compile_catalog(load_catalog_source(args.catalog))
+    api = RecordingAPI(
+        latency=args.api_latency,
+        jitter=args.api_jitter,
+        error_rate=args.api_error_rate,
+        flood_rate=args.api_flood_rate,
+        seed=args.seed,
+    )
+    api_port, port = free_port(), free_port()
+    api_server = api.application().listen(api_port, address="127.0.0.1")
+
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    households_path = os.path.join(workdir, "households.json")
+    log_path = args.log or os.path.join(workdir, "bot.log")
+    bot = BotProcess({}, log_path)
+    test = LoadTest(
+        args, catalog, api, bot,
+        webhook_url=f"http://127.0.0.1:{port}/webhook",
+        metrics_url=f"http://127.0.0.1:{port}/metrics"
+    )
+    with open(households_path, "w", encoding="utf-8") as f:
+        json.dump(test.households_file(), f)
+    bot.env = bot_environment(args, api_port, port, households_path)
+
+    print(
+        f"{args.users} users in {len(test.households)} households, "
+        f"{len(catalog)} products, mode {args.mode}"
+    )
+    bot.start()
+    sampler = None
+    try:
+        await wait_ready(test)
+        sampler = asyncio.create_task(test.sample_memory())
+
+        if args.soak:
+            count = max(1, math.ceil(args.soak / args.window))
+            plan = [(args.rates[0], args.window)] * count
+        else:
+            plan = [(rate, args.step) for rate in args.rates]
+
+        print_header()
+        for index, (rate, duration) in enumerate(plan, 1):
+            window = Window(rate, duration)
+            await test.run_window(window)
+            print_window(index, window.summary())
+            if not test.bot.alive():
+                print("Bot exited under load")
+                break
+            if not args.soak and test.saturated(window):
+                print(f"Saturated at {rate:g} updates/s")
+                break
+
+        # Итоги - после того как пришли все ответы
+        await test.quiesce()
+        summaries = [window.summary() for window in test.windows]
+        checks = await test.verify() if test.bot.alive() else {
+            "skipped": "bot exited"
+        }
+        metrics = await test.scrape() if test.bot.alive() else {}
+    finally:
+        if sampler is not None:
+            sampler.cancel()
+        code = bot.stop()
+        await test.close()
+        api_server.stop()
+
+    print_report(test, summaries, metrics, checks, bot.log_errors())
+    failed = bool(checks.get("errors"))
+    if code not in (0, -signal.SIGTERM):
+        print(f"Bot exited with code {code}:\n{bot.log_tail()}")
+        failed = True
+    if failed:
+        print(f"Bot log kept at {log_path}")
+    else:
+        # Лог из временного каталога нужен только для разбора ошибок
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 1 if failed else 0
+
+
+def main() -> int:
+    """Точка входа командной строки"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument(
+        "--rates", type=float, nargs="+", default=[25, 50, 100, 200],
+        help="updates per second for each step"
+    )
+    parser.add_argument("--step", type=float, default=10.0,
+                        help="seconds per step")
+    parser.add_argument("--soak", type=float, default=0.0,
+                        help="hold the first rate for this many seconds")
+    parser.add_argument("--window", type=float, default=60.0,
+                        help="report interval of a soak run (seconds)")
+    parser.add_argument("--max-p99", type=float, default=2.0,
+                        help="p99 latency that ends the ramp (seconds)")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--household-size", type=int, default=1)
+    parser.add_argument("--mode", choices=("edit", "diff", "send"),
+                        default="edit", help="LIST_DELIVERY_MODE of the bot")
+    parser.add_argument("--connections", type=int,
+                        default=DEFAULT_CONNECTIONS,
+                        help="concurrent webhook connections")
+    parser.add_argument(
+        "--catalog", default=os.path.join(HERE, "catalog.json")
+    )
+    parser.add_argument("--api-latency", type=float, default=0.0)
+    parser.add_argument("--api-jitter", type=float, default=0.0)
+    parser.add_argument("--api-error-rate", type=float, default=0.0)
+    parser.add_argument("--api-flood-rate", type=float, default=0.0)
+    parser.add_argument("--log", help="bot log file (default: temporary)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    if args.users < 1 or args.household_size < 1:
+        parser.error("--users and --household-size must be positive")
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
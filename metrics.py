@@ -0,0 +1,303 @@
+"""
+Metrics
+Метрики обработчиков и обращений к Telegram Bot API
+
+Небольшой реестр счетчиков, gauge и гистограмм без внешних зависимостей,
+который отдается в текстовом формате Prometheus на маршруте /metrics.
+
+    * instrument_handler() оборачивает callback обработчика: время
+      выполнения, ошибки и количество выполняющихся вызовов;
+    * InstrumentedRequest измеряет каждый исходящий запрос к Bot API
+      (метод API берется из URL), включая query.answer и send_message.
+"""
+
+import functools
+import time
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+from telegram.request import HTTPXRequest
+
+# Границы гистограмм задержек (в секундах)
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    """Экранирует значение метки для формата Prometheus"""
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Labels) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(value)}"' for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+# ============================================================================
+# METRIC TYPES / ТИПЫ МЕТРИК
+# ============================================================================
+
+class Metric:
+    """Общая часть всех метрик: имя, описание и имена меток"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+
+    def header(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """Монотонно растущий счетчик"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labels, labels)} "
+            f"{_format_value(value)}"
+            for labels, value in self._values.items()
+        ]
+
+
+class Gauge(Counter):
+    """Значение, которое может расти и уменьшаться"""
+
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels: str, value: float) -> None:
+        self._values[labels] = value
+
+
+class CallbackGauge(Metric):
+    """Gauge, значение которого вычисляется в момент сбора"""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        callback: Callable[[], float]
+    ) -> None:
+        super().__init__(name, help_text)
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        return [f"{self.name} {_format_value(self.callback())}"]
+
+
+class Histogram(Metric):
+    """Гистограмма с фиксированными границами корзин"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: Sequence[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS
+    ) -> None:
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # метки -> [счетчики корзин..., сумма, количество]
+        self._series: Dict[Labels, List[float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0.0] * (len(self.buckets) + 2)
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[index] += 1
+                break
+        series[-2] += value
+        series[-1] += 1
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return int(series[-1]) if series else 0
+
+    def render(self) -> List[str]:
+        lines = []
+        names = self.labels + ("le",)
+        for labels, series in self._series.items():
+            cumulative = 0.0
+            for bound, hits in zip(self.buckets, series):
+                cumulative += hits
+                bucket_labels = _format_labels(
+                    names, labels + (_format_value(bound),)
+                )
+                lines.append(
+                    f"{self.name}_bucket{bucket_labels} "
+                    f"{_format_value(cumulative)}"
+                )
+            label_text = _format_labels(self.labels, labels)
+            lines.append(
+                f"{self.name}_sum{label_text} {_format_value(series[-2])}"
+            )
+            lines.append(
+                f"{self.name}_count{label_text} {_format_value(series[-1])}"
+            )
+        return lines
+
+
+class Registry:
+    """Набор метрик, отдаваемых на /metrics"""
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labels=()) -> Counter:
+        return self.register(Counter(name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, labels=()) -> Gauge:
+        return self.register(Gauge(name, help_text, labels))
+
+    def callback_gauge(
+        self,
+        name: str,
+        help_text: str,
+        callback: Callable[[], float]
+    ) -> CallbackGauge:
+        return self.register(CallbackGauge(name, help_text, callback))
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labels=(),
+        buckets: Iterable[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.header())
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# ============================================================================
+# BOT METRICS / МЕТРИКИ БОТА
+# ============================================================================
+
+REGISTRY = Registry()
+
+HANDLER_DURATION = REGISTRY.histogram(
+    "bot_handler_duration_seconds",
+    "Time spent in update handlers",
+    ("handler",)
+)
+HANDLER_ERRORS = REGISTRY.counter(
+    "bot_handler_errors_total",
+    "Update handlers that raised an exception",
+    ("handler",)
+)
+HANDLER_IN_FLIGHT = REGISTRY.gauge(
+    "bot_handler_in_flight",
+    "Update handlers currently running",
+    ("handler",)
+)
+API_DURATION = REGISTRY.histogram(
+    "telegram_api_duration_seconds",
+    "Latency of outbound Telegram Bot API requests",
+    ("method",)
+)
+API_ERRORS = REGISTRY.counter(
+    "telegram_api_errors_total",
+    "Outbound Telegram Bot API requests that failed",
+    ("method",)
+)
+API_IN_FLIGHT = REGISTRY.gauge(
+    "telegram_api_in_flight",
+    "Outbound Telegram Bot API requests currently in progress",
+    ("method",)
+)
+
+
+def instrument_handler(name: str, callback: Callable) -> Callable:
+    """Оборачивает callback обработчика сбором метрик"""
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        HANDLER_IN_FLIGHT.inc(name)
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_DURATION.observe(time.perf_counter() - started, name)
+            HANDLER_IN_FLIGHT.dec(name)
+
+    return wrapper
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest, измеряющий каждый запрос к Bot API"""
+
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+        API_IN_FLIGHT.inc(api_method)
+        started = time.perf_counter()
+        try:
+            status, payload = await super().do_request(
+                url, method, *args, **kwargs
+            )
+        except Exception:
+            API_ERRORS.inc(api_method)
+            raise
+        finally:
+            API_DURATION.observe(time.perf_counter() - started, api_method)
+            API_IN_FLIGHT.dec(api_method)
+        # Ошибки Bot API приходят кодом ответа, а не исключением
+        if status >= 400:
+            API_ERRORS.inc(api_method)
+        return status, payload
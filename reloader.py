@@ -0,0 +1,133 @@
+"""
+Catalog hot reload
+Горячая перезагрузка каталога из файла
+
+Файл каталога проверяется по mtime раз в interval секунд (или по команде
+/reload). Чтение, проверка, компиляция, построение клавиатур и таблицы
+переноса ID выполняются в отдельном потоке; на event loop остается только
+вызов on_swap, который одним синхронным шагом подменяет каталог,
+поэтому бот не останавливается на время перезагрузки.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Callable, List, NamedTuple, Optional
+
+from catalog import (
+    CompiledCatalog,
+    compile_catalog,
+    load_catalog_source,
+    product_id_map
+)
+from keyboards import KeyboardCache
+from render import list_layout
+from search import search_index
+
+logger = logging.getLogger(__name__)
+
+# Интервал проверки файла каталога по умолчанию (в секундах)
+DEFAULT_WATCH_INTERVAL = 5.0
+
+
+class CatalogBuild(NamedTuple):
+    """Новая версия каталога, готовая к подмене"""
+    catalog: CompiledCatalog
+    keyboards: KeyboardCache
+    # ID продукта в предыдущей версии -> ID в новой (None - удален)
+    id_map: List[Optional[int]]
+
+
+KeyboardFactory = Callable[[CompiledCatalog], KeyboardCache]
+
+
+def build_catalog(
+    path: str,
+    previous: Optional[CompiledCatalog] = None,
+    make_keyboards: KeyboardFactory = KeyboardCache
+) -> CatalogBuild:
+    """Загружает и компилирует каталог со всеми производными структурами"""
+    catalog = compile_catalog(load_catalog_source(path))
+    # Производные кеши строятся здесь, а не на первом клике или /find:
+    # при запуске это фаза импорта, при перезагрузке - фоновый поток
+    search_index(catalog)
+    list_layout(catalog)
+    keyboards = make_keyboards(catalog)
+    keyboards.warm()
+    id_map = product_id_map(previous, catalog) if previous else []
+    return CatalogBuild(catalog, keyboards, id_map)
+
+
+class CatalogReloader:
+    """Следит за файлом каталога и подменяет каталог при изменениях"""
+
+    def __init__(
+        self,
+        path: str,
+        current: Callable[[], CompiledCatalog],
+        on_swap: Callable[[CatalogBuild], None],
+        interval: float = DEFAULT_WATCH_INTERVAL,
+        make_keyboards: KeyboardFactory = KeyboardCache
+    ) -> None:
+        self.path = path
+        self.current = current
+        self.on_swap = on_swap
+        self.interval = interval
+        self.make_keyboards = make_keyboards
+        self._mtime = self._stat()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def _stat(self) -> Optional[float]:
+        try:
+            return os.stat(self.path).st_mtime
+        except OSError:
+            return None
+
+    async def reload(self, force: bool = False) -> bool:
+        """Перезагружает каталог, если файл изменился; True при подмене"""
+        async with self._lock:
+            mtime = self._stat()
+            if not force and mtime == self._mtime:
+                return False
+            self._mtime = mtime
+
+            previous = self.current()
+            loop = asyncio.get_running_loop()
+            build = await loop.run_in_executor(
+                None, build_catalog, self.path, previous, self.make_keyboards
+            )
+            if build.catalog.version == previous.version:
+                return False
+
+            self.on_swap(build)
+            logger.info(
+                f"Catalog reloaded from {self.path}: "
+                f"{len(build.catalog)} products, "
+                f"version {build.catalog.version}"
+            )
+            return True
+
+    async def _watch_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.reload()
+            except Exception as e:
+                # Битый файл не должен ронять бота: остается прежний каталог
+                logger.error(f"Catalog reload failed: {e}")
+
+    async def start(self) -> None:
+        """Запускает периодическую проверку файла (если interval > 0)"""
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._watch_loop())
+
+    async def close(self) -> None:
+        """Останавливает проверку файла"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
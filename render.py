@@ -0,0 +1,173 @@
+"""
+Shopping list renderer
+Формирование текста списка покупок
+
+Рендер проходит только по выбранным продуктам: они группируются по экранам,
+экраны упорядочиваются по заранее вычисленному для каталога порядку
+(сначала простые категории, затем категории с подкатегориями), а текст
+собирается одним join. Если список не помещается в одно сообщение
+Telegram, он делится на несколько сообщений по границам категорий.
+
+В режиме сравнения (previous - ранее отправленный выбор) в список попадают
+и удаленные продукты: добавленные помечаются ➕, удаленные - ➖ курсивом.
+"""
+
+from functools import lru_cache
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from telegram.helpers import escape_markdown
+
+from catalog import CompiledCatalog
+from selection import Selection
+
+# Максимальная длина сообщения Telegram (в UTF-16 символах)
+MAX_MESSAGE_LENGTH = 4096
+
+LIST_TITLE = "🛒 *Список покупок:*\n\n"
+
+# Сообщение вместо списка, когда в нем не осталось продуктов
+EMPTY_LIST = "🛒 *Список покупок порожній.*"
+
+# Пометки продуктов в режиме сравнения
+ADDED_MARK = "➕ "
+REMOVED_MARK = "➖ "
+
+
+class ListLayout(NamedTuple):
+    """Предвычисленный для каталога порядок экранов и заголовки"""
+    screen_rank: Tuple[int, ...]
+    category_headers: Tuple[str, ...]
+    screen_headers: Tuple[str, ...]
+    bullets: Tuple[str, ...]
+
+
+@lru_cache(maxsize=4)
+def list_layout(catalog: CompiledCatalog) -> ListLayout:
+    """Строит порядок вывода экранов и заголовки для каталога"""
+    ordered = sorted(
+        catalog.categories, key=lambda category: category.has_subcategories
+    )
+    screen_rank = [0] * len(catalog.screens)
+    rank = 0
+    for category in ordered:
+        for screen_id in category.screen_ids:
+            screen_rank[screen_id] = rank
+            rank += 1
+
+    return ListLayout(
+        screen_rank=tuple(screen_rank),
+        # Названия из catalog.json экранируются, как и названия продуктов
+        category_headers=tuple(
+            f"*{escape_markdown(category.name)}:*\n"
+            for category in catalog.categories
+        ),
+        screen_headers=tuple(
+            f"  *{escape_markdown(screen.subcategory)}:*\n"
+            if screen.subcategory else ""
+            for screen in catalog.screens
+        ),
+        bullets=tuple(
+            "    • " if screen.subcategory else "  • "
+            for screen in catalog.screens
+        ),
+    )
+
+
+def _length(text: str) -> int:
+    """Длина текста так, как ее считает Telegram (UTF-16)"""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _diff_lines(
+    selection: Selection,
+    previous: Selection
+) -> Iterable[Tuple[int, str, str]]:
+    """ID продуктов обоих выборов по возрастанию с пометками изменений"""
+    for product_id in sorted(set(selection).union(previous)):
+        if product_id not in previous:
+            yield product_id, ADDED_MARK, ""
+        elif product_id not in selection:
+            yield product_id, REMOVED_MARK + "_", "_"
+        else:
+            yield product_id, "", ""
+
+
+def render_blocks(
+    catalog: CompiledCatalog,
+    selection: Selection,
+    previous: Optional[Selection] = None
+) -> List[str]:
+    """Формирует блоки текста по категориям для выбранных продуктов"""
+    layout = list_layout(catalog)
+    products = catalog.products
+
+    # Группируем выбранные продукты по экранам
+    by_screen: Dict[int, List[str]] = {}
+    if previous is None:
+        for product_id in selection:
+            if product_id >= len(products):
+                break
+            product = products[product_id]
+            by_screen.setdefault(product.screen_id, []).append(
+                product.markdown
+            )
+    else:
+        for product_id, prefix, suffix in _diff_lines(selection, previous):
+            if product_id >= len(products):
+                break
+            product = products[product_id]
+            by_screen.setdefault(product.screen_id, []).append(
+                prefix + product.markdown + suffix
+            )
+
+    blocks: List[str] = []
+    parts: List[str] = []
+    current_category = None
+    for screen_id in sorted(by_screen, key=layout.screen_rank.__getitem__):
+        category_id = catalog.screens[screen_id].category_id
+        if category_id != current_category:
+            if parts:
+                blocks.append("".join(parts))
+                parts = []
+            parts.append(layout.category_headers[category_id])
+            current_category = category_id
+        bullet = layout.bullets[screen_id]
+        parts.append(layout.screen_headers[screen_id])
+        parts.append("\n".join(bullet + name for name in by_screen[screen_id]))
+        parts.append("\n\n")
+    if parts:
+        blocks.append("".join(parts))
+    return blocks
+
+
+def render_shopping_list(
+    catalog: CompiledCatalog,
+    selection: Selection,
+    limit: int = MAX_MESSAGE_LENGTH,
+    previous: Optional[Selection] = None
+) -> List[str]:
+    """Формирует список покупок; возвращает одно или несколько сообщений"""
+    # Блок категории, который не помещается в сообщение вместе с заголовком,
+    # делится по строкам; остальные блоки не разрываются
+    block_limit = limit - _length(LIST_TITLE)
+    units: List[str] = [LIST_TITLE]
+    for block in render_blocks(catalog, selection, previous):
+        if _length(block) > block_limit:
+            units.extend(block.splitlines(keepends=True))
+        else:
+            units.append(block)
+    if len(units) == 1:
+        return [EMPTY_LIST]
+
+    messages: List[str] = []
+    parts: List[str] = []
+    size = 0
+    for unit in units:
+        unit_size = _length(unit)
+        if parts and size + unit_size > limit:
+            messages.append("".join(parts))
+            parts, size = [], 0
+        parts.append(unit)
+        size += unit_size
+    messages.append("".join(parts))
+    return messages
@@ -0,0 +1,136 @@
+"""
+Keyed update scheduler
+Параллельная обработка обновлений разных пользователей
+
+KeyedUpdateProcessor подключается к Application через concurrent_updates:
+обновления с одинаковым ключом (по умолчанию - ID пользователя)
+обрабатываются строго по очереди, а обновления с разными ключами -
+параллельно. Пока обновление ждет своей очереди, оно не занимает слот
+обработки, поэтому медленная рассылка одного пользователя не блокирует
+клики остальных. Статистика очередей показывает, где возникает
+head-of-line blocking.
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+# Сколько обновлений обрабатывается одновременно
+DEFAULT_MAX_CONCURRENT = 32
+
+# Сколько обновлений может ждать в очередях (включая обрабатываемые)
+DEFAULT_MAX_PENDING = 1024
+
+KeyFunc = Callable[[object], Optional[Hashable]]
+
+
+def user_key(update: object) -> Optional[Hashable]:
+    """Ключ очереди по умолчанию: ID пользователя или чата"""
+    if isinstance(update, Update):
+        if update.effective_user is not None:
+            return update.effective_user.id
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+    return None
+
+
+class _Lane:
+    """Очередь обновлений одного ключа"""
+
+    __slots__ = ("lock", "depth")
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.depth = 0
+
+
+class KeyedUpdateProcessor(BaseUpdateProcessor):
+    """Порядок внутри ключа, параллельность между ключами"""
+
+    def __init__(
+        self,
+        key_func: KeyFunc = user_key,
+        max_concurrent: int = DEFAULT_MAX_CONCURRENT,
+        max_pending: int = DEFAULT_MAX_PENDING
+    ) -> None:
+        # Семафор базового класса ограничивает общее число ожидающих
+        super().__init__(max_pending)
+        self.key_func = key_func
+        self.max_concurrent = max_concurrent
+        self._workers = asyncio.Semaphore(max_concurrent)
+        self._lanes: Dict[Hashable, _Lane] = {}
+        self.pending = 0
+        self.in_flight = 0
+        self.processed = 0
+        self.blocked = 0
+        self.max_depth = 0
+        self.max_wait = 0.0
+
+    async def initialize(self) -> None:
+        """Ресурсы выделяются лениво"""
+
+    async def shutdown(self) -> None:
+        """Ожидающие обновления завершает сам Application"""
+
+    async def process_update(
+        self,
+        update: object,
+        coroutine: Awaitable[Any]
+    ) -> None:
+        """Считает обновления, принятые в обработку, но еще не завершенные"""
+        self.pending += 1
+        try:
+            await super().process_update(update, coroutine)
+        finally:
+            self.pending -= 1
+
+    async def do_process_update(
+        self,
+        update: object,
+        coroutine: Awaitable[Any]
+    ) -> None:
+        """Ставит обновление в очередь его ключа и обрабатывает по порядку"""
+        key = self.key_func(update)
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = _Lane()
+        lane.depth += 1
+        if lane.depth > 1:
+            self.blocked += 1
+        self.max_depth = max(self.max_depth, lane.depth)
+
+        queued_at = time.monotonic()
+        try:
+            async with lane.lock:
+                async with self._workers:
+                    self.max_wait = max(
+                        self.max_wait, time.monotonic() - queued_at
+                    )
+                    self.in_flight += 1
+                    try:
+                        await coroutine
+                    finally:
+                        self.in_flight -= 1
+                        self.processed += 1
+        finally:
+            lane.depth -= 1
+            if not lane.depth:
+                del self._lanes[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """Снимок состояния очередей"""
+        depths = [lane.depth for lane in self._lanes.values()]
+        return {
+            "pending": self.pending,
+            "active_keys": len(depths),
+            "queued": sum(depths) - self.in_flight,
+            "in_flight": self.in_flight,
+            "deepest_queue": max(depths, default=0),
+            "processed": self.processed,
+            "blocked_behind_same_key": self.blocked,
+            "max_queue_depth": self.max_depth,
+            "max_wait_seconds": round(self.max_wait, 3),
+        }
@@ -0,0 +1,286 @@
+"""
+Product search index
+Поисковый индекс по названиям продуктов для /find и inline-режима
+
+Индекс строится один раз для версии каталога (в потоке перезагрузки
+каталога) и дальше только читается:
+
+    * названия нормализуются: регистр, апострофы (М'ясо / М’ясо / Мясо),
+      буквы, которые в украинском и русском пишут по-разному (і/и, ы/и,
+      є/е, ё/е, ґ/г, ъ), поэтому "хлеб" находит "Хліб", а "сыр" - "Сир";
+      латинские буквы, похожие на кириллические ("cир" с латинской c),
+      заменяются кириллическими;
+    * словарь слов отсортирован: все слова с заданным префиксом лежат
+      подряд и находятся двумя bisect (сжатое префиксное дерево);
+    * биграммы слов словаря дают кандидатов для запросов с опечатками,
+      которые ранжируются по коэффициенту Дайса;
+    * слова категорий и подкатегорий тоже ищутся ("кур" находит продукты
+      подкатегории "Курятина"), но ранжируются ниже слов названия.
+
+Совпадения ищутся по словарю (он намного меньше каталога), а не по всем
+продуктам, поэтому запрос к каталогу на десятки тысяч названий занимает
+доли миллисекунды.
+"""
+
+import heapq
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Dict, List, Set, Tuple
+
+from catalog import CompiledCatalog, Product
+
+# Сколько результатов возвращается по умолчанию
+DEFAULT_LIMIT = 10
+
+# Сколько слов словаря разворачивается для одного префикса
+MAX_PREFIX_EXPANSIONS = 64
+
+# Минимальная похожесть слова с опечаткой (коэффициент Дайса по биграммам)
+# и минимальная длина слова запроса для поиска с опечатками
+MIN_FUZZY_SIMILARITY = 0.6
+MIN_FUZZY_LENGTH = 4
+
+# Биграммы, которые встречаются в большей доле словаря, не дают кандидатов
+MAX_GRAM_SHARE = 0.25
+
+# Качество совпадения слова запроса со словом названия
+_EXACT = 3.0
+_PREFIX = 2.0
+_FUZZY = 1.0
+
+# Совпадение с названием категории/подкатегории весит меньше, чем с продуктом
+_PATH_WEIGHT = 0.5
+
+_APOSTROPHES = "'’ʼ‘`´′ʹ"
+
+# Латинские буквы, которые после casefold выглядят как кириллические
+_LATIN_LOOKALIKES = {
+    "a": "а", "c": "с", "e": "е", "i": "и", "k": "к",
+    "o": "о", "p": "р", "x": "х", "y": "у",
+}
+
+# Удаляем апострофы и твердый знак, сближаем украинское и русское
+# написание и латиницу, похожую на кириллицу; все остальные не
+# буквенно-цифровые символы станут разделителями
+_FOLD = str.maketrans(
+    {
+        **{ch: None for ch in _APOSTROPHES + "ъ"},
+        **_LATIN_LOOKALIKES,
+        "і": "и", "ї": "и", "ы": "и", "є": "е", "ё": "е", "э": "е",
+        "ґ": "г",
+    }
+)
+
+
+def normalize(text: str) -> str:
+    """Приводит текст к форме для поиска"""
+    folded = text.casefold().translate(_FOLD)
+    return "".join(ch if ch.isalnum() else " " for ch in folded)
+
+
+def tokenize(text: str) -> List[str]:
+    """Нормализованные слова текста"""
+    return normalize(text).split()
+
+
+def _bigrams(word: str) -> Set[str]:
+    padded = f" {word} "
+    return {padded[i:i + 2] for i in range(len(padded) - 1)}
+
+
+# ============================================================================
+# SEARCH INDEX / ПОИСКОВЫЙ ИНДЕКС
+# ============================================================================
+
+# Источник совпадений: качество и продукты (по возрастанию длины названия)
+_Source = Tuple[float, Tuple[int, ...]]
+
+
+class SearchIndex:
+    """Неизменяемый индекс названий продуктов одной версии каталога"""
+
+    def __init__(self, catalog: CompiledCatalog) -> None:
+        self.catalog = catalog
+        name_words = [tokenize(product.name) for product in catalog.products]
+        screen_words = [
+            tokenize(f"{screen.category} {screen.subcategory or ''}")
+            for screen in catalog.screens
+        ]
+
+        # Отсортированный словарь: слова названий и категорий
+        self.words: List[str] = sorted(
+            {word for words in name_words for word in words}
+            | {word for words in screen_words for word in words}
+        )
+        word_ids = {word: word_id for word_id, word in enumerate(self.words)}
+
+        # Слова каждого продукта и каждого экрана (номера в словаре)
+        self.product_words: List[Tuple[int, ...]] = [
+            tuple(word_ids[word] for word in words) for words in name_words
+        ]
+        self.screen_words: List[Tuple[int, ...]] = [
+            tuple(word_ids[word] for word in words) for words in screen_words
+        ]
+
+        # Слово -> продукты с ним в названии / в категории (короткие первыми)
+        names: List[List[int]] = [[] for _ in self.words]
+        paths: List[List[int]] = [[] for _ in self.words]
+        for product in catalog.products:
+            for word_id in set(self.product_words[product.id]):
+                names[word_id].append(product.id)
+            for word_id in set(self.screen_words[product.screen_id]):
+                paths[word_id].append(product.id)
+        rank = [
+            (len(product.name), product.id) for product in catalog.products
+        ]
+        self.name_postings: List[Tuple[int, ...]] = [
+            tuple(sorted(ids, key=rank.__getitem__)) for ids in names
+        ]
+        self.path_postings: List[Tuple[int, ...]] = [
+            tuple(sorted(ids, key=rank.__getitem__)) for ids in paths
+        ]
+
+        # Биграмма -> номера слов словаря (частые биграммы отбрасываются)
+        grams: Dict[str, List[int]] = {}
+        for word_id, word in enumerate(self.words):
+            for gram in _bigrams(word):
+                grams.setdefault(gram, []).append(word_id)
+        limit = max(8, int(len(self.words) * MAX_GRAM_SHARE))
+        self.grams: Dict[str, Tuple[int, ...]] = {
+            gram: tuple(ids)
+            for gram, ids in grams.items()
+            if len(ids) <= limit
+        }
+        self.gram_counts: List[int] = [
+            len(_bigrams(word)) for word in self.words
+        ]
+
+    def _word_matches(self, token: str) -> Dict[int, float]:
+        """Слова словаря, подходящие к слову запроса: номер -> качество"""
+        matches: Dict[int, float] = {}
+
+        # Точное совпадение и префикс: слова идут подряд в словаре
+        first = bisect_left(self.words, token)
+        for word_id in range(
+            first, min(first + MAX_PREFIX_EXPANSIONS, len(self.words))
+        ):
+            word = self.words[word_id]
+            if not word.startswith(token):
+                break
+            if word == token:
+                matches[word_id] = _EXACT
+            else:
+                matches[word_id] = _PREFIX - (len(word) - len(token)) / 100
+
+        # Опечатки: общие биграммы со словами словаря (только если слово
+        # не нашлось как есть; в числах опечаток не ищем)
+        if (
+            not matches
+            and len(token) >= MIN_FUZZY_LENGTH
+            and not token.isdigit()
+        ):
+            query_grams = _bigrams(token)
+            shared: Dict[int, int] = {}
+            for gram in query_grams:
+                for word_id in self.grams.get(gram, ()):
+                    shared[word_id] = shared.get(word_id, 0) + 1
+            for word_id, common in shared.items():
+                similarity = (
+                    2 * common / (len(query_grams) + self.gram_counts[word_id])
+                )
+                if similarity >= MIN_FUZZY_SIMILARITY:
+                    matches[word_id] = _FUZZY * similarity
+        return matches
+
+    def _sources(self, matches: Dict[int, float]) -> List[_Source]:
+        """Списки продуктов для совпавших слов, лучшие совпадения первыми"""
+        sources: List[_Source] = []
+        for word_id, quality in matches.items():
+            if self.name_postings[word_id]:
+                sources.append((quality, self.name_postings[word_id]))
+            if self.path_postings[word_id]:
+                sources.append(
+                    (quality * _PATH_WEIGHT, self.path_postings[word_id])
+                )
+        sources.sort(key=lambda source: -source[0])
+        return sources
+
+    def _quality(
+        self,
+        product: Product,
+        matches: Dict[int, float]
+    ) -> float:
+        """Качество совпадения слова запроса с продуктом (0 - нет)"""
+        quality = max(
+            (matches.get(word_id, 0.0)
+             for word_id in self.product_words[product.id]),
+            default=0.0
+        )
+        path_quality = _PATH_WEIGHT * max(
+            (matches.get(word_id, 0.0)
+             for word_id in self.screen_words[product.screen_id]),
+            default=0.0
+        )
+        return max(quality, path_quality)
+
+    def search(self, query: str, limit: int = DEFAULT_LIMIT) -> List[Product]:
+        """Продукты, в названии или категории которых есть все слова запроса"""
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens or limit <= 0:
+            return []
+
+        # Совпадения ищутся по словарю; продуктов касаемся как можно меньше
+        per_token = [
+            self._sources(self._word_matches(token)) for token in tokens
+        ]
+        order = sorted(
+            range(len(tokens)),
+            key=lambda i: sum(len(ids) for _, ids in per_token[i])
+        )
+        products = self.catalog.products
+
+        if len(tokens) == 1:
+            # Одно слово: списки уже упорядочены, достаточно первых limit
+            found: List[Product] = []
+            seen: Set[int] = set()
+            for _, product_ids in per_token[0]:
+                for product_id in product_ids:
+                    if product_id not in seen:
+                        seen.add(product_id)
+                        found.append(products[product_id])
+                        if len(found) == limit:
+                            return found
+            return found
+
+        # Несколько слов: кандидаты - продукты самого редкого слова,
+        # остальные слова проверяются по словам самого продукта
+        scores: Dict[int, float] = {}
+        for quality, product_ids in per_token[order[0]]:
+            for product_id in product_ids:
+                if product_id not in scores:
+                    scores[product_id] = quality
+        others = [
+            self._word_matches(tokens[i]) for i in order[1:]
+        ]
+        ranked = []
+        for product_id, score in scores.items():
+            product = products[product_id]
+            for matches in others:
+                quality = self._quality(product, matches)
+                if not quality:
+                    break
+                score += quality
+            else:
+                ranked.append((-score, len(product.name), product_id))
+
+        # Выше - лучшее совпадение, затем короткое название, затем порядок
+        return [
+            products[product_id]
+            for _, _, product_id in heapq.nsmallest(limit, ranked)
+        ]
+
+
+@lru_cache(maxsize=4)
+def search_index(catalog: CompiledCatalog) -> SearchIndex:
+    """Поисковый индекс каталога (строится один раз на версию)"""
+    return SearchIndex(catalog)
@@ -0,0 +1,124 @@
+"""
+Bitset selection state
+Битовое множество выбранных продуктов пользователя
+
+Выбор хранится как bytearray, где бит N соответствует продукту с ID N
+скомпилированного каталога: 100 продуктов занимают 13 байт, переключение
+продукта - инверсия одного бита, а выбор на целом экране извлекается
+одной маской, так как продукты экрана идут в каталоге подряд.
+"""
+
+from typing import Iterable, Iterator, List, Optional
+
+from catalog import Screen
+
+
+class Selection:
+    """Множество ID выбранных продуктов на основе bytearray"""
+
+    __slots__ = ("_bits",)
+
+    def __init__(self, size: int = 0, bits: Optional[bytes] = None) -> None:
+        self._bits = bytearray(bits) if bits is not None else bytearray()
+        self._reserve(size)
+
+    @classmethod
+    def from_ids(cls, product_ids: Iterable[int], size: int = 0) -> "Selection":
+        """Создает выбор из набора ID продуктов"""
+        selection = cls(size)
+        for product_id in product_ids:
+            selection.add(product_id)
+        return selection
+
+    @property
+    def nbytes(self) -> int:
+        """Размер битового множества в байтах"""
+        return len(self._bits)
+
+    def _reserve(self, size: int) -> None:
+        """Расширяет буфер так, чтобы в нем помещалось size битов"""
+        missing = (size + 7) // 8 - len(self._bits)
+        if missing > 0:
+            self._bits.extend(bytes(missing))
+
+    # ------------------------------------------------------------------------
+    # Операции над одним продуктом
+    # ------------------------------------------------------------------------
+
+    def __contains__(self, product_id: int) -> bool:
+        byte = product_id >> 3
+        return byte < len(self._bits) and bool(
+            self._bits[byte] >> (product_id & 7) & 1
+        )
+
+    def add(self, product_id: int) -> None:
+        """Отмечает продукт как выбранный"""
+        self._reserve(product_id + 1)
+        self._bits[product_id >> 3] |= 1 << (product_id & 7)
+
+    def discard(self, product_id: int) -> None:
+        """Снимает отметку с продукта"""
+        byte = product_id >> 3
+        if byte < len(self._bits):
+            self._bits[byte] &= ~(1 << (product_id & 7)) & 0xFF
+
+    def toggle(self, product_id: int) -> bool:
+        """Переключает продукт; возвращает True, если он стал выбранным"""
+        self._reserve(product_id + 1)
+        self._bits[product_id >> 3] ^= 1 << (product_id & 7)
+        return product_id in self
+
+    # ------------------------------------------------------------------------
+    # Операции над экраном и всем выбором
+    # ------------------------------------------------------------------------
+
+    def screen_mask(self, screen: Screen) -> int:
+        """Маска выбора на экране: бит i - выбран i-й продукт экрана"""
+        return self.range_mask(screen.product_ids)
+
+    def range_mask(self, product_ids: range) -> int:
+        """Маска выбора диапазона ID: бит i - выбран продукт start + i"""
+        start, stop = product_ids.start, product_ids.stop
+        chunk = self._bits[start >> 3:(stop + 7) >> 3]
+        value = int.from_bytes(chunk, "little") >> (start & 7)
+        return value & ((1 << (stop - start)) - 1)
+
+    def clear(self) -> None:
+        """Снимает все отметки (размер буфера сохраняется)"""
+        self._bits[:] = bytes(len(self._bits))
+
+    def __iter__(self) -> Iterator[int]:
+        """ID выбранных продуктов по возрастанию (пустые байты пропускаются)"""
+        for byte_index, byte in enumerate(self._bits):
+            if not byte:
+                continue
+            base = byte_index << 3
+            for bit in range(8):
+                if byte >> bit & 1:
+                    yield base + bit
+
+    def __len__(self) -> int:
+        return bin(int.from_bytes(self._bits, "little")).count("1")
+
+    def __bool__(self) -> bool:
+        return any(self._bits)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Selection):
+            return NotImplemented
+        return self._bits.rstrip(b"\0") == other._bits.rstrip(b"\0")
+
+    def __repr__(self) -> str:
+        return f"Selection({list(self)!r})"
+
+    def remap(self, mapping: List[Optional[int]], size: int) -> "Selection":
+        """Переносит выбор в новый каталог по таблице старый ID -> новый"""
+        result = Selection(size)
+        for product_id in self:
+            if product_id < len(mapping) and mapping[product_id] is not None:
+                result.add(mapping[product_id])
+        return result
+
+    def to_bytes(self) -> bytes:
+        """Компактное представление для хранения (без хвостовых нулей)"""
+        return bytes(self._bits.rstrip(b"\0"))
@@ -0,0 +1,242 @@
+"""
+Session cache
+Ограниченный по памяти кеш списков покупок с вытеснением на диск
+
+Список домохозяйства живет в памяти, пока им пользуются. Списки, к
+которым не обращались дольше idle_ttl секунд, и самые давние списки при
+превышении бюджета памяти вытесняются: снимок уходит в хранилище (тот же
+компактный формат - битовое множество и ключи продуктов, см. storage.py),
+а объект удаляется из памяти. При следующем обращении список лениво
+восстанавливается из хранилища, в том числе если каталог за это время
+сменился.
+
+Список, с которым сейчас работает обработчик (занята блокировка
+домохозяйства), не вытесняется: иначе изменения попали бы в объект,
+которого уже нет в кеше.
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import (
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    MutableMapping,
+    Optional,
+    Tuple
+)
+
+from metrics import REGISTRY
+from selection import Selection
+
+logger = logging.getLogger(__name__)
+
+# Бюджет памяти на списки (в байтах); 0 - без ограничения
+DEFAULT_MEMORY_BUDGET = 32 * 1024 * 1024
+
+# Через сколько секунд без обращений список вытесняется; 0 - никогда
+DEFAULT_IDLE_TTL = 3600.0
+
+# Как часто проверять простаивающие списки (в секундах)
+DEFAULT_SWEEP_INTERVAL = 60.0
+
+# Оценка накладных расходов на один список сверх битового множества:
+# объекты Selection и bytearray, записи словарей кеша и бота
+ENTRY_OVERHEAD = 512
+
+SESSION_EVENTS = REGISTRY.counter(
+    "bot_session_cache_total",
+    "Shopping list cache lookups and evictions",
+    ("event",)
+)
+
+
+def entry_size(selection: Selection) -> int:
+    """Оценка памяти, которую занимает список в кеше (в байтах)"""
+    return ENTRY_OVERHEAD + selection.nbytes
+
+
+class SessionCache(MutableMapping[str, Selection]):
+    """Списки домохозяйств в памяти: LRU, TTL и ленивое восстановление"""
+
+    def __init__(
+        self,
+        load: Callable[[str], Optional[Selection]],
+        spill: Callable[[str, Selection], None],
+        memory_budget: int = DEFAULT_MEMORY_BUDGET,
+        idle_ttl: float = DEFAULT_IDLE_TTL,
+        sweep_interval: float = DEFAULT_SWEEP_INTERVAL,
+        busy: Callable[[str], bool] = lambda list_id: False,
+        clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        if memory_budget < 0 or idle_ttl < 0:
+            raise ValueError("Memory budget and idle TTL must be >= 0")
+        self.load = load
+        self.spill = spill
+        self.memory_budget = memory_budget
+        self.idle_ttl = idle_ttl
+        self.sweep_interval = sweep_interval
+        self.busy = busy
+        self.clock = clock
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.rehydrated = 0
+        self.evictions = 0
+        # ID списка -> список (давние первыми), время обращения и размер
+        self._entries: "OrderedDict[str, Selection]" = OrderedDict()
+        self._used: Dict[str, float] = {}
+        self._sizes: Dict[str, int] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    # ------------------------------------------------------------------------
+    # Mapping
+    # ------------------------------------------------------------------------
+
+    def _touch(self, list_id: str) -> None:
+        self._entries.move_to_end(list_id)
+        self._used[list_id] = self.clock()
+
+    def __getitem__(self, list_id: str) -> Selection:
+        selection = self._entries.get(list_id)
+        if selection is not None:
+            self.hits += 1
+            SESSION_EVENTS.inc("hit")
+            self._touch(list_id)
+            return selection
+
+        self.misses += 1
+        SESSION_EVENTS.inc("miss")
+        selection = self.load(list_id)
+        if selection is None:
+            raise KeyError(list_id)
+        self.rehydrated += 1
+        SESSION_EVENTS.inc("rehydrate")
+        self._insert(list_id, selection)
+        return selection
+
+    def __setitem__(self, list_id: str, selection: Selection) -> None:
+        self._insert(list_id, selection)
+
+    def __delitem__(self, list_id: str) -> None:
+        del self._entries[list_id]
+        del self._used[list_id]
+        self.nbytes -= self._sizes.pop(list_id)
+
+    def __iter__(self) -> Iterator[str]:
+        """Только списки в памяти (вытесненные лежат в хранилище)"""
+        return iter(list(self._entries))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, list_id: object) -> bool:
+        """Есть ли список в памяти или в хранилище"""
+        try:
+            self[list_id]
+        except KeyError:
+            return False
+        return True
+
+    def resident(self) -> List[Tuple[str, Selection]]:
+        """Списки в памяти; обращением к списку это не считается"""
+        return list(self._entries.items())
+
+    def replace(self, list_id: str, selection: Selection) -> None:
+        """Подменяет список в памяти, не меняя его место в очереди LRU"""
+        self.nbytes -= self._sizes[list_id]
+        self._entries[list_id] = selection
+        self._sizes[list_id] = entry_size(selection)
+        self.nbytes += self._sizes[list_id]
+
+    def clear(self) -> None:
+        """Забывает списки в памяти без вытеснения в хранилище"""
+        self._entries.clear()
+        self._used.clear()
+        self._sizes.clear()
+        self.nbytes = 0
+
+    # ------------------------------------------------------------------------
+    # Eviction / Вытеснение
+    # ------------------------------------------------------------------------
+
+    def _insert(self, list_id: str, selection: Selection) -> None:
+        if list_id in self._entries:
+            self.nbytes -= self._sizes[list_id]
+        self._entries[list_id] = selection
+        self._sizes[list_id] = entry_size(selection)
+        self.nbytes += self._sizes[list_id]
+        self._touch(list_id)
+        self._enforce_budget(keep=list_id)
+
+    def _evict(self, list_id: str, reason: str) -> None:
+        selection = self._entries[list_id]
+        self.spill(list_id, selection)
+        del self[list_id]
+        self.evictions += 1
+        SESSION_EVENTS.inc(f"evict_{reason}")
+
+    def _enforce_budget(self, keep: Optional[str] = None) -> None:
+        """Вытесняет давние списки, пока память не уложится в бюджет"""
+        if not self.memory_budget or self.nbytes <= self.memory_budget:
+            return
+        for list_id in list(self._entries):
+            if self.nbytes <= self.memory_budget:
+                break
+            if list_id != keep and not self.busy(list_id):
+                self._evict(list_id, "budget")
+
+    def sweep(self) -> int:
+        """Вытесняет списки, простаивающие дольше idle_ttl; их число"""
+        if not self.idle_ttl:
+            return 0
+        deadline = self.clock() - self.idle_ttl
+        evicted = 0
+        for list_id in list(self._entries):
+            if self._used[list_id] > deadline:
+                # Дальше по порядку LRU только более свежие списки
+                break
+            if not self.busy(list_id):
+                self._evict(list_id, "idle")
+                evicted += 1
+        return evicted
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики кеша для /stats"""
+        return {
+            "sessions": len(self._entries),
+            "bytes": self.nbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "rehydrated": self.rehydrated,
+            "evictions": self.evictions,
+        }
+
+    # ------------------------------------------------------------------------
+    # Background sweep / Фоновая проверка
+    # ------------------------------------------------------------------------
+
+    async def _sweep_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            evicted = self.sweep()
+            if evicted:
+                logger.info(f"Evicted {evicted} idle shopping lists")
+
+    async def start(self) -> None:
+        """Запускает периодическое вытеснение простаивающих списков"""
+        if self.idle_ttl and self.sweep_interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._sweep_loop())
+
+    async def close(self) -> None:
+        """Останавливает фоновую проверку"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,129 @@
+"""
+Cold start
+Замеры холодного старта и времени до первого ответа после пробуждения
+
+На бесплатном тарифе Render сервис засыпает без трафика, и первый клик
+после паузы ждет весь запуск процесса. Фазы запуска отмечаются по
+порядку (mark): длительность фазы - время от предыдущей отметки, первая
+фаза ("imports") отсчитывается от старта процесса, поэтому включает
+запуск интерпретатора и импорт модулей. Итоги пишутся в лог одной
+строкой и отдаются метриками:
+
+    * bot_startup_phase_seconds{phase} - длительность каждой фазы;
+    * bot_startup_ready_seconds - от старта процесса до приема запросов;
+    * bot_first_response_seconds - от старта процесса до конца обработки
+      первого обновления (то, что видит разбудивший бота пользователь);
+    * bot_first_response_target_seconds - цель для сравнения на графиках.
+"""
+
+import logging
+import os
+import time
+from typing import Dict, Optional
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Цель по времени до первого ответа после пробуждения (в секундах)
+DEFAULT_FIRST_RESPONSE_TARGET = 5.0
+
+# Первое обновление, обработанное позже этого срока после готовности,
+# не будило сервис (запуск после деплоя) и в метрику не попадает
+WAKE_WINDOW = 60.0
+
+STARTUP_PHASES = REGISTRY.gauge(
+    "bot_startup_phase_seconds",
+    "Duration of each cold start phase",
+    ("phase",)
+)
+STARTUP_READY = REGISTRY.gauge(
+    "bot_startup_ready_seconds",
+    "Time from process start until the webhook server accepted requests"
+)
+FIRST_RESPONSE = REGISTRY.gauge(
+    "bot_first_response_seconds",
+    "Time from process start until the first update was handled"
+)
+FIRST_RESPONSE_TARGET = REGISTRY.gauge(
+    "bot_first_response_target_seconds",
+    "Target for bot_first_response_seconds"
+)
+
+
+def process_started() -> float:
+    """Время старта процесса (time.time()); без /proc - время вызова"""
+    try:
+        with open("/proc/self/stat") as f:
+            # Поле 22 (starttime) - в тиках с момента загрузки системы;
+            # имя процесса в скобках может содержать пробелы
+            fields = f.read().rsplit(")", 1)[1].split()
+        ticks = int(fields[19]) / os.sysconf("SC_CLK_TCK")
+        with open("/proc/stat") as f:
+            boot_time = next(
+                int(line.split()[1]) for line in f
+                if line.startswith("btime ")
+            )
+        return boot_time + ticks
+    except (OSError, ValueError, IndexError, StopIteration):
+        return time.time()
+
+
+class StartupTimer:
+    """Отметки фаз запуска и время первого ответа"""
+
+    def __init__(
+        self,
+        started: Optional[float] = None,
+        target: float = DEFAULT_FIRST_RESPONSE_TARGET
+    ) -> None:
+        self.started = process_started() if started is None else started
+        self.target = target
+        self.phases: Dict[str, float] = {}
+        self.ready: Optional[float] = None
+        self.first_response: Optional[float] = None
+        self._last = self.started
+        FIRST_RESPONSE_TARGET.set(value=target)
+
+    def mark(self, phase: str) -> float:
+        """Завершает фазу; возвращает ее длительность"""
+        now = time.time()
+        # Часы процесса и /proc расходятся на доли тика
+        duration = max(now - self._last, 0.0)
+        self._last = now
+        self.phases[phase] = self.phases.get(phase, 0.0) + duration
+        STARTUP_PHASES.set(phase, value=self.phases[phase])
+        return duration
+
+    def mark_ready(self) -> None:
+        """Сервер принимает запросы: пишет фазы запуска в лог"""
+        self.ready = time.time() - self.started
+        STARTUP_READY.set(value=self.ready)
+        phases = ", ".join(
+            f"{phase} {duration:.3f}s"
+            for phase, duration in self.phases.items()
+        )
+        logger.info(f"Cold start: ready in {self.ready:.3f}s ({phases})")
+
+    def mark_first_response(self) -> None:
+        """Обработано первое обновление после запуска (учитывается один раз)"""
+        if self.first_response is not None:
+            return
+        self.first_response = time.time() - self.started
+        woke = (
+            self.ready is not None
+            and self.first_response - self.ready <= WAKE_WINDOW
+        )
+        if not woke:
+            logger.info("First update did not wake the service")
+            return
+        FIRST_RESPONSE.set(value=self.first_response)
+        if self.first_response > self.target:
+            logger.warning(
+                f"First response after wake took {self.first_response:.3f}s "
+                f"(target {self.target:.1f}s)"
+            )
+        else:
+            logger.info(
+                f"First response after wake: {self.first_response:.3f}s"
+            )
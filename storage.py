@@ -0,0 +1,270 @@
+"""
+Selection persistence
+Хранилище выбранных продуктов с отложенной пакетной записью
+
+Обработчики нажатий только помечают список как "грязный" (mark_dirty) -
+это запись в словарь без ввода-вывода. Фоновая задача раз в
+flush_interval секунд забирает накопленный пакет и записывает его в SQLite
+(режим WAL) в отдельном потоке, поэтому запись на диск никогда не
+добавляет задержку к button_handler.
+
+Для каждого списка (ID домохозяйства) хранится битовое множество вместе
+с версией каталога и список стабильных ключей продуктов: если каталог
+изменился между перезапусками, выбор восстанавливается по ключам.
+
+Через то же хранилище работает вытеснение списков из памяти (см.
+sessions.py): при запуске в память ничего не загружается, load_list
+поднимает списки по одному при первом обращении, учитывая и еще не
+записанные снимки. Чтение идет через отдельное
+соединение только для чтения: в режиме WAL оно не ждет записи в потоке
+хранилища. Без SELECTION_DB для вытеснения открывается временный файл
+базы, который удаляется при закрытии.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from catalog import CompiledCatalog
+from selection import Selection
+
+logger = logging.getLogger(__name__)
+
+# Интервал фоновой записи по умолчанию (в секундах)
+DEFAULT_FLUSH_INTERVAL = 2.0
+
+# Снимок выбора: (битовое множество, каталог на момент изменения)
+Snapshot = Tuple[bytes, CompiledCatalog]
+
+def _product_keys(bits: bytes, catalog: CompiledCatalog) -> List[Tuple]:
+    """Стабильные ключи выбранных продуктов"""
+    selection = Selection(len(catalog), bits)
+    return [
+        catalog.product_key(product_id)
+        for product_id in selection if product_id < len(catalog)
+    ]
+
+
+def _restore(
+    catalog: CompiledCatalog,
+    version: str,
+    bits: bytes,
+    product_keys: Iterable[Sequence]
+) -> Selection:
+    """Выбор для текущего каталога; при смене каталога - по ключам"""
+    if version == catalog.version:
+        return Selection(len(catalog), bits)
+    selection = Selection(len(catalog))
+    for key in product_keys:
+        product = catalog.product_by_key(tuple(key))
+        if product is not None:
+            selection.add(product.id)
+    return selection
+
+
+# ============================================================================
+# IN-MEMORY STORE / ХРАНИЛИЩЕ В ПАМЯТИ
+# ============================================================================
+
+class SelectionStore:
+    """Хранилище по умолчанию: состояние живет только в памяти процесса"""
+
+    def load_list(
+        self,
+        list_id: str,
+        catalog: CompiledCatalog
+    ) -> Optional[Selection]:
+        """Загружает один список; None - списка нет"""
+        return None
+
+    def mark_dirty(
+        self,
+        list_id: str,
+        selection: Selection,
+        catalog: CompiledCatalog
+    ) -> None:
+        """Помечает список для последующей записи"""
+
+    async def start(self) -> None:
+        """Запускает фоновую запись"""
+
+    async def flush(self) -> None:
+        """Немедленно записывает накопленные изменения"""
+
+    async def close(self) -> None:
+        """Записывает остаток изменений и освобождает ресурсы"""
+
+
+# ============================================================================
+# SQLITE STORE / ХРАНИЛИЩЕ SQLITE
+# ============================================================================
+
+class SQLiteSelectionStore(SelectionStore):
+    """Хранилище SQLite (WAL) с отложенной пакетной записью в потоке"""
+
+    def __init__(
+        self,
+        path: str,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL
+    ) -> None:
+        self.path = path
+        self.flush_interval = flush_interval
+        # Временная база SQLite (путь "") у каждого соединения своя, а
+        # читающему соединению нужна та же: заводим временный файл
+        self._temporary = not path
+        if self._temporary:
+            fd, path = tempfile.mkstemp(prefix="selections-", suffix=".db")
+            os.close(fd)
+        self._file = path
+        self._pending: Dict[str, Snapshot] = {}
+        # Пакет, который сейчас записывается в потоке хранилища
+        self._writing: Dict[str, Snapshot] = {}
+        self._task: Optional[asyncio.Task] = None
+        # Один поток: все обращения к соединению идут последовательно
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="selection-store"
+        )
+        # sqlite3 нужен только с SELECTION_DB: импорт не замедляет запуск
+        import sqlite3
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS lists ("
+                " list_id TEXT PRIMARY KEY,"
+                " catalog_version TEXT NOT NULL,"
+                " bits BLOB NOT NULL,"
+                " product_keys TEXT NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+        # Чтение на event loop - через свое соединение: общее с потоком
+        # записи ждало бы окончания транзакции
+        self._reader = sqlite3.connect(path)
+        self._reader.execute("PRAGMA query_only=ON")
+
+    def load_list(
+        self,
+        list_id: str,
+        catalog: CompiledCatalog
+    ) -> Optional[Selection]:
+        """Загружает один список: сначала из незаписанных снимков"""
+        snapshot = self._pending.get(list_id) or self._writing.get(list_id)
+        if snapshot is not None:
+            bits, snapshot_catalog = snapshot
+            return _restore(
+                catalog, snapshot_catalog.version, bits,
+                _product_keys(bits, snapshot_catalog)
+            )
+        row = self._reader.execute(
+            "SELECT catalog_version, bits, product_keys FROM lists "
+            "WHERE list_id = ?",
+            (list_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        version, bits, product_keys = row
+        return _restore(catalog, version, bits, json.loads(product_keys))
+
+    def mark_dirty(
+        self,
+        list_id: str,
+        selection: Selection,
+        catalog: CompiledCatalog
+    ) -> None:
+        """Запоминает снимок списка; запись произойдет при следующем flush"""
+        self._pending[list_id] = (selection.to_bytes(), catalog)
+
+    async def start(self) -> None:
+        """Запускает фоновую задачу периодической записи"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Отдает накопленный пакет на запись в поток хранилища"""
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        self._writing = batch
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self._executor, self._write_batch, batch)
+        except Exception as e:
+            logger.error(f"Failed to persist {len(batch)} lists: {e}")
+            # Возвращаем в очередь то, что не было перезаписано новыми кликами
+            for list_id, snapshot in batch.items():
+                self._pending.setdefault(list_id, snapshot)
+        finally:
+            self._writing = {}
+
+    def _write_batch(self, batch: Dict[str, Snapshot]) -> None:
+        """Записывает пакет одной транзакцией (выполняется в потоке)"""
+        now = time.time()
+        upserts = []
+        deletes = []
+        for list_id, (bits, catalog) in batch.items():
+            if not bits:
+                deletes.append((list_id,))
+                continue
+            product_keys = _product_keys(bits, catalog)
+            upserts.append((
+                list_id, catalog.version, bits,
+                json.dumps(product_keys, ensure_ascii=False), now
+            ))
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO lists "
+                "(list_id, catalog_version, bits, product_keys, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                upserts
+            )
+            self._db.executemany(
+                "DELETE FROM lists WHERE list_id = ?", deletes
+            )
+
+    async def close(self) -> None:
+        """Останавливает фоновую задачу, дописывает остаток и закрывает БД"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        self._reader.close()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._db.close)
+        self._executor.shutdown(wait=True)
+        if self._temporary:
+            for suffix in ("", "-wal", "-shm"):
+                try:
+                    os.remove(self._file + suffix)
+                except FileNotFoundError:
+                    pass
+
+
+def open_store(
+    path: Optional[str],
+    flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+    spill: bool = False
+) -> SelectionStore:
+    """Создает хранилище: SQLite, если задан путь, иначе в памяти"""
+    if path:
+        return SQLiteSelectionStore(path, flush_interval)
+    if spill:
+        # Временная база: списки не переживают перезапуск, но их можно
+        # вытеснять из памяти
+        return SQLiteSelectionStore("", flush_interval)
+    return SelectionStore()
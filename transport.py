@@ -0,0 +1,130 @@
+"""
+Bot API transport
+Настраиваемые пулы HTTP-соединений для обращений к Telegram Bot API
+
+Обращения к Bot API идут через два независимых пула:
+
+    * interactive - ответы на нажатия, правки клавиатур и команды: много
+      коротких запросов, короткие таймауты, долгий keep-alive, чтобы
+      клик после паузы не ждал нового TLS-рукопожатия;
+    * broadcast - рассылка списка покупок: очередь из множества запросов,
+      которая не должна занимать соединения интерактивного пула и может
+      дольше ждать свободное соединение.
+
+Каждый параметр пула задается переменной окружения с префиксом пула
+(например, API_POOL_SIZE, BROADCAST_API_READ_TIMEOUT). HTTP/2 требует
+установки python-telegram-bot[http2].
+
+Все клиенты используют один SSL-контекст: загрузка сертификатов занимает
+десятки миллисекунд и иначе повторялась бы для каждого клиента при
+запуске.
+"""
+
+import os
+import ssl
+from functools import lru_cache
+from typing import Mapping, NamedTuple
+
+import httpx
+
+from metrics import InstrumentedRequest
+
+HTTP_VERSIONS = ("1.1", "2")
+
+
+class PoolConfig(NamedTuple):
+    """Параметры пула соединений и таймауты его запросов (в секундах)"""
+    pool_size: int
+    # Сколько простаивающих соединений держать открытыми и сколько секунд
+    keepalive: int
+    keepalive_expiry: float
+    http_version: str
+    connect_timeout: float
+    read_timeout: float
+    write_timeout: float
+    # Сколько ждать свободное соединение, если все заняты
+    pool_timeout: float
+
+
+INTERACTIVE_POOL = PoolConfig(
+    pool_size=64,
+    keepalive=16,
+    keepalive_expiry=60.0,
+    http_version="1.1",
+    connect_timeout=5.0,
+    read_timeout=5.0,
+    write_timeout=5.0,
+    pool_timeout=1.0,
+)
+
+BROADCAST_POOL = PoolConfig(
+    pool_size=8,
+    keepalive=8,
+    keepalive_expiry=30.0,
+    http_version="1.1",
+    connect_timeout=5.0,
+    read_timeout=15.0,
+    write_timeout=10.0,
+    pool_timeout=30.0,
+)
+
+
+def validate_pool(config: PoolConfig) -> PoolConfig:
+    """Проверяет параметры пула; ValueError при ошибке"""
+    if config.pool_size < 1:
+        raise ValueError(f"Invalid pool size: {config.pool_size}")
+    if not 0 <= config.keepalive <= config.pool_size:
+        raise ValueError(f"Invalid keep-alive connections: {config.keepalive}")
+    if config.http_version not in HTTP_VERSIONS:
+        raise ValueError(f"Invalid HTTP version: {config.http_version}")
+    timeouts = (
+        config.keepalive_expiry,
+        config.connect_timeout,
+        config.read_timeout,
+        config.write_timeout,
+        config.pool_timeout,
+    )
+    if any(timeout <= 0 for timeout in timeouts):
+        raise ValueError("Timeouts must be positive")
+    return config
+
+
+def pool_config(
+    prefix: str,
+    default: PoolConfig,
+    environ: Mapping[str, str] = os.environ
+) -> PoolConfig:
+    """Параметры пула из переменных окружения PREFIX_<ПАРАМЕТР>"""
+    values = {}
+    for field, value in default._asdict().items():
+        raw = environ.get(f"{prefix}_{field.upper()}")
+        values[field] = value if raw is None else type(value)(raw)
+    return validate_pool(PoolConfig(**values))
+
+
+@lru_cache(maxsize=1)
+def ssl_context() -> ssl.SSLContext:
+    """Общий SSL-контекст с сертификатами certifi (как у httpx)"""
+    import certifi
+
+    return ssl.create_default_context(cafile=certifi.where())
+
+
+def make_request(config: PoolConfig) -> InstrumentedRequest:
+    """HTTPXRequest (с метриками) с пулом и таймаутами из config"""
+    return InstrumentedRequest(
+        connection_pool_size=config.pool_size,
+        connect_timeout=config.connect_timeout,
+        read_timeout=config.read_timeout,
+        write_timeout=config.write_timeout,
+        pool_timeout=config.pool_timeout,
+        http_version=config.http_version,
+        httpx_kwargs={
+            "verify": ssl_context(),
+            "limits": httpx.Limits(
+                max_connections=config.pool_size,
+                max_keepalive_connections=config.keepalive,
+                keepalive_expiry=config.keepalive_expiry,
+            ),
+        },
+    )
@@ -0,0 +1,297 @@
+"""
+Webhook server
+Собственный webhook-сервер на tornado (вместо Application.run_webhook)
+
+Встроенный run_webhook обслуживает единственный маршрут, поэтому сервер
+собран здесь из тех же частей (tornado, Update.de_json, update_queue):
+рядом с /webhook на том же порту отдаются метрики /metrics. Жизненный
+цикл Application (initialize -> post_init -> start -> stop -> shutdown ->
+post_shutdown) повторяет run_webhook.
+
+Тело запроса читается потоком (stream_request_body), поэтому запросы без
+правильного секретного заголовка отклоняются до чтения тела. Остальные
+проходят через Ingress (см. ingress.py) до Update.de_json. Повторы и
+обновления от чужих отправителей получают 200, чтобы Telegram не
+доставлял их снова; отброшенные из-за перегрузки - 503, и Telegram
+повторит их позже.
+
+Холодный старт: сервер начинает принимать запросы сразу после
+app.start(), а webhook регистрируется уже после этого и только если
+getWebhookInfo показывает другие настройки. Секрет в getWebhookInfo не
+виден, поэтому первый запрос с чужим секретом (секрет сменился, а
+регистрация была пропущена) один раз перерегистрирует webhook.
+"""
+
+import asyncio
+import hmac
+import json
+import logging
+import signal
+from http import HTTPStatus
+from typing import Callable, List, Optional, Sequence
+
+import tornado.web
+from tornado.httpserver import HTTPServer
+from telegram import Bot, Update, WebhookInfo
+from telegram.ext import Application, ExtBot
+
+from ingress import ACCEPTED, DUPLICATE, MALFORMED, SHED, Ingress
+from metrics import REGISTRY
+from startup import StartupTimer
+
+logger = logging.getLogger(__name__)
+
+METRICS_PATH = "/metrics"
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+# Максимальный размер тела запроса с обновлением
+MAX_UPDATE_BYTES = 1024 * 1024
+
+# Ответ на отброшенное обновление: повторять ли доставку
+_REJECTED_STATUS = {
+    SHED: HTTPStatus.SERVICE_UNAVAILABLE,
+    MALFORMED: HTTPStatus.BAD_REQUEST,
+    DUPLICATE: HTTPStatus.OK,
+}
+
+
+# ============================================================================
+# REQUEST HANDLERS / ОБРАБОТЧИКИ HTTP-ЗАПРОСОВ
+# ============================================================================
+
+@tornado.web.stream_request_body
+class WebhookHandler(tornado.web.RequestHandler):
+    """Принимает обновления от Telegram и кладет их в update_queue"""
+
+    SUPPORTED_METHODS = ("POST",)
+
+    def initialize(
+        self,
+        app: Application,
+        secret_token: Optional[str] = None,
+        ingress: Optional[Ingress] = None,
+        on_bad_secret: Optional[Callable[[], None]] = None
+    ) -> None:
+        self.app = app
+        self.secret_token = secret_token
+        self.ingress = ingress
+        self.on_bad_secret = on_bad_secret
+
+    def set_default_headers(self) -> None:
+        self.set_header("Content-Type", 'application/json; charset="utf-8"')
+
+    def prepare(self) -> None:
+        # Вызывается после заголовков, до чтения тела
+        if self.request.headers.get("Content-Type") != "application/json":
+            raise tornado.web.HTTPError(HTTPStatus.FORBIDDEN)
+        if self.secret_token is not None:
+            token = self.request.headers.get(SECRET_HEADER, "")
+            if not hmac.compare_digest(token, self.secret_token):
+                if self.on_bad_secret is not None:
+                    self.on_bad_secret()
+                raise tornado.web.HTTPError(HTTPStatus.FORBIDDEN)
+        self.request.connection.set_max_body_size(MAX_UPDATE_BYTES)
+        self._chunks: List[bytes] = []
+
+    def data_received(self, chunk: bytes) -> None:
+        self._chunks.append(chunk)
+
+    async def post(self) -> None:
+        body = b"".join(self._chunks)
+        if self.ingress is not None:
+            verdict, data = self.ingress.admit(body, json.loads)
+            if verdict != ACCEPTED:
+                # Повтор и чужой отправитель - 200: повторная доставка
+                # ничего не изменит; перегрузка - 503: Telegram повторит
+                self.set_status(_REJECTED_STATUS.get(verdict, HTTPStatus.OK))
+                return
+        else:
+            data = None
+
+        try:
+            if data is None:
+                data = json.loads(body)
+            update = Update.de_json(data, self.app.bot)
+        except Exception as e:
+            logger.error(f"Failed to parse webhook update: {e}")
+            raise tornado.web.HTTPError(
+                HTTPStatus.BAD_REQUEST, reason="Update could not be processed"
+            ) from e
+
+        if update:
+            if isinstance(self.app.bot, ExtBot):
+                self.app.bot.insert_callback_data(update)
+            await self.app.update_queue.put(update)
+        self.set_status(HTTPStatus.OK)
+
+    def log_exception(self, typ, value, tb) -> None:
+        logger.debug(f"Webhook request failed: {value}")
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    """Отдает метрики в текстовом формате Prometheus"""
+
+    SUPPORTED_METHODS = ("GET",)
+
+    async def get(self) -> None:
+        self.set_header("Content-Type", "text/plain; version=0.0.4")
+        self.write(REGISTRY.render())
+
+
+class WebhookApp(tornado.web.Application):
+    """Маршруты сервера: webhook и метрики"""
+
+    def __init__(
+        self,
+        app: Application,
+        webhook_path: str,
+        secret_token: Optional[str] = None,
+        metrics_path: str = METRICS_PATH,
+        ingress: Optional[Ingress] = None,
+        on_bad_secret: Optional[Callable[[], None]] = None
+    ) -> None:
+        super().__init__([
+            (rf"{webhook_path}/?", WebhookHandler,
+             {"app": app, "secret_token": secret_token, "ingress": ingress,
+              "on_bad_secret": on_bad_secret}),
+            (rf"{metrics_path}/?", MetricsHandler),
+        ])
+
+    def log_request(self, handler: tornado.web.RequestHandler) -> None:
+        """Логи запросов не пишем: каждый клик - это запрос"""
+
+
+# ============================================================================
+# WEBHOOK REGISTRATION / РЕГИСТРАЦИЯ WEBHOOK
+# ============================================================================
+
+class WebhookRegistration:
+    """Регистрация webhook в Telegram, пропускаемая при совпадении"""
+
+    def __init__(
+        self,
+        bot: Bot,
+        url: str,
+        allowed_updates: Optional[Sequence[str]] = None,
+        drop_pending_updates: bool = False,
+        secret_token: Optional[str] = None
+    ) -> None:
+        self.bot = bot
+        self.url = url
+        self.allowed_updates = allowed_updates
+        self.drop_pending_updates = drop_pending_updates
+        self.secret_token = secret_token
+        self._renewal: Optional[asyncio.Task] = None
+
+    def matches(self, info: WebhookInfo) -> bool:
+        """True, если зарегистрированный webhook совпадает с нужным"""
+        if self.drop_pending_updates or info.url != self.url:
+            return False
+        # None означает "оставить как есть"
+        return self.allowed_updates is None or (
+            set(info.allowed_updates or ()) == set(self.allowed_updates)
+        )
+
+    async def register(self) -> None:
+        """Регистрирует webhook безусловно"""
+        await self.bot.set_webhook(
+            url=self.url,
+            allowed_updates=self.allowed_updates,
+            drop_pending_updates=self.drop_pending_updates,
+            secret_token=self.secret_token,
+        )
+
+    async def ensure(self) -> bool:
+        """Регистрирует webhook, если он отличается; True при регистрации"""
+        if self.matches(await self.bot.get_webhook_info()):
+            logger.info("Webhook is already registered, skipping set_webhook")
+            return False
+        await self.register()
+        logger.info(f"Webhook registered: {self.url}")
+        return True
+
+    async def _renew(self) -> None:
+        try:
+            await self.register()
+            logger.warning("Webhook re-registered after a bad secret token")
+        except Exception as e:
+            logger.error(f"Failed to re-register webhook: {e}")
+
+    def renew_once(self) -> None:
+        """Перерегистрирует webhook в фоне (не больше одного раза)"""
+        if self._renewal is None:
+            self._renewal = asyncio.create_task(self._renew())
+
+
+# ============================================================================
+# SERVER LIFECYCLE / ЖИЗНЕННЫЙ ЦИКЛ СЕРВЕРА
+# ============================================================================
+
+def _stop_event() -> asyncio.Event:
+    """Событие, которое выставляется по SIGINT/SIGTERM"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows: остановка по KeyboardInterrupt
+            pass
+    return stop
+
+
+async def serve_webhook(
+    app: Application,
+    listen: str,
+    port: int,
+    webhook_path: str,
+    webhook_url: str,
+    allowed_updates: Optional[Sequence[str]] = None,
+    drop_pending_updates: bool = False,
+    secret_token: Optional[str] = None,
+    metrics_path: str = METRICS_PATH,
+    stop: Optional[asyncio.Event] = None,
+    ingress: Optional[Ingress] = None,
+    startup: Optional[StartupTimer] = None
+) -> None:
+    """Запускает бота и HTTP-сервер; работает до сигнала остановки"""
+    stop = stop or _stop_event()
+    startup = startup or StartupTimer()
+    await app.initialize()
+    startup.mark("initialize")
+    if app.post_init:
+        await app.post_init(app)
+        startup.mark("post_init")
+
+    registration = WebhookRegistration(
+        app.bot, webhook_url, allowed_updates, drop_pending_updates,
+        secret_token
+    )
+    server = HTTPServer(
+        WebhookApp(
+            app, webhook_path, secret_token, metrics_path, ingress,
+            registration.renew_once
+        )
+    )
+    try:
+        await app.start()
+        server.listen(port, address=listen)
+        startup.mark("listen")
+        startup.mark_ready()
+        logger.info(f"Webhook server listening on {listen}:{port}")
+        # Регистрация webhook - уже после открытия порта: запрос, который
+        # разбудил сервис, не ждет обращений к Bot API
+        await registration.ensure()
+        startup.mark("webhook")
+        await stop.wait()
+    finally:
+        server.stop()
+        await server.close_all_connections()
+        if app.running:
+            await app.stop()
+            if app.post_stop:
+                await app.post_stop(app)
+        await app.shutdown()
+        if app.post_shutdown:
+            await app.post_shutdown(app)